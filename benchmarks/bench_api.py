@@ -0,0 +1,111 @@
+"""
+End to end benchmark of the client against the offline fake API (benchmarks.fake_api)
+
+    python -m benchmarks.bench_api
+    python -m benchmarks.bench_api --scenarios dns sweep --zones 50 --latency 0.05 --error-rate 0.01
+    python -m benchmarks.bench_api --replay recorded.json --scenarios overview
+
+Every scenario is run --repeat times for the throughput and the latency
+percentiles, then once more under tracemalloc for the peak memory
+"""
+import argparse
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from cfmetrics import Auth, Config, MemoryCache, Scheduler
+from benchmarks.fake_api import fake_cloudflare
+
+SCENARIOS = ("dns", "overview", "traffics", "web_analytics", "sweep")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def scenario(name, cf, zone_ids, days, workers):
+    """
+    The function to time and how many API methods one call of it runs
+    """
+
+    account = cf.Account("account-1")
+    zone = account.Zone(zone_ids[0])
+    end = datetime.utcnow()
+    start = end - timedelta(days=days)
+    window = (start.strftime("%Y-%m-%dT%H:%M:%SZ"), end.strftime("%Y-%m-%dT%H:%M:%SZ"))
+    dates = (start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+
+    if name == "dns":
+        return zone.get_dns_records, 1
+    if name == "overview":
+        return lambda: zone.get_overview(*dates), 1
+    if name == "traffics":
+        return lambda: zone.get_traffics(*window), 1
+    if name == "web_analytics":
+        return lambda: zone.get_web_analytics(*window), 1
+
+    def sweep():
+        # what a collector does every round: the overview of every zone in batches,
+        # then the series of every zone on a pool of workers
+        account.get_overviews(zone_ids, *dates)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda zone_id: account.Zone(zone_id).get_traffics(*window), zone_ids))
+
+    return sweep, len(zone_ids) + 1
+
+
+def measure(func, repeat):
+    took = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        took.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return took, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the client against an offline fake Cloudflare API")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--zones", type=int, default=20, help="zones of the sweep scenario")
+    parser.add_argument("--hosts", type=int, default=20, help="hosts with traffic in every zone")
+    parser.add_argument("--records", type=int, default=0, help="other DNS records of every zone")
+    parser.add_argument("--days", type=int, default=7, help="window of the queries")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake API waits before every answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of the answers that are a 503")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--replay", help="JSON file of recorded answers to serve instead of the synthesized ones")
+    parser.add_argument("--cache", action="store_true", help="keep the DNS records and plan cached between calls")
+    args = parser.parse_args()
+
+    server = fake_cloudflare(args.hosts, args.records, args.latency, args.error_rate, args.replay)
+    cf = Auth("key", "me@example.com", config=Config(server.url), pool_size=args.workers, max_inflight=args.workers,
+              cache=MemoryCache(ttl=300 if args.cache else 0), scheduler=Scheduler(rest_rate=1000, graphql_rate=1000, backoff=0.01))
+    zone_ids = [f"zone-{n}" for n in range(args.zones)]
+
+    print(f"{'scenario':>14} {'calls/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'peak MB':>8} {'requests':>9}")
+    try:
+        for name in args.scenarios:
+            func, calls = scenario(name, cf, zone_ids, args.days, args.workers)
+            func()  # warm up the connections
+            sent = len(server.requests)
+            took, peak = measure(func, args.repeat)
+            requests = (len(server.requests) - sent) / (args.repeat + 1)
+            print(f"{name:>14} {calls * len(took) / sum(took):>9.1f} {percentile(took, 50) * 1000:>9.1f} "
+                  f"{percentile(took, 90) * 1000:>9.1f} {percentile(took, 99) * 1000:>9.1f} {peak:>8.1f} {requests:>9.1f}")
+    finally:
+        cf.close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+pytest-benchmark cases, they are not collected by the normal test run
+
+    python -m pytest benchmarks/bench_cases.py --benchmark-only
+    python -m pytest benchmarks/bench_cases.py --benchmark-only --benchmark-json=bench.json
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from cfmetrics import Auth, Config, MemoryCache, Scheduler, data_format
+from benchmarks.bench_model import synthetic_series
+from benchmarks.fake_api import fake_cloudflare
+from tests.stub_server import overview_rows
+
+pytest.importorskip("pytest_benchmark")
+
+ZONES = [f"zone-{n}" for n in range(20)]
+
+
+@pytest.fixture(scope="module")
+def cf():
+    server = fake_cloudflare(hosts=50, records=20000)
+    auth = Auth("key", "me@example.com", config=Config(server.url), pool_size=8, max_inflight=8,
+                cache=MemoryCache(ttl=0), scheduler=Scheduler(rest_rate=10000, graphql_rate=10000))
+    yield auth
+    auth.close()
+    server.stop()
+
+
+def window(days):
+    end = datetime.utcnow()
+    return (end - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%SZ"), end.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+@pytest.mark.parametrize("rows", [10000, 100000])
+def test_model(benchmark, rows):
+    response = synthetic_series(rows, 300)
+    benchmark(data_format.model, response, "traffic")
+
+
+def test_overview_format(benchmark):
+    start = datetime(2024, 1, 1)
+    rows = overview_rows(start, start + timedelta(days=366))
+    payload = {"data": {"viewer": {"zones": [{"totals": [{"uniq": {"uniques": 1}}], "zones": rows}]}}}
+    benchmark(data_format.overview, payload)
+
+
+def test_dns_fetch(benchmark, cf):
+    # 20,051 records over 5 pages of 5000
+    zone = cf.Account("account-1").Zone("zone-1")
+    records = benchmark(zone.get_dns_records)
+    assert len(records) == 51
+
+
+def test_get_traffics(benchmark, cf):
+    zone = cf.Account("account-1").Zone("zone-1")
+    benchmark(zone.get_traffics, *window(7))
+
+
+def test_multi_zone_sweep(benchmark, cf):
+    account = cf.Account("account-1")
+    start, end = window(7)
+
+    def sweep():
+        account.get_overviews(ZONES, start[:10], end[:10])
+        for zone_id in ZONES:
+            account.Zone(zone_id).get_web_analytics(start, end)
+
+    benchmark.pedantic(sweep, rounds=3, iterations=1)
@@ -0,0 +1,105 @@
+"""
+Benchmark data_format.model with synthetic httpRequestsAdaptiveGroups series
+
+    python -m benchmarks.bench_model
+    python -m benchmarks.bench_model --rows 10000 100000 --hosts 500 --legacy
+"""
+import argparse
+import time
+from datetime import date, timedelta
+
+from cfmetrics import data_format, columnar
+
+
+class FakeResponse:
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+def synthetic_series(rows, hosts, dataSource="traffic"):
+    days = max(1, rows // hosts)
+    start = date(2025, 1, 1)
+    series = []
+    for i in range(rows):
+        item = {
+            "count": i,
+            "avg": {"sampleInterval": 1},
+            "sum": {"visits": i, "edgeResponseBytes": i * 10},
+            "dimensions": {
+                "host": f"host{i % hosts}.example.com",
+                "ts": (start + timedelta(days=(i // hosts) % days)).isoformat()
+            }
+        }
+        series.append(item)
+
+    scope = "zones" if dataSource == "traffic" else "accounts"
+    return FakeResponse({"data": {"viewer": {scope: [{"series": series}]}}})
+
+
+def legacy_model(dataResult, dataSource):
+    # the list scanning version that data_format.model replaced, kept for comparison
+    dataCompiled = {"by_date":{"date_lists": [], "dates": []},
+                    "by_domain": {"domain_lists": [], "domains": []}}
+
+    for item in data_format._series(dataResult, dataSource):
+        metricsData = {
+            "page_views": item["count"],
+            "requests": item["sum"]["visits"],
+            "data_transfer_bytes": item["sum"]["edgeResponseBytes"],
+        }
+        ts = item["dimensions"]["ts"]
+        domainName = item["dimensions"]["host"]
+
+        if ts not in dataCompiled["by_date"]["date_lists"]:
+            dataCompiled["by_date"]["dates"].append({"date": ts, "domains": [], "domain_lists": []})
+            dataCompiled["by_date"]["date_lists"].append(ts)
+        currDateIndex = dataCompiled["by_date"]["date_lists"].index(ts)
+        if domainName not in dataCompiled["by_date"]["dates"][currDateIndex]["domain_lists"]:
+            dataCompiled["by_date"]["dates"][currDateIndex]["domain_lists"].append(domainName)
+            dataCompiled["by_date"]["dates"][currDateIndex]["domains"].append({"name": domainName, "metrics": metricsData})
+
+        if domainName not in dataCompiled["by_domain"]["domain_lists"]:
+            dataCompiled["by_domain"]["domains"].append({"name": domainName, "dates": [], "date_lists": []})
+            dataCompiled["by_domain"]["domain_lists"].append(domainName)
+        currDomainIndex = dataCompiled["by_domain"]["domain_lists"].index(domainName)
+        if ts not in dataCompiled["by_domain"]["domains"][currDomainIndex]["date_lists"]:
+            dataCompiled["by_domain"]["domains"][currDomainIndex]["date_lists"].append(ts)
+            dataCompiled["by_domain"]["domains"][currDomainIndex]["dates"].append({"date": ts, "metrics": metricsData})
+
+    return dataCompiled
+
+
+def timed(func, response):
+    start = time.perf_counter()
+    func(response, "traffic")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark data_format.model")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--hosts", type=int, default=300)
+    parser.add_argument("--legacy", action="store_true", help="also time the old list scanning model (slow)")
+    parser.add_argument("--legacy-max-rows", type=int, default=100000)
+    parser.add_argument("--columnar", action="store_true", help="also time format=\"columnar\" with its totals by date (needs numpy)")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'model s':>10} {'rows/s':>12} {'legacy s':>10} {'columnar s':>11}")
+    for rows in args.rows:
+        response = synthetic_series(rows, args.hosts)
+        took = timed(data_format.model, response)
+        legacy = "-"
+        if args.legacy and rows <= args.legacy_max_rows:
+            legacy = f"{timed(legacy_model, response):.3f}"
+        columnarTook = "-"
+        if args.columnar:
+            columnarTook = f"{timed(lambda r, s: columnar.Series.from_result(r, s).group_by_date(), response):.3f}"
+        print(f"{rows:>10} {took:>10.3f} {rows / took:>12.0f} {legacy:>10} {columnarTook:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Peak memory of parsing a GraphQL series answer in one go versus streaming it
+
+    python -m benchmarks.bench_stream
+    python -m benchmarks.bench_stream --rows 10000 100000 --hosts 500
+
+The body is built before the measure starts, like a socket buffer, so the peak
+is what json.loads + model or stream_series + model_items allocate
+"""
+import argparse
+import io
+import json
+import time
+import tracemalloc
+
+from cfmetrics import data_format
+from benchmarks.bench_model import synthetic_series
+
+
+class FakeStreamResponse:
+    """
+    Enough of a requests.Response sent with stream=True
+    """
+
+    def __init__(self, body: bytes):
+        self.raw = io.BytesIO(body)
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    took = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return took, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark streaming the GraphQL answer")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 300000])
+    parser.add_argument("--hosts", type=int, default=300)
+    args = parser.parse_args()
+
+    if data_format.ijson is None:
+        print("ijson is not installed, stream_series falls back to json.loads")
+
+    print(f"{'rows':>10} {'body MB':>8} {'loads s':>8} {'loads MB':>9} {'stream s':>9} {'stream MB':>10}")
+    for rows in args.rows:
+        body = json.dumps(synthetic_series(rows, args.hosts).payload).encode()
+
+        loaded = measure(lambda: data_format.model(FakeStreamResponse(body).json(), "traffic"))
+        streamed = measure(lambda: data_format.model_items(data_format.stream_series(FakeStreamResponse(body), "traffic"), "traffic"))
+
+        print(f"{rows:>10} {len(body) / 1024 / 1024:>8.1f} {loaded[0]:>8.2f} {loaded[1]:>9.1f} {streamed[0]:>9.2f} {streamed[1]:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Offline stand in for api.cloudflare.com to benchmark against
+
+The answers come from tests.stub_server (synthesized from the query window) or
+are replayed from a JSON file of recorded answers, keyed by "METHOD path regex":
+
+    {
+        "GET /zones/[^/]+": {"success": true, "result": {"plan": {"name": "Business Website"}}},
+        "GET /zones/[^/]+/dns_records": {"success": true, "result": [...]},
+        "POST /graphql": {"data": {...}, "errors": null}
+    }
+"""
+import json
+
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+
+def fake_cloudflare(hosts: int = 20, records: int = 0, latency: float = 0, error_rate: float = 0, replay: str = None, seed=0):
+    """
+    A started server, hosts is how many hosts have traffic (and A records),
+    records how many other DNS records the zones have
+    """
+
+    server = StubServer(latency=latency, error_rate=error_rate, seed=seed)
+    if replay:
+        with open(replay) as f:
+            recorded = json.load(f)
+        for key, payload in recorded.items():
+            method, path = key.split(" ", 1)
+            server.route(method, path, lambda url, params, body, payload=payload: (200, payload))
+    else:
+        add_cloudflare_routes(server, hosts=tuple(f"host{n}.example.com" for n in range(hosts)), extra_records=records)
+
+    return server.start()
@@ -1,20 +1,20 @@
-import os
-import requests
-from datetime import datetime, timedelta
-from cfmetrics import query, data_format
-
-class Config:
-
-    def __init__(self):
-        self.cf_graphql_url="https://api.cloudflare.com/client/v4/graphql"
-        self.cf_api_url="https://api.cloudflare.com/client/v4"
-
-    def get_url(self):
-        return self.cf_graphql_url, self.cf_api_url
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from cfmetrics import query, data_format, columnar, dns
+from cfmetrics.transport import Config, Transport, RateLimitError, check_response, check_status
+from cfmetrics.scheduler import Scheduler, TokenBucket
+from cfmetrics.cache import MemoryCache, SqliteCache, ResponseCache
+from cfmetrics.instrument import Instrumentation, Stats
+from cfmetrics import state as incremental
+from cfmetrics.state import StateStore
+from cfmetrics.store import MetricStore
+from cfmetrics.dimensions import DimensionMap, overview_maps
+from cfmetrics import planner
+from cfmetrics.planner import DatasetUnavailable
 
 class Auth:
 
-    def __init__(self, api_key: str, api_key_email: str):
+    def __init__(self, api_key: str, api_key_email: str, config: Config = None, pool_size: int = 10, keep_alive: bool = True, timeout: float = 60, max_inflight: int = 4, cache=None, scheduler: Scheduler = None, instrumentation: Instrumentation = None, response_cache=None):
         if not api_key or not api_key_email:
             raise ValueError("Cloudflare Account ID, Zone ID, API Key, API Key Email is required")
 
@@ -24,32 +24,560 @@ class Auth:
                 "Authorization": f"Bearer {self.api_key}",
                 "X-AUTH-EMAIL": self.api_key_email
         }
+        self.transport = Transport(config, pool_size=pool_size, keep_alive=keep_alive, timeout=timeout, max_inflight=max_inflight, scheduler=scheduler, instrumentation=instrumentation, response_cache=response_cache)
+        self.instrumentation = self.transport.instrumentation
+        self.cache = cache if cache is not None else MemoryCache()
 
     def Account(self, account_id: str):
-        return Account(self.api_key, self.api_key_email, account_id)
+        return Account(self.api_key, self.api_key_email, account_id, transport=self.transport, cache=self.cache)
+
+    def close(self):
+        self.transport.close()
+
+
+# the most zones the /zones listing gives in one page
+ZONES_PAGE_SIZE = 50
+
+EXECUTORS = ("thread", "process")
+
+
+# the dataset behind get_traffics and get_web_analytics and how far back they go by default
+SERIES = {"traffic": ("httpRequestsAdaptiveGroups", 2764000), "rum": ("rumPageloadEventsAdaptiveGroups", 2764800)}
+
+
+class _Steps:
+    """
+    What Account and Zone do around their requests, shared with AsyncAccount
+    and AsyncZone: plan the windows and batches to send, then check, merge and
+    cache what came back. Every step gets the answers already fetched, only the
+    requests are made by the sync and the async clients
+    """
+
+    def _cached(self, cacheKey):
+        return self.cache.get(cacheKey) if self.cache is not None else None
+
+    def _remember(self, cacheKey, value, ttl=None):
+        if self.cache is not None:
+            self.cache.set(cacheKey, value, ttl)
+        return value
+
+    @staticmethod
+    def _page(response):
+        # the records and the result_info of a page of a REST listing
+        check_status(response)
+        dataResult = response.json()
+        return dataResult.get("result", []), dataResult.get("result_info") or {}
+
+    def _keep_plan(self, response):
+        check_status(response)
+        zone_info = response.json().get("result", {})
+        return self._remember(f"{self.zone_id}:plan", zone_info.get("plan", {}).get("name", "Unknown"))
+
+    def _keep_zones(self, zones):
+        """
+        The plan of every zone goes in the metadata cache, so get_traffics doesn't
+        have to ask for it again, and the list too, get_web_analytics needs it on every call
+        """
+
+        for zone in zones:
+            plan_name = (zone.get("plan") or {}).get("name")
+            if plan_name:
+                self._remember(f"{zone['id']}:plan", plan_name)
+        self._remember(f"{self.account_id}:zones", list(zones))
+        return zones
+
+    def _capability_batches(self, zone_ids: list, batch_size: int):
+        """
+        The capabilities in the metadata cache and the batches of the zones that
+        are not there yet, returns (found, missing, batches)
+        """
 
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
 
-class Account:
+        found = {}
+        for zone_id in dict.fromkeys(zone_ids):
+            cached = self._cached(f"{zone_id}:capabilities")
+            if cached is not None:
+                found[zone_id] = cached
+        missing = [zone_id for zone_id in dict.fromkeys(zone_ids) if zone_id not in found]
+        return found, missing, [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
 
-    def __init__(self, api_key: str, api_key_email: str, account_id: str):
+    @staticmethod
+    def _probed_capabilities(dataResult, batch: list):
+        viewer = dataResult["data"]["viewer"]
+        return {zone_id: planner.capabilities(viewer[query.zone_alias(i)][0]["settings"])
+                for i, zone_id in enumerate(batch) if viewer.get(query.zone_alias(i))}
+
+    def _keep_capabilities(self, zone_ids: list, found: dict, probed: dict, guessed: dict):
+        """
+        The probed capabilities are kept for planner.CAPABILITIES_TTL, the ones
+        guessed from the plan (not probed) without ttl like Zone.capabilities does
+        """
+
+        for zone_id, capabilities in probed.items():
+            found[zone_id] = self._remember(f"{zone_id}:capabilities", capabilities, planner.CAPABILITIES_TTL)
+        for zone_id, capabilities in guessed.items():
+            found[zone_id] = self._remember(f"{zone_id}:capabilities", capabilities)
+        return {zone_id: found[zone_id] for zone_id in dict.fromkeys(zone_ids)}
+
+    def _series_windows(self, start, end, alias, format, max_duration):
+        """
+        The windows to send instead of the whole one, known before anything is
+        sent: a window longer than max_duration (the maxDuration of the dataset)
+        is cut, Cloudflare would refuse it, and with a response cache it is cut
+        where the sealed days end, so asking the same range again only sends the
+        open tail. None when the window goes in one request
+        """
+
+        # the overview answers have totals which can't be added across windows
+        if alias != "series":
+            return None
+        windows = query.duration_windows(start, end, max_duration, format)
+        if self.transport.response_cache is not None:
+            windows = [part for window in windows or [(start, end)] for part in query.seal_split(*window, format) or [window]]
+        return windows if windows and len(windows) > 1 else None
+
+    @staticmethod
+    def _rows(dataResult, scope, alias="series"):
+        return dataResult["data"]["viewer"][scope][0][alias]
+
+    @staticmethod
+    def _series_answer(scope, alias, rows):
+        return {"data": {"viewer": {scope: [{alias: rows}]}}}
+
+    @staticmethod
+    def _halves(start, end, count, format=query.DATETIME_FORMAT):
+        # an answer that hit query.ROW_LIMIT is missing rows, its window is split
+        return query.split_window(start, end, format) if count >= query.ROW_LIMIT else None
+
+    def _split_answers(self, answers, format, collected: dict):
+        """
+        Keep the rows of every (window, rows) answer in collected, the halves of
+        the windows that hit the row limit are returned to be fetched
+        """
+
+        pending = []
+        for window, windowRows in answers:
+            halves = self._halves(*window, len(windowRows), format)
+            if halves:
+                pending.extend(halves)
+            else:
+                collected[window] = windowRows
+        return pending
+
+    def _merge_windows(self, collected: dict):
+        rows = [item for window in sorted(collected) for item in collected[window]]
+        with self.transport.instrumentation.span("merge", "series", rows=len(rows), windows=len(collected)):
+            return data_format.merge_series(rows)
+
+    def _series_plan(self, found: dict, dataSource: str, start: str, end: str, format: str, status: bool = False):
+        """
+        The checked window of get_traffics or get_web_analytics, it starts at the
+        retention of the dataset in found (capabilities) when it is not given
+        returns (start, end, formatter, max_duration)
+        """
+
+        dataset, seconds = SERIES[dataSource]
+        start, end = query.default_window(start, end, seconds, retention=planner.retention(found, dataset))
+        if dataSource == "traffic":
+            query.check_traffic_window(start)
+            owner = f"Zone ID {self.zone_id}"
+        else:
+            query.check_datetime(start)
+            owner = f"Account ID {self.account_id}"
+        formatter = self.transport.instrumentation.formatter(columnar.formatter(format, dataSource, status), dataSource)
+        capability, start = planner.check_window(found, dataset, start, owner)
+        return start, end, formatter, planner.max_duration(capability)
+
+    @staticmethod
+    def _streamed(stream: bool, start: str, end: str, max_duration):
+        # a window that has to be cut first is not streamed
+        return stream and not query.duration_windows(start, end, max_duration)
+
+    @staticmethod
+    def _host_plan(builder, names, dataSource: str, formatter):
+        """
+        The queries of the hosts in names, long host lists are sharded over several
+        requests and a zone query for most of the zone goes without host filter,
+        see query.host_shards. returns (scope, builds, formatter) where formatter
+        drops the hosts that were not asked for
+        """
+
+        scope = "zones" if dataSource == "traffic" else "accounts"
+        shards, keep = query.host_shards(names, scope)
+        if keep is not None:
+            format = formatter
+            formatter = lambda items: format(item for item in items if item["dimensions"]["host"] in keep)
+
+        return scope, [lambda start, end, hosts=hosts: builder(hosts, start, end) for hosts in shards], formatter
+
+    @staticmethod
+    def _shard_rows(items, keep, dataSource: str, status: bool = False):
+        # the flat rows of the items of a host shard, with status they are folded first
+        if keep is not None:
+            items = (item for item in items if item["dimensions"]["host"] in keep)
+        if status:
+            items = data_format.fold_status(items)
+        return data_format.flat_rows(items, dataSource)
+
+    def _overview_plan(self, capabilities: dict, start_date: str, end_date: str, resolution: str):
+        """
+        The dataset of get_overview and its checked window, see query.overview_dataset
+        returns (dataset, start, end, format)
+        """
+
+        start_date, end_date = query.default_window(start_date, end_date, 2764800, query.DATE_FORMAT, planner.retention(capabilities, "httpRequests1dGroups"))
+        dataset = query.overview_dataset(resolution, start_date, capabilities=capabilities)
+        start, end = query.overview_window(dataset, start_date, end_date)
+        format = query.DATE_FORMAT if dataset == "1d" else query.DATETIME_FORMAT
+        name = query.OVERVIEW_DATASETS[dataset][0]
+        planner.check_duration(capabilities.get(name), name, start, end, format, f"Zone ID {self.zone_id}")
+        return dataset, start, end, format
+
+    def _format_overview(self, dataResult, dataset: str, resolution: str):
+        with self.transport.instrumentation.span("format", "overview", rows=len(self._rows(dataResult, "zones", "zones"))):
+            dataCompiled = data_format.overview(dataResult)
+            if resolution != dataset and isinstance(dataCompiled, dict):
+                dataCompiled = data_format.rollup_overview(dataCompiled, resolution)
+            return dataCompiled
+
+    @staticmethod
+    def _overview_batches(zone_ids: list, start_date: str, end_date: str, batch_size: int):
+        # returns (start_date, end_date, zone_ids, batches) of get_overviews
+        start_date, end_date = query.default_window(start_date, end_date, 2764800, query.DATE_FORMAT)
+        query.check_datetime(start_date, "%Y-%m-%d", "YYYY-MM-DD")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        zone_ids = list(dict.fromkeys(zone_ids))
+        return start_date, end_date, zone_ids, [zone_ids[i:i + batch_size] for i in range(0, len(zone_ids), batch_size)]
+
+    def _format_overviews(self, dataResult, batch: list):
+        with self.transport.instrumentation.span("format", "overviews", zones=len(batch)):
+            return data_format.overviews(dataResult, batch)
+
+    @staticmethod
+    def _truncated_overviews(dataCompiled: dict):
+        # a zone that hit the row limit is fetched alone so its window can be split
+        return [zone_id for zone_id, overview in dataCompiled.items() if isinstance(overview, dict) and len(overview["by_date"]["dates"]) >= query.ROW_LIMIT]
+
+    @staticmethod
+    def _zone_index(zones: list, zone_ids: list = None):
+        if zone_ids is not None:
+            wanted = set(zone_ids)
+            zones = [zone for zone in zones if zone["id"] in wanted]
+        return dns.zone_index(zones)
+
+    @staticmethod
+    def _partition_rum(dataResult, index: dict, zone_ids: list, records: dict, formatter):
+        """
+        The account RUM answer split by zone, records is {zone_id: dns records} to
+        keep only the A and CNAME names of every zone, None to keep every host
+        """
+
+        hosts = None
+        if records is not None:
+            hosts = {zone_id: set(query.compact_hosts(record["name"] for record in zoneRecords)) for zone_id, zoneRecords in records.items()}
+
+        partitioned = dns.partition(data_format._series(dataResult, "rum"), index, zone_ids, hosts)
+        return {zone_id: formatter(items) for zone_id, items in partitioned.items()}
+
+    @staticmethod
+    def _collect_plan(datasets, workers: int, executor: str, state, store):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor}, expected one of {', '.join(EXECUTORS)}")
+        if workers is not None and workers < 1:
+            raise ValueError("workers must be at least 1")
+        if executor == "process" and (state is not None or store is not None):
+            raise ValueError("state and store can only be used with executor=\"thread\"")
+        datasets = tuple(datasets)
+        for dataset in datasets:
+            if dataset not in incremental.DATASETS:
+                raise ValueError(f"Unknown dataset {dataset}, expected one of {', '.join(incremental.DATASETS)}")
+        return datasets
+
+    def _worker_pool(self, workers: int):
+        # every process has its own connection and an equal share of the rate limits
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(
+            self.api_key, self.api_key_email, self.account_id, self.transport.config, self.transport.scheduler.settings(workers)
+        ))
+
+    def _collect_window(self, dataset: str, state: StateStore, found: dict, overlap: timedelta = None, status: bool = False):
+        """
+        The window after the watermark that Zone.collect asks for and the options
+        of the get_ method, returns (start, end, options)
+        """
+
+        watermark = state.get_watermark(self.zone_id, dataset)
+        start, end = incremental.next_window(dataset, watermark, overlap, retention=planner.retention(found, planner.COLLECTED[dataset]))
+        return start, end, {"status": True} if status and dataset == "traffics" else {}
+
+    def _collected(self, dataset: str, state: StateStore, store: MetricStore, start: str, end: str, latest):
+        if not isinstance(latest, dict):
+            # the watermark stays where it was, the next call asks for this window again
+            raise ValueError(f"Zone ID {self.zone_id} got no usable {dataset} for {start} to {end}: {latest}")
+
+        if store is not None:
+            store.write(self.zone_id, dataset, latest)
+        state.set_watermark(self.zone_id, dataset, end)
+        return latest
+
+
+class _GraphQLClient(_Steps):
+    """
+    The GraphQL part shared by Account and Zone, they set transport and headers
+    """
+
+    def _graphql(self, queryBody):
+        responseCache = self.transport.response_cache
+        dataResult = responseCache.get(queryBody) if responseCache is not None else None
+        if dataResult is not None:
+            return dataResult
+
+        response = self.transport.post(self.cf_graphql_url, headers=self.headers, json=queryBody)
+        with self.transport.instrumentation.span("decode", "graphql"):
+            dataResult = check_response(response)
+        if responseCache is not None:
+            responseCache.set(queryBody, dataResult)
+        return dataResult
+
+    def _fetch_series(self, build, start, end, scope, alias="series", format=query.DATETIME_FORMAT, max_duration=None):
+        """
+        Post the query built for the window, when the answer hits query.ROW_LIMIT
+        the window is split and the halves are fetched again in parallel until
+        every sub window fits, then the rows are merged back into one answer
+        A window that _series_windows cuts is sent in parts from the start
+        """
+
+        windows = self._series_windows(start, end, alias, format, max_duration)
+        if windows:
+            return self._series_answer(scope, alias, self._fetch_rows(build, windows, scope, alias, format))
+
+        dataResult = self._graphql(build(start, end))
+        windows = self._halves(start, end, len(self._rows(dataResult, scope, alias)), format)
+        if windows:
+            dataResult["data"]["viewer"][scope][0][alias] = self._fetch_rows(build, windows, scope, alias, format)
+
+        return dataResult
+
+    def _settings(self, queryBody, scope):
+        # the settings of the first zone or account of the answer
+        return self._graphql(queryBody)["data"]["viewer"][scope][0]["settings"]
+
+    def account_capabilities(self):
+        """
+        What the account can query (rumPageloadEventsAdaptiveGroups), like
+        Zone.capabilities. When the settings can't be read it is {} and
+        Cloudflare decides, the web analytics are there with any plan
+        """
+
+        cacheKey = f"{self.account_id}:capabilities"
+        found = self._cached(cacheKey)
+        if found is not None:
+            return found
+
+        try:
+            found, ttl = planner.capabilities(self._settings(query.query_account_settings(self.account_id), "accounts")), planner.CAPABILITIES_TTL
+        except planner.SETTINGS_ERRORS:
+            found, ttl = {}, None
+        return self._remember(cacheKey, found, ttl)
+
+    def _fetch_rows(self, build, pending, scope, alias="series", format=query.DATETIME_FORMAT):
+        collected = {}
+        fetch = lambda window: self._rows(self._graphql(build(*window)), scope, alias)
+        with ThreadPoolExecutor(max_workers=self.transport.max_inflight) as executor:
+            while pending:
+                pending = self._split_answers(zip(pending, executor.map(fetch, pending)), format, collected)
+
+        return self._merge_windows(collected)
+
+
+class Account(_GraphQLClient):
+
+    def __init__(self, api_key: str, api_key_email: str, account_id: str, transport: Transport = None, cache=None):
         if not api_key or not api_key_email or not account_id:
             raise ValueError("Cloudflare API Key, Email API Key and Account ID is required")
 
         self.api_key=api_key
         self.api_key_email=api_key
         self.account_id=account_id
-        self.cf_graphql_url, self.cf_api_url = Config().get_url()
+        self.transport = transport or Transport()
+        self.cache = cache
+        self.cf_graphql_url, self.cf_api_url = self.transport.config.get_url()
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "X-AUTH-EMAIL": self.api_key_email
         }
 
     def Zone(self, zone_id: str):
-        return Zone(self.api_key, self.api_key_email, self.account_id, zone_id)
+        return Zone(self.api_key, self.api_key_email, self.account_id, zone_id, transport=self.transport, cache=self.cache)
+
+    def _zones_page(self, page: int):
+        url = f"{self.cf_api_url}/zones"
+        return self._page(self.transport.get(url, headers=self.headers, params={"account.id": self.account_id, "page": page, "per_page": ZONES_PAGE_SIZE}))
+
+    def zones(self):
+        """
+        Every zone of the account (id, name, status, plan, ...), the pages after
+        the first one are fetched in parallel. The plan of every zone goes in the
+        metadata cache, so get_traffics doesn't have to ask for it again. The list
+        itself is kept in the metadata cache too, get_web_analytics needs it on every call
+        """
 
-class Zone:
+        zones = self._cached(f"{self.account_id}:zones")
+        if zones is not None:
+            return list(zones)
 
-    def __init__(self, api_key: str, api_key_email: str, account_id: str, zone_id: str):
+        zones, info = self._zones_page(1)
+        pages = range(2, dns.total_pages(info) + 1)
+        if pages:
+            with ThreadPoolExecutor(max_workers=self.transport.max_inflight) as executor:
+                for result, _ in executor.map(self._zones_page, pages):
+                    zones.extend(result)
+
+        return self._keep_zones(zones)
+
+    def zone_capabilities(self, zone_ids: list, batch_size: int = query.OVERVIEW_BATCH_SIZE):
+        """
+        Zone.capabilities for many zones, the zones not in the metadata cache yet
+        are probed batch_size at a time in one request each, so a sweep over the
+        account asks once instead of once per zone
+        returns {zone_id: capabilities}
+        """
+
+        found, missing, batches = self._capability_batches(zone_ids, batch_size)
+
+        def fetch(batch):
+            try:
+                return self._probed_capabilities(self._graphql(query.query_zones_settings(batch)), batch)
+            except planner.SETTINGS_ERRORS:
+                return {}
+
+        probed = {}
+        with ThreadPoolExecutor(max_workers=self.transport.max_inflight) as executor:
+            for result in executor.map(fetch, batches):
+                probed.update(result)
+
+        # not probed, guessed from the plan like Zone.capabilities does
+        guessed = {zone_id: self.Zone(zone_id)._plan_capabilities() for zone_id in missing if zone_id not in probed}
+        return self._keep_capabilities(zone_ids, found, probed, guessed)
+
+    def get_web_analytics(self, start_date: str = None, end_date: str = None, zone_ids: list = None, format: str = "dict", dns_hosts: bool = False):
+        """
+        Zone.get_web_analytics of every zone (or of zone_ids) with one RUM query
+        for the whole account instead of one per zone, a truncated window is split
+        like the other series. A host goes to the zone whose name it ends with,
+        with dns_hosts=True only the A and CNAME names of the zone are kept, the
+        same hosts as Zone.get_web_analytics
+        returns {zone_id: result}
+        """
+
+        start_date, end_date, formatter, max_duration = self._series_plan(self.account_capabilities(), "rum", start_date, end_date, format)
+        index = self._zone_index(self.zones(), zone_ids)
+
+        build = lambda start, end: query.query_account_rum(self.account_id, None, start, end)
+        dataResult = self._fetch_series(build, start_date, end_date, "accounts", max_duration=max_duration)
+
+        records = None
+        if dns_hosts:
+            with ThreadPoolExecutor(max_workers=self.transport.max_inflight) as executor:
+                records = dict(zip(index.values(), executor.map(lambda zone_id: self.Zone(zone_id).get_dns_records(), index.values())))
+
+        return self._partition_rum(dataResult, index, zone_ids, records, formatter)
+
+    def _collect_zone(self, zone_id: str, dataset: str, state: StateStore = None, store: MetricStore = None):
+        zone = self.Zone(zone_id)
+        if state is not None:
+            return zone.collect(dataset, state, store=store)
+
+        return getattr(zone, f"get_{dataset}")()
+
+    def collect(self, datasets=incremental.DATASETS, zone_ids: list = None, workers: int = 4, executor: str = "thread", state: StateStore = None, store: MetricStore = None):
+        """
+        Fetch the datasets ("overview", "web_analytics", "traffics") of every zone of
+        the account, or of zone_ids, in parallel and yield (zone_id, dataset, result)
+        as they finish. A failed one gives its exception as result
+        the whole retention is fetched, with a state only what is new (Zone.collect),
+        merged into store when one is given
+        executor="process" runs the fetch and the formatting in worker processes, every
+        process has its own connection and an equal share of the rate limits
+        """
+
+        # the checks run at the call, the generator only when it is iterated
+        datasets = self._collect_plan(datasets, workers, executor, state, store)
+        return self._collect(datasets, zone_ids, workers, executor, state, store)
+
+    def _collect(self, datasets, zone_ids, workers, executor, state, store):
+        if zone_ids is None:
+            zone_ids = [zone["id"] for zone in self.zones()]
+
+        if executor == "thread" and self.cache is not None:
+            # probe before the fan out, otherwise every worker misses the cache at
+            # the same time and sends the same probe
+            if {"traffics", "overview"} & set(datasets):
+                self.zone_capabilities(zone_ids)
+            if "web_analytics" in datasets:
+                self.account_capabilities()
+
+        if executor == "thread":
+            pool = ThreadPoolExecutor(max_workers=workers)
+            run = lambda zone_id, dataset: self._collect_zone(zone_id, dataset, state, store)
+        else:
+            pool = self._worker_pool(workers)
+            run = _collect_in_worker
+
+        with pool:
+            futures = {pool.submit(run, zone_id, dataset): (zone_id, dataset) for zone_id in zone_ids for dataset in datasets}
+            try:
+                for future in as_completed(futures):
+                    zone_id, dataset = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = e
+                    yield zone_id, dataset, result
+            finally:
+                # the caller stopped early, don't start what is left
+                for future in futures:
+                    future.cancel()
+
+    def get_overviews(self, zone_ids: list, start_date: str = None, end_date: str = None, batch_size: int = query.OVERVIEW_BATCH_SIZE):
+        """
+        Zone.get_overview for many zones, batch_size zones are packed in one
+        GraphQL request and the batches are sent in parallel
+        returns {zone_id: overview}
+        """
+
+        start_date, end_date, zone_ids, batches = self._overview_batches(zone_ids, start_date, end_date, batch_size)
+        fetch = lambda batch: self._format_overviews(self._graphql(query.query_zones_overview(batch, start_date, end_date)), batch)
+
+        dataCompiled = {}
+        with ThreadPoolExecutor(max_workers=self.transport.max_inflight) as executor:
+            for result in executor.map(fetch, batches):
+                dataCompiled.update(result)
+
+        for zone_id in self._truncated_overviews(dataCompiled):
+            dataCompiled[zone_id] = self.Zone(zone_id).get_overview(start_date, end_date)
+
+        return {zone_id: dataCompiled[zone_id] for zone_id in zone_ids}
+
+# the Account of a worker process of Account.collect(executor="process")
+_worker = {}
+
+
+def _init_worker(api_key, api_key_email, account_id, config, scheduler):
+    transport = Transport(config, scheduler=Scheduler(**scheduler))
+    _worker["account"] = Account(api_key, api_key_email, account_id, transport=transport, cache=MemoryCache())
+
+
+def _collect_in_worker(zone_id, dataset):
+    return _worker["account"]._collect_zone(zone_id, dataset)
+
+
+class Zone(_GraphQLClient):
+
+    def __init__(self, api_key: str, api_key_email: str, account_id: str, zone_id: str, transport: Transport = None, cache=None):
         if not api_key or not api_key_email or not zone_id:
             raise ValueError("Cloudflare API Key, Email and Zone ID is required")
 
@@ -57,26 +585,65 @@ class Zone:
         self.api_key_email = api_key_email
         self.account_id=account_id
         self.zone_id = zone_id
-        self.cf_graphql_url, self.cf_api_url = Config().get_url()
+        self.transport = transport or Transport()
+        self.cache = cache
+        self.cf_graphql_url, self.cf_api_url = self.transport.config.get_url()
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "X-AUTH-EMAIL": self.api_key_email
         }
 
+    def _dns_page(self, params):
+        url = f"{self.cf_api_url}/zones/{self.zone_id}/dns_records"
+        return self._page(self.transport.get(url, headers=self.headers, params=params))
+
+    def _iter_dns_records(self, types):
+        """
+        A page that can't be fetched (after the retries of the scheduler) raises,
+        a truncated host list is never taken for the whole zone
+        """
+
+        with ThreadPoolExecutor(max_workers=self.transport.max_inflight) as executor:
+            records, info = self._dns_page(dns.listing_params(1))
+            listing = dns.choose_listing(records, info, types)
+
+            if listing != "typed":
+                yield from dns.keep(records, types)
+                if listing == "all":
+                    for records, _ in executor.map(self._dns_page, dns.next_pages(info)):
+                        yield from dns.keep(records, types)
+                return
+
+            firsts = list(executor.map(self._dns_page, [dns.listing_params(1, record_type) for record_type in types]))
+            rest = {
+                record_type: [executor.submit(self._dns_page, params) for params in dns.next_pages(info, record_type)]
+                for record_type, (records, info) in zip(types, firsts)
+            }
+            for record_type, (records, _) in zip(types, firsts):
+                pages = [records] + [future.result()[0] for future in rest[record_type]]
+                for records in pages:
+                    yield from records
+
+    def iter_dns_records(self, types=dns.RECORD_TYPES):
+        """
+        Yield the DNS records of the given types while the pages come in,
+        every page is as big as the API allows and the pages are fetched in parallel
+        """
+
+        yield from self._iter_dns_records(tuple(types))
+
     def get_dns_records(self):
         """
             Fetch DNS records for a given zone (A and CNAME records)
+            the records are kept in the metadata cache, a page that can't be fetched raises
         """
-        url = f"{self.cf_api_url}/zones/{self.zone_id}/dns_records"
-        records = []
-
-        for record_type in ["A", "CNAME"]:
-            response = requests.get(url, headers=self.headers, params={"type": record_type})
-            if response.status_code ==200:
-                records.extend(response.json().get("result", []))
-            else:
-                print(f"Failed to fetch {record_type} records: {response.text}")
+        cacheKey = f"{self.zone_id}:dns_records"
+        records = self._cached(cacheKey)
+        if records is not None:
+            return list(records)
 
+        records = list(self._iter_dns_records(dns.RECORD_TYPES))
+        self._remember(cacheKey, list(records))
         return records
 
     def get_domain_plan(self):
@@ -88,251 +655,181 @@ class Zone:
         Current Response
          1. Free Website
          2. Business Website
+        raises ConnectionError (RateLimitError) when the zone can't be read
         """
+        plan_name = self._cached(f"{self.zone_id}:plan")
+        if plan_name is not None:
+            return plan_name
     
         url = f"{self.cf_api_url}/zones/{self.zone_id}"
-        response = requests.get(url, headers=self.headers)
-        
-        if response.status_code == 200:
-            zone_info = response.json().get("result", {})
-            plan_name = zone_info.get("plan", {}).get("name", "Unknown")
-            return plan_name
-        else:
-            print(f"Failed to fetch plan details for zone {self.zone_id}:", response.text)
-            return "Unknown"
+        return self._keep_plan(self.transport.get(url, headers=self.headers))
+
+    def _plan_capabilities(self):
+        # the settings can't be read, guess from the plan, or from no plan when that fails too
+        try:
+            return planner.plan_capabilities(self.get_domain_plan())
+        except ConnectionError:
+            return planner.plan_capabilities("Unknown")
 
-    def get_traffics(self, start_datetime=(datetime.now()-timedelta(seconds=2764000)).strftime("%Y-%m-%dT%H:%M:%SZ"), end_datetime=datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")):
+    def capabilities(self):
         """
-        This stupid feature already tested in Business Plan, its not working with Free plan
-        and still not yet tested with Pro Plan
+        What the plan of the zone can query, {dataset: {"enabled", "max_duration",
+        "not_older_than"}} (see planner), read once from the settings of the GraphQL
+        API and kept in the metadata cache for planner.CAPABILITIES_TTL
+        When the settings can't be read it is guessed from get_domain_plan
         """
 
+        cacheKey = f"{self.zone_id}:capabilities"
+        found = self._cached(cacheKey)
+        if found is not None:
+            return found
+
         try:
-            check_start_datetime = datetime.strptime(start_datetime, "%Y-%m-%dT%H:%M:%SZ")
-        except ValueError:
-            raise ValueError("Invalid date format. Expected format: YYYY-MM-DDTHH:MM:SSZ")
+            found, ttl = planner.capabilities(self._settings(query.query_zones_settings([self.zone_id]), query.zone_alias(0))), planner.CAPABILITIES_TTL
+        except planner.SETTINGS_ERRORS:
+            found, ttl = self._plan_capabilities(), None
+        return self._remember(cacheKey, found, ttl)
 
-        threshold_date = datetime.utcnow() - timedelta(seconds=2764800)
+    def _stream_series(self, build, start, end, dataSource, formatter):
+        """
+        Parse the answer while it is downloaded and hand the series items to
+        formatter one by one, a truncated answer goes through the split windows
+        """
 
-        if (threshold_date - check_start_datetime).total_seconds() > 2764800:
-            raise ValueError(f"start_datetime cannot be more than 2,764,800 seconds (32 days) ago. Given: {start_datetime}")
+        response = self.transport.post(self.cf_graphql_url, headers=self.headers, json=build(start, end), stream=True)
+        try:
+            check_status(response)
+            items = data_format.Counted(data_format.stream_series(response, dataSource))
+            result = formatter(items)
+        finally:
+            response.close()
 
-        dns_records = [result['name'] for result in self.get_dns_records()]
-        listofDomainFilter = []
-        queryBody = {}
-
-        if "Free Website" in self.get_domain_plan():
-            raise ConnectionError(f"This Zone ID {self.zone_id} using Free Plan Pricing, Move to Business to use this feature")
-
-        if "Business" in self.get_domain_plan():
-            listofDomainFilter = [{"clientRequestHTTPHost": item} for item in dns_records]
-
-            queryBody = {
-                "query": """
-                    query VisitsDaily($zoneTag: string, $filter: ZoneHttpRequestsAdaptiveGroupsFilter_InputObject){
-                        viewer{
-                            zones(filter: {zoneTag: $zoneTag}) {
-                            series: httpRequestsAdaptiveGroups(limit: 10000, filter: $filter) {
-                                count # pageview
-                                avg {
-                                    sampleInterval
-                                    }
-                                sum {
-                                    edgeResponseBytes # data transfer
-                                    visits # according to documentation this is the number of requests by end-users that were initiated from a different website. so its requests I guess.
-                                     }
-                                dimensions {
-                                    host: clientRequestHTTPHost
-                                    ts: date # datetimeFifteenMinutes
-                                    }
-                                }
-                            }
-                        }
-                    }
-                        """,
-                "variables":{
-                    "zoneTag": self.zone_id,
-                    "filter": {
-                        "AND": [{
-                            "datetime_geq": start_datetime,
-                            "datetime_leq": end_datetime
-                        }, {
-                            "requestSource": "eyeball"
-                        }, {
-                            "AND": [{
-                                "edgeResponseStatus": 200,
-                                "edgeResponseContentTypeName": "html"
-                            }]
-                        }, {
-                            "OR": listofDomainFilter
-                        }]
-                    }
-                }
-            }
+        windows = self._halves(start, end, items.count)
+        if not windows:
+            return result
 
-        getDataOK = requests.post(self.cf_graphql_url, headers=self.headers, json=queryBody)
-        if getDataOK.status_code != 200:
-            raise ConnectionError(f"Request to {getDataOK.url} got response {getDataOK.status_code} == {getDataOK.text}") 
-        
-        dataResult = getDataOK.json()
-        if dataResult["data"] == None:
-            raise ValueError(f"There is no data Response, maybe check the response {dataResult}")
+        return formatter(self._fetch_rows(build, windows, "zones" if dataSource == "traffic" else "accounts"))
 
-        dataCompiled = {"by_date":{"date_lists": [], "dates": []}, "by_domain": {"domain_lists": [], "domains": []}}
+    def _stream_items(self, build, start, end, dataSource):
+        """
+        Yield the series items of the window while the answer is parsed. Every
+        item of a truncated answer is the whole of its dimensions for the window,
+        so the split windows only add the items it didn't have
+        """
 
-        dataCompiled = data_format.model(getDataOK, "traffic")
+        seen = set()
+        response = self.transport.post(self.cf_graphql_url, headers=self.headers, json=build(start, end), stream=True)
+        try:
+            check_status(response)
+            for item in data_format.stream_series(response, dataSource):
+                seen.add(data_format.dimensions_key(item))
+                yield item
+        finally:
+            response.close()
+
+        windows = self._halves(start, end, len(seen))
+        if windows:
+            for item in self._fetch_rows(build, windows, "zones" if dataSource == "traffic" else "accounts"):
+                if data_format.dimensions_key(item) not in seen:
+                    yield item
+
+    def _stream_rows(self, builder, names, start, end, dataSource, status=False):
+        """
+        The flat rows (format="rows") of the hosts in names, yielded while the
+        answers are parsed, one host shard after the other. With status the
+        items of an answer are folded first, they come in no particular order
+        """
 
+        shards, keep = query.host_shards(names, "zones" if dataSource == "traffic" else "accounts")
+        for hosts in shards:
+            items = self._stream_items(lambda start, end, hosts=hosts: builder(hosts, start, end), start, end, dataSource)
+            yield from self._shard_rows(items, keep, dataSource, status)
 
-        # somehow the value is always 0
-        # will debug this later, will be disabled for a moment
+    def _fetch_hosts(self, builder, names, start, end, dataSource, formatter, stream=False, max_duration=None):
+        """
+        Fetch the series of the hosts in names and format them, builder(hosts, start, end)
+        makes the query, see _host_plan. The shards are fetched in parallel
+        a window longer than max_duration is cut first and not streamed
+        """
 
-        useFeatureError = False
-        
-        if useFeatureError:
-            queryBody["variables"]["filter"]["AND"][2]["AND"][0]["edgeResponseStatus"] = 500
-            getDataFailure = requests.post(self.cf_graphql_url, headers=self.headers, json=queryBody)
-            
-            if getDataFailure.status_code != 200:
-                raise ConnectionError(f"Request to {getDataFailure.url} got response {getDataFailure.status_code} == {getDataFailure.text}") 
-        
-            dataResult = getDataFailure.json()
+        scope, builds, formatter = self._host_plan(builder, names, dataSource, formatter)
+        if self._streamed(stream, start, end, max_duration):
+            if len(builds) == 1:
+                return self._stream_series(builds[0], start, end, dataSource, formatter)
+            fetch = lambda build: self._stream_series(build, start, end, dataSource, list)
+        else:
+            fetch = lambda build: data_format._series(self._fetch_series(build, start, end, scope, max_duration=max_duration), dataSource)
 
-            if dataResult["data"] == None:
-                raise ValueError(f"There is no data Response, maybe check the response {dataResult}")
-            if getDataFailure.status_code != 200:
-                return "ERROR to GET DATA FAILURE TRAFFIC"
+        if len(builds) == 1:
+            return formatter(fetch(builds[0]))
 
-            dataMetric = dataResult["data"]["viewer"]["zones"][0]["series"]
-            for item in dataMetric:
-                ts = item["dimensions"]["ts"]
-                domainName = item["dimensions"]["host"]
+        with ThreadPoolExecutor(max_workers=self.transport.max_inflight) as executor:
+            answers = list(executor.map(fetch, builds))
 
-                if ts in dataCompiled["by_date"]["date_lists"]:
-                    currDateIndex = dataCompiled["by_date"]["date_lists"].index(ts)
-                    currDomI = dataCompiled["by_date"]["dates"][currDateIndex]["domain_lists"].index(domainName)
-                    dataCompiled["by_date"]["dates"][currDateIndex]["domains"][currDomI]["metrics"]["error_counts"] = item["count"]
+        return formatter([item for rows in answers for item in rows])
 
-                if domainName in dataCompiled["by_domain"]["domain_lists"]:
-                    currDomI = dataCompiled["by_domain"]["domain_lists"].index(domainName)
-                    currDateIndex = dataCompiled["by_domain"]["domains"][currDomI]["date_lists"].index(ts)
-                    dataCompiled["by_domain"]["domains"][currDomI]["dates"][currDateIndex]["metrics"]["error_counts"] = item["count"] 
+    def get_traffics(self, start_datetime: str = None, end_datetime: str = None, format: str = "dict", stream: bool = False, status: bool = False):
+        """
+        The httpRequestsAdaptiveGroups of the zone, its plan has to have them (not the
+        Free plan), see capabilities. DatasetUnavailable is raised before anything
+        else is sent when it doesn't
+        with stream=True the answer is parsed while it is downloaded (faster with ijson installed),
+        with format="rows" too the rows come from a generator while it is parsed
+        with status=True the html pages answered with 4xx and 5xx come in the same query
+        and every row gets error_counts, status_4xx and status_5xx
+        """
 
-        return dataCompiled
+        start_datetime, end_datetime, formatter, max_duration = self._series_plan(self.capabilities(), "traffic", start_datetime, end_datetime, format, status)
 
+        dns_records = [result['name'] for result in self.get_dns_records()]
+        builder = lambda hosts, start, end: query.query_zone_traffic(self.zone_id, hosts, start, end, status)
+        if format == "rows" and self._streamed(stream, start_datetime, end_datetime, max_duration):
+            return self._stream_rows(builder, dns_records, start_datetime, end_datetime, "traffic", status)
+
+        return self._fetch_hosts(builder, dns_records, start_datetime, end_datetime, "traffic", formatter, stream, max_duration)
 
-    def get_web_analytics(self, start_date=(datetime.now()-timedelta(seconds=2764800)).strftime("%Y-%m-%dT%H:%M:%SZ"), end_date=datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")):
+    def get_web_analytics(self, start_date: str = None, end_date: str = None, format: str = "dict", stream: bool = False):
         """
         This feature is available for any price plan
         """
 
-        try:
-            start_datetime = datetime.strptime(start_date, "%Y-%m-%dT%H:%M:%SZ")
-        except ValueError:
-            raise ValueError("Invalid date format. Expected format: YYYY-MM-DDTHH:MM:SSZ")
-
+        start_date, end_date, formatter, max_duration = self._series_plan(self.account_capabilities(), "rum", start_date, end_date, format)
 
         dns_records = [result['name'] for result in self.get_dns_records()]
-        listofDomainFilter = [{"requestHost": item} for item in dns_records]
-        dataCompiled = {"by_date":{}, "by_domain": {}}
-        queryBody = {
-                "query": """
-                    query RumDaily($accountTag: string, $filter: AccountRumPageloadEventsAdaptiveGroupsFilter_InputObject){
-                        viewer{
-                            accounts(filter: {accountTag: $accountTag}) {
-                            series: rumPageloadEventsAdaptiveGroups(limit: 10000, filter: $filter) {
-                                count # number of page viewed by end users
-                                avg {
-                                    sampleInterval
-                                    }
-                                sum {
-                                    visits # according to documentation this is the number of requests by end-users that were initiated from a different website. so its requests I guess.
-                                     }
-                                dimensions {
-                                    host: requestHost
-                                    ts: date
-                                    }
-                                }
-                            }
-                        }
-                    }
-                        """,
-                "variables":{
-                    "accountTag": self.account_id,
-                    "filter": {
-                        "AND": [{
-                            "datetime_geq": start_date,
-                            "datetime_leq": end_date
-                        }, {
-                            "OR": listofDomainFilter
-                        }]
-                    }
-                }
-            }
+        builder = lambda hosts, start, end: query.query_account_rum(self.account_id, hosts, start, end)
+        if format == "rows" and self._streamed(stream, start_date, end_date, max_duration):
+            return self._stream_rows(builder, dns_records, start_date, end_date, "rum")
 
-        getDataOK = requests.post(self.cf_graphql_url, headers=self.headers, json=queryBody)
-        if getDataOK.status_code != 200:
-            raise ConnectionError(f"Request to {getDataOK.url} got response {getDataOK.status_code} == {getDataOK.text}") 
-        
-        dataResult = getDataOK.json()
-        if dataResult["data"] == None:
-            raise ValueError(f"There is no data Response, maybe check the response {dataResult}")
-        
+        return self._fetch_hosts(builder, dns_records, start_date, end_date, "rum", formatter, stream, max_duration)
 
-        dataCompiled = data_format.model(getDataOK, "rum")
-
-        return dataCompiled
-
-    def get_overview(self, start_date=(datetime.now()-timedelta(seconds=2764800)).strftime("%Y-%m-%d"), end_date=datetime.now().strftime("%Y-%m-%d")):
+    def get_overview(self, start_date: str = None, end_date: str = None, resolution: str = "1d"):
+        """
+        resolution is the size of the buckets: 15m, 1h, 6h, 1d, 7d... The overview
+        comes from the coarsest httpRequests1dGroups/1hGroups/1mGroups dataset that
+        adds up to it and still keeps start_date (query.overview_dataset), coarser
+        buckets are rolled up here. start_date and end_date are dates (end excluded)
+        or datetimes (end included)
+        The datasets the plan of the zone can't query are skipped (capabilities) and a
+        window longer than the maxDuration of the dataset raises before it is sent
+        """
 
-        try:
-            start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
-        except ValueError:
-            raise ValueError("Invalid date format. Expected format: YYYY-MM-DD")
-
-        queryBody = query.query_zone_overview(self.zone_id, start_date, end_date)
-        
-        getDataOK = requests.post(self.cf_graphql_url, headers=self.headers, json=queryBody)
-        if getDataOK.status_code != 200:
-            raise ConnectionError(f"Request to {getDataOK.url} got response {getDataOK.status_code} == {getDataOK.text}") 
-        
-        dataResult = getDataOK.json()
-        if dataResult["data"] == None:
-            raise ValueError(f"There is no data Response, maybe check the response {dataResult}")
-        
-        dataCompiled = {
-            "totalUniqueUsers": {},
-            "by_date": {
-                "dates": [],
-                "date_lists": []
-            }
-        }
+        dataset, start, end, format = self._overview_plan(self.capabilities(), start_date, end_date, resolution)
 
-        try:
-            dataMetric = getDataOK.json()["data"]["viewer"]["zones"][0]
-            dataCompiled["totalUniqueUsers"] = dataMetric["totals"][0]["uniq"]["uniques"]
-            for item in dataMetric["zones"]:
-                ts = item["dimensions"]["timeslot"]
-                if ts not in dataCompiled["by_date"]["date_lists"]:
-                    dataCompiled["by_date"]["dates"].append({
-                        "date": ts,
-                        "metrics": {
-                            "browserMap": item["sum"]["browserMap"],
-                            "bytes": item["sum"]["bytes"],
-                            "cachedBytes": item["sum"]["cachedBytes"],
-                            "cachedRequests": item["sum"]["cachedRequests"],
-                            "contentTypeMap": item["sum"]["contentTypeMap"],
-                            "countryMap": item["sum"]["countryMap"],
-                            "pageViews": item["sum"]["pageViews"],
-                            "requests": item["sum"]["requests"],
-                            "responseStatusMap": item["sum"]["responseStatusMap"],
-                            "threatPathingMap": item["sum"]["threatPathingMap"],
-                            "threats": item["sum"]["threats"]
-                        }
-                    })
-                    dataCompiled["by_date"]["date_lists"].append(ts)
-        except (KeyError, IndexError, TypeError):
-            return "Data is Missing or Invalid"
-
-        return dataCompiled
+        # totals come from the first answer which always covers the whole window
+        build = lambda start, end: query.query_zone_overview(self.zone_id, start, end, dataset)
+        return self._format_overview(self._fetch_series(build, start, end, "zones", alias="zones", format=format), dataset, resolution)
 
+    def collect(self, dataset: str, state: StateStore, overlap: timedelta = None, store: MetricStore = None, status: bool = False):
+        """
+        Incremental get_overview, get_web_analytics or get_traffics
+        only the range after the watermark of this zone (minus overlap for the late
+        data) is fetched and returned. The window is merged into store when one is
+        given (its rows of the same date are replaced), that is where the history
+        is, state only keeps the watermark. A window that gave nothing usable raises
+        ValueError and the watermark stays
+        with status=True the traffics come with their error_counts (get_traffics status=True)
+        """
 
+        found = self.account_capabilities() if dataset == "web_analytics" else self.capabilities()
+        start, end, options = self._collect_window(dataset, state, found, overlap, status)
+        return self._collected(dataset, state, store, start, end, getattr(self, f"get_{dataset}")(start, end, **options))
@@ -0,0 +1,4 @@
+import sys
+from cfmetrics.daemon import main
+
+sys.exit(main())
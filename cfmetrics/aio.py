@@ -0,0 +1,628 @@
+"""
+Asyncio twin of Auth, Account and Zone
+
+The queries come from cfmetrics.query, what to send and what to do with the
+answers from the steps the sync clients use too (cfmetrics._Steps), only the
+requests are awaited here, so every method returns the same thing as the sync one
+"""
+import asyncio
+import json
+from datetime import timedelta
+from cfmetrics import query, data_format, dns, planner, ZONES_PAGE_SIZE, _Steps, _collect_in_worker
+from cfmetrics.transport import Config, check_response, check_status, record_response
+from cfmetrics.instrument import Instrumentation, url_class
+from cfmetrics.scheduler import Scheduler
+from cfmetrics.cache import MemoryCache
+from cfmetrics import state as incremental
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncResponse:
+    """
+    The body is read before the aiohttp response is released, this keeps the
+    small part of requests.Response that check_response and data_format use
+    a request sent with stream=True keeps the aiohttp response in raw instead,
+    its body is read from raw.content and close() releases it
+    """
+
+    def __init__(self, status_code: int, url: str, headers, content: bytes, raw=None):
+        self.status_code = status_code
+        self.url = url
+        self.headers = headers
+        self.content = content
+        self.raw = raw
+
+    def close(self):
+        if self.raw is not None:
+            self.raw.release()
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncTransport:
+
+    def __init__(self, config: Config = None, pool_size: int = 100, keep_alive: bool = True, timeout: float = 60, concurrency: int = None, scheduler: Scheduler = None, instrumentation: Instrumentation = None, response_cache=None):
+        if aiohttp is None:
+            raise ImportError("The asyncio client needs aiohttp, install it with: pip install cfmetrics[async]")
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+
+        self.config = config or Config()
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.concurrency = concurrency or pool_size
+        self.scheduler = scheduler or Scheduler()
+        self.instrumentation = instrumentation or Instrumentation()
+        self.response_cache = response_cache
+        self.session = None
+        self.semaphore = None
+
+    def _session(self):
+        # aiohttp wants the session to be created inside the running loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, force_close=not self.keep_alive)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Accept-Encoding": "gzip, deflate"}
+            )
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self.session
+
+    async def _send(self, method: str, url: str, stream: bool = False, **kwargs):
+        session = self._session()
+        async with self.semaphore:
+            if stream:
+                # the slot is given back once the headers are in, like Transport
+                response = await session.request(method, url, **kwargs)
+                if response.status == 200:
+                    return AsyncResponse(response.status, str(response.url), response.headers, None, response)
+                # an error is read like any other answer, check_status shows it
+                try:
+                    content = await response.read()
+                finally:
+                    response.release()
+                return AsyncResponse(response.status, str(response.url), response.headers, content)
+
+            async with session.request(method, url, **kwargs) as response:
+                content = await response.read()
+                return AsyncResponse(response.status, str(response.url), response.headers, content)
+
+    async def request(self, method: str, url: str, **kwargs):
+        """
+        Same scheduling and retries as Transport.request
+        """
+
+        api = "graphql" if url == self.config.cf_graphql_url else "rest"
+        idempotent = method == "GET" or api == "graphql"
+        attempt = 0
+
+        while True:
+            queued = self.scheduler.reserve(api)
+            await asyncio.sleep(queued)
+            with self.instrumentation.span("http", url_class(url, self.config.cf_graphql_url), method=method, attempt=attempt, queued=max(0, queued)) as span:
+                try:
+                    response = await self._send(method, url, **kwargs)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    response = None
+                    error = e
+                    span.error = type(e).__name__
+                else:
+                    record_response(span, response)
+
+            if response is None:
+                delay = self.scheduler.retry_delay(attempt) if idempotent else None
+                if delay is None:
+                    raise error
+            else:
+                delay = self.scheduler.retry_delay(attempt, response) if idempotent else None
+                if delay is None:
+                    return response
+                response.close()
+                if response.status_code == 429:
+                    self.scheduler.pause(api, delay)
+                    delay = 0
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class AsyncAuth:
+
+    def __init__(self, api_key: str, api_key_email: str, config: Config = None, pool_size: int = 100, keep_alive: bool = True, timeout: float = 60, concurrency: int = None, cache=None, scheduler: Scheduler = None, instrumentation: Instrumentation = None, response_cache=None):
+        if not api_key or not api_key_email:
+            raise ValueError("Cloudflare Account ID, Zone ID, API Key, API Key Email is required")
+
+        self.api_key=api_key
+        self.api_key_email=api_key_email
+        self.transport = AsyncTransport(config, pool_size=pool_size, keep_alive=keep_alive, timeout=timeout, concurrency=concurrency, scheduler=scheduler, instrumentation=instrumentation, response_cache=response_cache)
+        self.instrumentation = self.transport.instrumentation
+        self.cache = cache if cache is not None else MemoryCache()
+
+    def Account(self, account_id: str):
+        return AsyncAccount(self.api_key, self.api_key_email, account_id, transport=self.transport, cache=self.cache)
+
+    async def close(self):
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class _AsyncGraphQLClient(_Steps):
+    """
+    The GraphQL part shared by AsyncAccount and AsyncZone, they set transport and headers
+    """
+
+    async def _graphql(self, queryBody):
+        responseCache = self.transport.response_cache
+        dataResult = responseCache.get(queryBody) if responseCache is not None else None
+        if dataResult is not None:
+            return dataResult
+
+        response = await self.transport.post(self.cf_graphql_url, headers=self.headers, json=queryBody)
+        with self.transport.instrumentation.span("decode", "graphql"):
+            dataResult = check_response(response)
+        if responseCache is not None:
+            responseCache.set(queryBody, dataResult)
+        return dataResult
+
+    async def _settings(self, queryBody, scope):
+        return (await self._graphql(queryBody))["data"]["viewer"][scope][0]["settings"]
+
+    async def account_capabilities(self):
+        """
+        Same as Account.account_capabilities
+        """
+
+        cacheKey = f"{self.account_id}:capabilities"
+        found = self._cached(cacheKey)
+        if found is not None:
+            return found
+
+        try:
+            found, ttl = planner.capabilities(await self._settings(query.query_account_settings(self.account_id), "accounts")), planner.CAPABILITIES_TTL
+        except planner.SETTINGS_ERRORS:
+            found, ttl = {}, None
+        return self._remember(cacheKey, found, ttl)
+
+    async def _fetch_series(self, build, start, end, scope, alias="series", format=query.DATETIME_FORMAT, max_duration=None):
+        """
+        Same splitting as Zone._fetch_series, the sub windows are gathered and the
+        transport concurrency caps how many are in flight
+        """
+
+        windows = self._series_windows(start, end, alias, format, max_duration)
+        if windows:
+            return self._series_answer(scope, alias, await self._fetch_rows(build, windows, scope, alias, format))
+
+        dataResult = await self._graphql(build(start, end))
+        windows = self._halves(start, end, len(self._rows(dataResult, scope, alias)), format)
+        if windows:
+            dataResult["data"]["viewer"][scope][0][alias] = await self._fetch_rows(build, windows, scope, alias, format)
+
+        return dataResult
+
+    async def _fetch_rows(self, build, pending, scope, alias="series", format=query.DATETIME_FORMAT):
+        async def fetch(window):
+            return self._rows(await self._graphql(build(*window)), scope, alias)
+
+        collected = {}
+        while pending:
+            pending = self._split_answers(zip(pending, await asyncio.gather(*[fetch(window) for window in pending])), format, collected)
+
+        return self._merge_windows(collected)
+
+
+class AsyncAccount(_AsyncGraphQLClient):
+
+    def __init__(self, api_key: str, api_key_email: str, account_id: str, transport: AsyncTransport = None, cache=None):
+        if not api_key or not api_key_email or not account_id:
+            raise ValueError("Cloudflare API Key, Email API Key and Account ID is required")
+
+        self.api_key=api_key
+        self.api_key_email=api_key
+        self.account_id=account_id
+        self.transport = transport or AsyncTransport()
+        self.cache = cache
+        self.cf_graphql_url, self.cf_api_url = self.transport.config.get_url()
+        self.headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "X-AUTH-EMAIL": self.api_key_email
+        }
+
+    def Zone(self, zone_id: str):
+        return AsyncZone(self.api_key, self.api_key_email, self.account_id, zone_id, transport=self.transport, cache=self.cache)
+
+    async def get_overviews(self, zone_ids: list, start_date: str = None, end_date: str = None, batch_size: int = query.OVERVIEW_BATCH_SIZE):
+        """
+        Same as Account.get_overviews, the batches are gathered
+        """
+
+        start_date, end_date, zone_ids, batches = self._overview_batches(zone_ids, start_date, end_date, batch_size)
+
+        async def fetch(batch):
+            return self._format_overviews(await self._graphql(query.query_zones_overview(batch, start_date, end_date)), batch)
+
+        dataCompiled = {}
+        for result in await asyncio.gather(*[fetch(batch) for batch in batches]):
+            dataCompiled.update(result)
+
+        for zone_id in self._truncated_overviews(dataCompiled):
+            dataCompiled[zone_id] = await self.Zone(zone_id).get_overview(start_date, end_date)
+
+        return {zone_id: dataCompiled[zone_id] for zone_id in zone_ids}
+
+    async def _zones_page(self, page: int):
+        url = f"{self.cf_api_url}/zones"
+        return self._page(await self.transport.get(url, headers=self.headers, params={"account.id": self.account_id, "page": page, "per_page": ZONES_PAGE_SIZE}))
+
+    async def zones(self):
+        """
+        Same as Account.zones, the pages after the first one are gathered
+        """
+
+        zones = self._cached(f"{self.account_id}:zones")
+        if zones is not None:
+            return list(zones)
+
+        zones, info = await self._zones_page(1)
+        for result, _ in await asyncio.gather(*[self._zones_page(page) for page in range(2, dns.total_pages(info) + 1)]):
+            zones.extend(result)
+
+        return self._keep_zones(zones)
+
+    async def zone_capabilities(self, zone_ids: list, batch_size: int = query.OVERVIEW_BATCH_SIZE):
+        """
+        Same as Account.zone_capabilities, the batches are gathered
+        """
+
+        found, missing, batches = self._capability_batches(zone_ids, batch_size)
+
+        async def fetch(batch):
+            try:
+                return self._probed_capabilities(await self._graphql(query.query_zones_settings(batch)), batch)
+            except planner.SETTINGS_ERRORS:
+                return {}
+
+        probed = {}
+        for result in await asyncio.gather(*[fetch(batch) for batch in batches]):
+            probed.update(result)
+
+        guessed = {zone_id: await self.Zone(zone_id)._plan_capabilities() for zone_id in missing if zone_id not in probed}
+        return self._keep_capabilities(zone_ids, found, probed, guessed)
+
+    async def get_web_analytics(self, start_date: str = None, end_date: str = None, zone_ids: list = None, format: str = "dict", dns_hosts: bool = False):
+        """
+        Same as Account.get_web_analytics
+        """
+
+        start_date, end_date, formatter, max_duration = self._series_plan(await self.account_capabilities(), "rum", start_date, end_date, format)
+        index = self._zone_index(await self.zones(), zone_ids)
+
+        build = lambda start, end: query.query_account_rum(self.account_id, None, start, end)
+        dataResult = await self._fetch_series(build, start_date, end_date, "accounts", max_duration=max_duration)
+
+        records = None
+        if dns_hosts:
+            records = dict(zip(index.values(), await asyncio.gather(*[self.Zone(zone_id).get_dns_records() for zone_id in index.values()])))
+
+        return self._partition_rum(dataResult, index, zone_ids, records, formatter)
+
+    async def _collect_zone(self, zone_id: str, dataset: str, state=None, store=None):
+        zone = self.Zone(zone_id)
+        if state is not None:
+            return await zone.collect(dataset, state, store=store)
+
+        return await getattr(zone, f"get_{dataset}")()
+
+    def collect(self, datasets=incremental.DATASETS, zone_ids: list = None, workers: int = None, executor: str = "thread", state=None, store=None):
+        """
+        Same as Account.collect, returns an async generator. The zones run as tasks
+        of the loop, workers of them at a time (None leaves it to the transport
+        concurrency), with executor="process" they run in workers worker
+        processes (4 when None) like Account.collect
+        """
+
+        datasets = self._collect_plan(datasets, workers, executor, state, store)
+        return self._collect(datasets, zone_ids, workers, executor, state, store)
+
+    async def _collect(self, datasets, zone_ids, workers, executor, state, store):
+        if zone_ids is None:
+            zone_ids = [zone["id"] for zone in await self.zones()]
+
+        if executor == "thread" and self.cache is not None:
+            if {"traffics", "overview"} & set(datasets):
+                await self.zone_capabilities(zone_ids)
+            if "web_analytics" in datasets:
+                await self.account_capabilities()
+
+        pool = self._worker_pool(workers or 4) if executor == "process" else None
+        limit = asyncio.Semaphore(workers) if workers and pool is None else None
+
+        async def fetch(zone_id, dataset):
+            if pool is not None:
+                return await asyncio.get_running_loop().run_in_executor(pool, _collect_in_worker, zone_id, dataset)
+            if limit is None:
+                return await self._collect_zone(zone_id, dataset, state, store)
+            async with limit:
+                return await self._collect_zone(zone_id, dataset, state, store)
+
+        async def run(zone_id, dataset):
+            try:
+                return zone_id, dataset, await fetch(zone_id, dataset)
+            except Exception as e:
+                return zone_id, dataset, e
+
+        tasks = [asyncio.ensure_future(run(zone_id, dataset)) for zone_id in zone_ids for dataset in datasets]
+        try:
+            for result in asyncio.as_completed(tasks):
+                yield await result
+        finally:
+            # the caller stopped early, don't start what is left
+            for task in tasks:
+                task.cancel()
+            if pool is not None:
+                pool.shutdown(wait=False)
+
+    async def collect_zones(self, zone_ids: list, method: str = "get_overview", *args, **kwargs):
+        """
+        Run the same Zone method for many zones at once, the transport concurrency
+        bounds how many requests are in flight. A zone that failed gets its exception
+        """
+
+        zone_ids = list(zone_ids)
+        results = await asyncio.gather(
+            *[getattr(self.Zone(zone_id), method)(*args, **kwargs) for zone_id in zone_ids],
+            return_exceptions=True
+        )
+        return dict(zip(zone_ids, results))
+
+
+class AsyncZone(_AsyncGraphQLClient):
+
+    def __init__(self, api_key: str, api_key_email: str, account_id: str, zone_id: str, transport: AsyncTransport = None, cache=None):
+        if not api_key or not api_key_email or not zone_id:
+            raise ValueError("Cloudflare API Key, Email and Zone ID is required")
+
+        self.api_key = api_key
+        self.api_key_email = api_key_email
+        self.account_id=account_id
+        self.zone_id = zone_id
+        self.transport = transport or AsyncTransport()
+        self.cache = cache
+        self.cf_graphql_url, self.cf_api_url = self.transport.config.get_url()
+        self.headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "X-AUTH-EMAIL": self.api_key_email
+        }
+
+    async def _dns_page(self, params):
+        url = f"{self.cf_api_url}/zones/{self.zone_id}/dns_records"
+        return self._page(await self.transport.get(url, headers=self.headers, params=params))
+
+    async def _iter_dns_records(self, types):
+        records, info = await self._dns_page(dns.listing_params(1))
+        listing = dns.choose_listing(records, info, types)
+
+        if listing != "typed":
+            for record in dns.keep(records, types):
+                yield record
+            if listing == "all":
+                pages = [asyncio.ensure_future(self._dns_page(params)) for params in dns.next_pages(info)]
+                for page in pages:
+                    records, _ = await page
+                    for record in dns.keep(records, types):
+                        yield record
+            return
+
+        firsts = await asyncio.gather(*[self._dns_page(dns.listing_params(1, record_type)) for record_type in types])
+        rest = {
+            record_type: [asyncio.ensure_future(self._dns_page(params)) for params in dns.next_pages(info, record_type)]
+            for record_type, (records, info) in zip(types, firsts)
+        }
+        for record_type, (records, _) in zip(types, firsts):
+            pages = [records] + [(await page)[0] for page in rest[record_type]]
+            for records in pages:
+                for record in records:
+                    yield record
+
+    async def iter_dns_records(self, types=dns.RECORD_TYPES):
+        """
+        Same as Zone.iter_dns_records, an async generator
+        """
+
+        async for record in self._iter_dns_records(tuple(types)):
+            yield record
+
+    async def get_dns_records(self):
+        """
+            Fetch DNS records for a given zone (A and CNAME records)
+        """
+        cacheKey = f"{self.zone_id}:dns_records"
+        records = self._cached(cacheKey)
+        if records is not None:
+            return list(records)
+
+        records = [record async for record in self._iter_dns_records(dns.RECORD_TYPES)]
+        self._remember(cacheKey, list(records))
+        return records
+
+    async def get_domain_plan(self):
+        plan_name = self._cached(f"{self.zone_id}:plan")
+        if plan_name is not None:
+            return plan_name
+
+        url = f"{self.cf_api_url}/zones/{self.zone_id}"
+        return self._keep_plan(await self.transport.get(url, headers=self.headers))
+
+    async def _plan_capabilities(self):
+        try:
+            return planner.plan_capabilities(await self.get_domain_plan())
+        except ConnectionError:
+            return planner.plan_capabilities("Unknown")
+
+    async def capabilities(self):
+        """
+        Same as Zone.capabilities
+        """
+
+        cacheKey = f"{self.zone_id}:capabilities"
+        found = self._cached(cacheKey)
+        if found is not None:
+            return found
+
+        try:
+            found, ttl = planner.capabilities(await self._settings(query.query_zones_settings([self.zone_id]), query.zone_alias(0))), planner.CAPABILITIES_TTL
+        except planner.SETTINGS_ERRORS:
+            found, ttl = await self._plan_capabilities(), None
+        return self._remember(cacheKey, found, ttl)
+
+    async def _stream_items(self, build, start, end, dataSource):
+        """
+        Same as Zone._stream_items, an async generator
+        """
+
+        seen = set()
+        response = await self.transport.post(self.cf_graphql_url, headers=self.headers, json=build(start, end), stream=True)
+        try:
+            check_status(response)
+            async for item in data_format.stream_series_async(response, dataSource):
+                seen.add(data_format.dimensions_key(item))
+                yield item
+        finally:
+            response.close()
+
+        windows = self._halves(start, end, len(seen))
+        if windows:
+            for item in await self._fetch_rows(build, windows, "zones" if dataSource == "traffic" else "accounts"):
+                if data_format.dimensions_key(item) not in seen:
+                    yield item
+
+    async def _stream_series(self, build, start, end, dataSource, formatter):
+        """
+        Same as Zone._stream_series, the items are parsed while the answer comes
+        in and formatted once it is read
+        """
+
+        response = await self.transport.post(self.cf_graphql_url, headers=self.headers, json=build(start, end), stream=True)
+        try:
+            check_status(response)
+            items = [item async for item in data_format.stream_series_async(response, dataSource)]
+        finally:
+            response.close()
+
+        windows = self._halves(start, end, len(items))
+        if windows:
+            items = await self._fetch_rows(build, windows, "zones" if dataSource == "traffic" else "accounts")
+
+        return formatter(items)
+
+    async def _stream_rows(self, builder, names, start, end, dataSource, status=False):
+        """
+        Same as Zone._stream_rows, an async generator
+        """
+
+        shards, keep = query.host_shards(names, "zones" if dataSource == "traffic" else "accounts")
+        for hosts in shards:
+            items = self._stream_items(lambda start, end, hosts=hosts: builder(hosts, start, end), start, end, dataSource)
+            if status:
+                # folded once the shard is in, the status rows come in no particular order
+                for row in self._shard_rows([item async for item in items], keep, dataSource, status):
+                    yield row
+                continue
+            async for item in items:
+                for row in self._shard_rows((item,), keep, dataSource):
+                    yield row
+
+    async def _fetch_hosts(self, builder, names, start, end, dataSource, formatter, stream=False, max_duration=None):
+        """
+        Same as Zone._fetch_hosts, the shards are gathered
+        """
+
+        scope, builds, formatter = self._host_plan(builder, names, dataSource, formatter)
+        if self._streamed(stream, start, end, max_duration):
+            fetch = lambda build: self._stream_series(build, start, end, dataSource, list)
+        else:
+            async def fetch(build):
+                return data_format._series(await self._fetch_series(build, start, end, scope, max_duration=max_duration), dataSource)
+
+        answers = await asyncio.gather(*[fetch(build) for build in builds])
+        return formatter([item for rows in answers for item in rows])
+
+    async def get_traffics(self, start_datetime: str = None, end_datetime: str = None, format: str = "dict", stream: bool = False, status: bool = False):
+        """
+        Same as Zone.get_traffics, with stream=True and format="rows" the rows
+        come from an async generator
+        """
+
+        start_datetime, end_datetime, formatter, max_duration = self._series_plan(await self.capabilities(), "traffic", start_datetime, end_datetime, format, status)
+
+        dns_records = [result['name'] for result in await self.get_dns_records()]
+        builder = lambda hosts, start, end: query.query_zone_traffic(self.zone_id, hosts, start, end, status)
+        if format == "rows" and self._streamed(stream, start_datetime, end_datetime, max_duration):
+            return self._stream_rows(builder, dns_records, start_datetime, end_datetime, "traffic", status)
+
+        return await self._fetch_hosts(builder, dns_records, start_datetime, end_datetime, "traffic", formatter, stream, max_duration)
+
+    async def get_web_analytics(self, start_date: str = None, end_date: str = None, format: str = "dict", stream: bool = False):
+        """
+        Same as Zone.get_web_analytics
+        """
+
+        start_date, end_date, formatter, max_duration = self._series_plan(await self.account_capabilities(), "rum", start_date, end_date, format)
+
+        dns_records = [result['name'] for result in await self.get_dns_records()]
+        builder = lambda hosts, start, end: query.query_account_rum(self.account_id, hosts, start, end)
+        if format == "rows" and self._streamed(stream, start_date, end_date, max_duration):
+            return self._stream_rows(builder, dns_records, start_date, end_date, "rum")
+
+        return await self._fetch_hosts(builder, dns_records, start_date, end_date, "rum", formatter, stream, max_duration)
+
+    async def get_overview(self, start_date: str = None, end_date: str = None, resolution: str = "1d"):
+        """
+        Same as Zone.get_overview
+        """
+
+        dataset, start, end, format = self._overview_plan(await self.capabilities(), start_date, end_date, resolution)
+
+        build = lambda start, end: query.query_zone_overview(self.zone_id, start, end, dataset)
+        return self._format_overview(await self._fetch_series(build, start, end, "zones", alias="zones", format=format), dataset, resolution)
+
+    async def collect(self, dataset: str, state, overlap: timedelta = None, store=None, status: bool = False):
+        """
+        Same as Zone.collect
+        """
+
+        found = await self.account_capabilities() if dataset == "web_analytics" else await self.capabilities()
+        start, end, options = self._collect_window(dataset, state, found, overlap, status)
+        return self._collected(dataset, state, store, start, end, await getattr(self, f"get_{dataset}")(start, end, **options))
@@ -0,0 +1,228 @@
+"""
+Caches for the zone metadata (DNS records and plan) that rarely change
+between two polls, both backends have the same get/set/delete/clear api
+
+ResponseCache is the cache of the GraphQL answers, see its docstring
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from cfmetrics import query
+
+
+class MemoryCache:
+    """
+    In memory TTL cache with LRU eviction, safe to share between threads
+    """
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1024):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return default
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SqliteCache:
+    """
+    On disk TTL cache with LRU eviction, the values are stored as JSON so the
+    cache survives a restart of the collector
+    """
+
+    def __init__(self, path: str, ttl: float = 300, max_entries: int = 100000):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def get(self, key: str, default=None):
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            if row[1] <= now:
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return default
+
+            self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+
+    def set(self, key: str, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", (key, json.dumps(value), now + ttl, now))
+            count = self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)", (count - self.max_entries,))
+
+    def delete(self, key: str):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM cache")
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class ResponseCache:
+    """
+    GraphQL answers keyed on the hash of query.normalize_query(queryBody)
+
+    The answer of a sealed window (query.is_sealed) never changes so it is kept
+    until it is evicted, the answer of a window that is still open expires after
+    open_ttl seconds. The answers are stored compressed and the least recently
+    used ones are evicted when they take more than max_bytes. path ":memory:"
+    keeps them in memory only
+    """
+
+    def __init__(self, path: str = ":memory:", max_bytes: int = 256 * 1024 * 1024, open_ttl: float = 60):
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1")
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.open_ttl = open_ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            # expires is NULL for the sealed answers
+            self.conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, body BLOB, size INTEGER, expires REAL, accessed REAL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def key(queryBody):
+        return hashlib.sha256(query.normalize_query(queryBody).encode()).hexdigest()
+
+    def get(self, queryBody, default=None):
+        """
+        A new copy of the cached answer every time, the callers change it
+        """
+
+        key = self.key(queryBody)
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT body, size, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[2] is not None and row[2] <= now:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.size -= row[1]
+                row = None
+            if row is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, queryBody, dataResult):
+        now = time.time()
+        if query.is_sealed(queryBody):
+            expires = None
+        elif self.open_ttl > 0:
+            expires = now + self.open_ttl
+        else:
+            return
+
+        body = zlib.compress(json.dumps(dataResult, separators=(",", ":")).encode(), 1)
+        if len(body) > self.max_bytes:
+            return
+
+        key = self.key(queryBody)
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.size += len(body) - (row[0] if row else 0)
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, body, len(body), expires, now))
+            self._evict()
+
+    def _evict(self):
+        # the size is read again from the table, another process can write the same file
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        while self.size > self.max_bytes:
+            rows = self.conn.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 64").fetchall()
+            if not rows:
+                self.size = 0
+                break
+
+            evicted = []
+            for key, size in rows:
+                if self.size <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                self.size -= size
+            self.conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM responses")
+            self.size = 0
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
@@ -0,0 +1,148 @@
+"""
+Columnar results of get_traffics and get_web_analytics (format="columnar")
+and the formatter of every format
+
+One NumPy array per field instead of one dict per row, dates and hosts are
+dictionary encoded (an int code per row and the list of names), so grouping
+and totals are a bincount over the codes
+"""
+from cfmetrics import data_format
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# the metric arrays of every source, named like the keys of data_format.model,
+# with where the value is in a GraphQL series item
+COLUMNS = {
+    "traffic": {"page_views": ("count", None), "requests": ("sum", "visits"), "data_transfer_bytes": ("sum", "edgeResponseBytes")},
+    "rum": {"page_views": ("count", None), "visits": ("sum", "visits")},
+}
+
+# the error columns of a traffic query with status=True, see data_format.fold_status
+STATUS_COLUMNS = {"error_counts": ("errors", "all"), "status_4xx": ("errors", "4xx"), "status_5xx": ("errors", "5xx")}
+
+# rows is a flat {date, host, metric...} dict per row, see data_format.flat_rows
+FORMATS = ("dict", "columnar", "rows")
+
+
+def check_format(format: str):
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format}, expected one of {', '.join(FORMATS)}")
+    if format == "columnar" and np is None:
+        raise ImportError("The columnar format needs numpy, install it with: pip install cfmetrics[columnar]")
+
+
+def formatter(format: str, dataSource: str, status: bool = False):
+    """
+    The function that turns series items into the result of the given format,
+    status=True folds the status rows first (data_format.fold_status)
+    """
+
+    check_format(format)
+    if status and format == "columnar":
+        return lambda items: Series.from_items(data_format.fold_status(items), dataSource, {**COLUMNS[dataSource], **STATUS_COLUMNS})
+    if status:
+        format_items = formatter(format, dataSource)
+        return lambda items: format_items(data_format.fold_status(items))
+
+    if format == "columnar":
+        return lambda items: Series.from_items(items, dataSource)
+    if format == "rows":
+        return lambda items: list(data_format.flat_rows(items, dataSource))
+    return lambda items: data_format.model_items(items, dataSource)
+
+
+class Series:
+
+    def __init__(self, dataSource: str, dates: list, date_codes, hosts: list, host_codes, columns: dict):
+        self.source = dataSource
+        self.dates = dates
+        self.date_codes = date_codes
+        self.hosts = hosts
+        self.host_codes = host_codes
+        self.columns = columns
+
+    @classmethod
+    def from_result(cls, dataResult, dataSource: str):
+        """
+        Build the arrays straight from the GraphQL series, like data_format.model
+        """
+
+        return cls.from_items(data_format._series(dataResult, dataSource), dataSource)
+
+    @classmethod
+    def from_items(cls, items, dataSource: str, columns: dict = None):
+        check_format("columnar")
+        if dataSource not in COLUMNS:
+            raise ValueError(f"Unknown data source {dataSource}")
+
+        dateIndex = {}
+        hostIndex = {}
+        dateCodes = []
+        hostCodes = []
+        paths = columns or COLUMNS[dataSource]
+        values = {name: [] for name in paths}
+
+        for item in items:
+            dimensions = item["dimensions"]
+            dateCodes.append(dateIndex.setdefault(dimensions["ts"], len(dateIndex)))
+            hostCodes.append(hostIndex.setdefault(dimensions["host"], len(hostIndex)))
+            for name, (key, field) in paths.items():
+                values[name].append(item[key] if field is None else item[key][field])
+
+        return cls(
+            dataSource,
+            list(dateIndex),
+            np.array(dateCodes, dtype=np.int32),
+            list(hostIndex),
+            np.array(hostCodes, dtype=np.int32),
+            {name: np.array(column, dtype=np.int64) for name, column in values.items()}
+        )
+
+    def __len__(self):
+        return len(self.date_codes)
+
+    @property
+    def ts(self):
+        return np.array(self.dates, dtype="datetime64[D]")[self.date_codes]
+
+    @property
+    def host(self):
+        return np.array(self.hosts, dtype=object)[self.host_codes]
+
+    def _group(self, codes, names):
+        # np.add.at keeps int64, bincount would go through float64
+        sums = {}
+        for metric, column in self.columns.items():
+            total = np.zeros(len(names), dtype=np.int64)
+            np.add.at(total, codes, column)
+            sums[metric] = total.tolist()
+
+        return {name: {metric: sums[metric][i] for metric in sums} for i, name in enumerate(names)}
+
+    def group_by_date(self):
+        """
+        {date: {metric: total of every host}}
+        """
+        return self._group(self.date_codes, self.dates)
+
+    def group_by_host(self):
+        """
+        {host: {metric: total of every date}}
+        """
+        return self._group(self.host_codes, self.hosts)
+
+    def totals(self):
+        return {name: int(column.sum()) for name, column in self.columns.items()}
+
+    def to_dict(self):
+        """
+        The by_date/by_domain dict that the default format returns
+        """
+        rows = (
+            (self.dates[d], self.hosts[h], {name: int(column[i]) for name, column in self.columns.items()})
+            for i, (d, h) in enumerate(zip(self.date_codes, self.host_codes))
+        )
+        return data_format._compile(rows)
@@ -0,0 +1,255 @@
+"""
+cfmetrics as a long running collector
+
+    cfmetrics /etc/cfmetrics.json
+
+The config is a JSON file with the accounts and zones to collect, every zone and
+dataset is collected incrementally (Zone.collect) at the interval of the dataset
+on a bounded pool of threads. One Auth is kept for the whole run, so the
+connections, the scheduler and the metadata cache stay warm between runs.
+What every run fetched is written to the sink.
+
+    {
+        "api_key": "...",                   # or CF_API_KEY in the environment
+        "api_key_email": "...",             # or CF_HEADER_EMAIL
+        "workers": 4,
+        "state": "/var/lib/cfmetrics/state.db",
+        "response_cache": "/var/lib/cfmetrics/responses.db",   # optional, GraphQL answers
+        "intervals": {"overview": 3600, "web_analytics": 300, "traffics": 300},
+        "sink": {"type": "sqlite", "path": "/var/lib/cfmetrics/metrics.db"},
+        "exporter": {"port": 9101},         # optional, Prometheus /metrics
+        "accounts": [
+            {"account_id": "...", "zones": ["..."], "datasets": ["overview", "web_analytics"]},
+            {"account_id": "...", "zones": ["..."], "datasets": ["traffics"], "status": true}
+        ]
+    }
+
+"status": true asks the traffics with the 4xx and 5xx counts (get_traffics status=True),
+the exporter needs it for cloudflare_traffic_errors
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from cfmetrics import Auth, query
+from cfmetrics.transport import Config
+from cfmetrics.cache import SqliteCache, ResponseCache
+from cfmetrics.state import StateStore, DATASETS
+from cfmetrics.store import MetricStore
+from cfmetrics.exporter import Exporter
+
+logger = logging.getLogger(__name__)
+
+# seconds between two collections of a zone, per dataset
+INTERVALS = {"overview": 3600, "web_analytics": 300, "traffics": 300}
+
+
+class JsonLinesSink:
+    """
+    One JSON line per collected window, path "-" writes to stdout
+    """
+
+    def __init__(self, path: str = "-"):
+        self.lock = threading.Lock()
+        self.file = sys.stdout if path == "-" else open(path, "a")
+
+    def write(self, zone_id: str, dataset: str, dataCompiled):
+        line = json.dumps({
+            "zone_id": zone_id,
+            "dataset": dataset,
+            "collected_at": datetime.utcnow().strftime(query.DATETIME_FORMAT),
+            "data": dataCompiled
+        })
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+# a sink is anything with write(zone_id, dataset, dataCompiled), like MetricStore,
+# other ones are given as "package.module:Class" in the config
+SINKS = {"jsonl": JsonLinesSink, "sqlite": MetricStore}
+
+
+class Sinks:
+    """
+    Write to every sink of the list
+    """
+
+    def __init__(self, sinks: list):
+        self.sinks = sinks
+
+    def write(self, zone_id: str, dataset: str, dataCompiled):
+        for sink in self.sinks:
+            sink.write(zone_id, dataset, dataCompiled)
+
+    def close(self):
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close()
+
+
+def load_sink(options: dict = None):
+    options = dict(options or {"type": "jsonl"})
+    kind = options.pop("type", "jsonl")
+
+    if kind in SINKS:
+        return SINKS[kind](**options)
+
+    module, _, name = kind.partition(":")
+    if not name:
+        raise ValueError(f"Unknown sink {kind}, expected one of {', '.join(SINKS)} or package.module:Class")
+    return getattr(importlib.import_module(module), name)(**options)
+
+
+def load_config(path: str):
+    with open(path) as f:
+        config = json.load(f)
+
+    config.setdefault("api_key", os.getenv("CF_API_KEY"))
+    config.setdefault("api_key_email", os.getenv("CF_HEADER_EMAIL"))
+    check_config(config)
+
+    return config
+
+
+def check_config(config: dict):
+    if not config.get("api_key") or not config.get("api_key_email"):
+        raise ValueError("api_key and api_key_email are required, set them in the config or CF_API_KEY and CF_HEADER_EMAIL")
+    if not config.get("accounts"):
+        raise ValueError("At least one account is required")
+
+    for account in config["accounts"]:
+        if not account.get("account_id"):
+            raise ValueError(f"account_id is missing in {account}")
+        for dataset in account.get("datasets", DATASETS):
+            if dataset not in DATASETS:
+                raise ValueError(f"Unknown dataset {dataset}, expected one of {', '.join(DATASETS)}")
+
+
+class Job:
+
+    def __init__(self, account_id: str, zone_id: str, dataset: str, interval: float, status: bool = False):
+        self.account_id = account_id
+        self.zone_id = zone_id
+        self.dataset = dataset
+        self.interval = interval
+        self.status = status
+        self.due = 0
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+
+
+class Daemon:
+
+    def __init__(self, config: dict, sink=None, auth: Auth = None):
+        check_config(config)
+        self.config = config
+        self.workers = int(config.get("workers", 4))
+        if self.workers < 1:
+            raise ValueError("workers must be at least 1")
+
+        if auth is None:
+            cache = SqliteCache(config["cache"]) if config.get("cache") else None
+            responseCache = ResponseCache(config["response_cache"]) if config.get("response_cache") else None
+            auth = Auth(config["api_key"], config["api_key_email"], config=Config(config.get("api_url", Config().cf_api_url)),
+                        pool_size=max(10, self.workers), max_inflight=self.workers, cache=cache, response_cache=responseCache)
+        self.auth = auth
+        self.state = StateStore(config.get("state", ":memory:"))
+        # with an exporter and no sink in the config the exporter is the only sink
+        self.exporter = Exporter() if config.get("exporter") is not None else None
+        if sink is None and (self.exporter is None or config.get("sink") is not None):
+            sink = load_sink(config.get("sink"))
+        sinks = [item for item in (sink, self.exporter) if item is not None]
+        self.sink = sinks[0] if len(sinks) == 1 else Sinks(sinks)
+        self.stopping = threading.Event()
+
+        intervals = {**INTERVALS, **config.get("intervals", {})}
+        self.jobs = [
+            Job(account["account_id"], zone_id, dataset, float(intervals[dataset]), bool(account.get("status")))
+            for account in config["accounts"]
+            for zone_id in account.get("zones", [])
+            for dataset in account.get("datasets", DATASETS)
+        ]
+
+    def run_job(self, job: Job):
+        try:
+            zone = self.auth.Account(job.account_id).Zone(job.zone_id)
+            zone.collect(job.dataset, self.state, store=self.sink, status=job.status)
+        except Exception:
+            job.failures += 1
+            logger.exception("Failed to collect %s of zone %s", job.dataset, job.zone_id)
+        finally:
+            job.runs += 1
+            job.running = False
+
+    def run_pending(self, executor):
+        """
+        Submit the jobs that are due and not running anymore, returns the seconds until the next one is due
+        """
+
+        now = time.monotonic()
+        for job in self.jobs:
+            if job.due <= now and not job.running:
+                job.running = True
+                job.due = now + job.interval
+                executor.submit(self.run_job, job)
+
+        return max(0, min((job.due for job in self.jobs), default=now + 1) - now)
+
+    def run(self, once: bool = False):
+        """
+        Collect until stop() is called, with once=True every job runs one time
+        """
+
+        if self.exporter is not None and self.exporter.server is None:
+            options = self.config["exporter"]
+            self.exporter.serve(options.get("host", "0.0.0.0"), int(options.get("port", 9101)))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while not self.stopping.is_set():
+                wait = self.run_pending(executor)
+                if once:
+                    break
+                self.stopping.wait(min(wait, 1))
+
+    def stop(self):
+        self.stopping.set()
+
+    def close(self):
+        self.auth.close()
+        self.state.close()
+        if hasattr(self.sink, "close"):
+            self.sink.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cfmetrics", description="Collect Cloudflare analytics of the configured zones")
+    parser.add_argument("config", help="path of the JSON config")
+    parser.add_argument("--once", action="store_true", help="collect every zone one time and exit")
+    args = parser.parse_args(argv)
+    # the library only logs, the command decides where it goes
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    daemon = Daemon(load_config(args.config))
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+        signal.signal(signal.SIGINT, lambda *_: daemon.stop())
+
+    try:
+        daemon.run(once=args.once)
+    finally:
+        daemon.close()
+
+    return 0
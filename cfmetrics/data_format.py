@@ -1,68 +1,417 @@
+import json
+from datetime import datetime, timedelta
+from cfmetrics.query import DATE_FORMAT, DATETIME_FORMAT, parse_resolution
 
-def model(dataResult, dataSource):
-
-    dataCompiled = {"by_date":{"date_lists": [], "dates": []}, 
-                    "by_domain": {"domain_lists": [], "domains": []}}
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
+def _payload(dataResult):
+    # a response object or the body that was already decoded from it
+    if isinstance(dataResult, dict):
+        return dataResult
     if not hasattr(dataResult, "json"):
         raise ValueError("Expected dataResult to have a .json() method")
 
-    dataMetric = dataResult.json()["data"]["viewer"]["zones" if dataSource == "traffic" else "accounts"][0]["series"]
-    for item in dataMetric:
-        
-        if dataSource == "traffic":
-            metricsData = {
-                "page_views": item["count"],
-                "requests": item["sum"]["visits"],
-                "data_transfer_bytes": item["sum"]["edgeResponseBytes"],
-                #"error_counts": 0
+    return dataResult.json()
+
+
+def _series(dataResult, dataSource):
+    return _payload(dataResult)["data"]["viewer"]["zones" if dataSource == "traffic" else "accounts"][0]["series"]
+
+
+def dimensions_key(item):
+    # the same dimensions are the same row, whatever window or answer it came from
+    return tuple(sorted(item["dimensions"].items()))
+
+
+def merge_series(rows):
+    """
+    Merge the rows of several sub window answers, rows with the same dimensions
+    are added together (count and sum) and avg is weighted by count
+    """
+
+    merged = {}
+    for item in rows:
+        key = dimensions_key(item)
+        current = merged.get(key)
+        if current is None:
+            merged[key] = {
+                **item,
+                "sum": dict(item.get("sum", {})),
+                "avg": dict(item.get("avg", {}))
             }
-            source = "zones"
-        elif dataSource == "rum":
-            metricsData = {
-                "page_views": item["count"],
-                "visits": item["sum"]["visits"]
+            continue
+
+        total = current["count"] + item["count"]
+        for name, value in item.get("avg", {}).items():
+            if total and name in current["avg"]:
+                current["avg"][name] = (current["avg"][name] * current["count"] + value * item["count"]) / total
+        for name, value in item.get("sum", {}).items():
+            current["sum"][name] = current["sum"].get(name, 0) + value
+        current["count"] = total
+
+    return list(merged.values())
+
+
+def fold_status(items):
+    """
+    Fold the series items of a status=True traffic query into one item per date
+    and host, the 200 rows are the page views like without status and the count
+    of the 4xx and 5xx rows goes in item["errors"]
+    """
+
+    folded = {}
+    for item in items:
+        dimensions = item["dimensions"]
+        key = (dimensions["ts"], dimensions["host"])
+        current = folded.get(key)
+        if current is None:
+            current = folded[key] = {
+                "count": 0,
+                "sum": {"visits": 0, "edgeResponseBytes": 0},
+                "errors": {"all": 0, "4xx": 0, "5xx": 0},
+                "dimensions": {"host": dimensions["host"], "ts": dimensions["ts"]}
             }
-            source = "accounts"
 
-        ts = item["dimensions"]["ts"]
-        domainName = item["dimensions"]["host"]
+        status = dimensions["status"]
+        if status < 400:
+            current["count"] += item["count"]
+            for name, value in item["sum"].items():
+                current["sum"][name] = current["sum"].get(name, 0) + value
+        else:
+            current["errors"]["all"] += item["count"]
+            current["errors"][f"{status // 100}xx"] = current["errors"].get(f"{status // 100}xx", 0) + item["count"]
 
-        if ts not in dataCompiled["by_date"]["date_lists"]:
-            dataCompiled["by_date"]["dates"].append({
-                    "date": ts,
-                    "domains": [],
-                    "domain_lists": []
-            })
+    return folded.values()
+
+
+def _metrics(item, dataSource):
+    if dataSource == "traffic":
+        metrics = {
+            "page_views": item["count"],
+            "requests": item["sum"]["visits"],
+            "data_transfer_bytes": item["sum"]["edgeResponseBytes"]
+        }
+        errors = item.get("errors")
+        if errors is not None:
+            metrics["error_counts"] = errors["all"]
+            metrics["status_4xx"] = errors["4xx"]
+            metrics["status_5xx"] = errors["5xx"]
+        return metrics
+    elif dataSource == "rum":
+        return {
+            "page_views": item["count"],
+            "visits": item["sum"]["visits"]
+        }
+
+
+def _compile(rows):
+    """
+    Build the by_date and by_domain views in one pass over (date, domain, metrics) rows,
+    the dicts keep the position of every date and domain so no list is scanned
+    """
+
+    dataCompiled = {"by_date":{"date_lists": [], "dates": []}, 
+                    "by_domain": {"domain_lists": [], "domains": []}}
+
+    dateIndex = {}
+    domainIndex = {}
+    seen = set()
+
+    for ts, domainName, metricsData in rows:
+
+        # the first row of a date and domain pair wins, same as before
+        if (ts, domainName) in seen:
+            continue
+        seen.add((ts, domainName))
+
+        dateData = dateIndex.get(ts)
+        if dateData is None:
+            dateData = {"date": ts, "domains": [], "domain_lists": []}
+            dateIndex[ts] = dateData
+            dataCompiled["by_date"]["dates"].append(dateData)
             dataCompiled["by_date"]["date_lists"].append(ts)
-                
-        currDateIndex = dataCompiled["by_date"]["date_lists"].index(ts)
-
-        if domainName not in dataCompiled["by_date"]["dates"][currDateIndex]["domain_lists"]:
-            dataCompiled["by_date"]["dates"][currDateIndex]["domain_lists"].append(domainName)
-            dataCompiled["by_date"]["dates"][currDateIndex]["domains"].append({
-                "name": domainName,
-                "metrics": metricsData 
-            })
-
-        if domainName not in dataCompiled["by_domain"]["domain_lists"]:
-            dataCompiled["by_domain"]["domains"].append({
-                    "name": domainName,
-                    "dates": [],
-                    "date_lists": []
-            })
+
+        dateData["domain_lists"].append(domainName)
+        dateData["domains"].append({
+            "name": domainName,
+            "metrics": metricsData
+        })
+
+        domainData = domainIndex.get(domainName)
+        if domainData is None:
+            domainData = {"name": domainName, "dates": [], "date_lists": []}
+            domainIndex[domainName] = domainData
+            dataCompiled["by_domain"]["domains"].append(domainData)
             dataCompiled["by_domain"]["domain_lists"].append(domainName)
 
-        currDomainIndex = dataCompiled["by_domain"]["domain_lists"].index(domainName)
+        domainData["date_lists"].append(ts)
+        domainData["dates"].append({
+            "date": ts,
+            "metrics": metricsData
+        })
+
+    return dataCompiled
+
+
+def series_rows(dataResult, dataSource):
+    """
+    The (date, domain, metrics) rows of a GraphQL series answer
+    """
+
+    return item_rows(_series(dataResult, dataSource), dataSource)
+
+
+def item_rows(items, dataSource):
+    for item in items:
+        yield item["dimensions"]["ts"], item["dimensions"]["host"], _metrics(item, dataSource)
+
+
+def flat_rows(items, dataSource):
+    """
+    One {date, host, metric...} dict per series item, for exports, made while
+    items is iterated
+    """
+    for ts, domainName, metricsData in item_rows(items, dataSource):
+        yield {"date": ts, "host": domainName, **metricsData}
+
+
+def model(dataResult, dataSource):
+    return _compile(series_rows(dataResult, dataSource))
+
+
+def model_items(items, dataSource):
+    """
+    model() for series items that come one by one, e.g. from stream_series
+    """
+    return _compile(item_rows(items, dataSource))
+
+
+class Counted:
+    """
+    Iterate over items and count them, to know afterwards if the answer hit the row limit
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.count = 0
 
-        if ts not in dataCompiled["by_domain"]["domains"][currDomainIndex]["date_lists"]:
-            dataCompiled["by_domain"]["domains"][currDomainIndex]["date_lists"].append(ts)
-            dataCompiled["by_domain"]["domains"][currDomainIndex]["dates"].append({
-                "date": ts,
-                "metrics": metricsData
-            })
+    def __iter__(self):
+        for item in self.items:
+            self.count += 1
+            yield item
 
 
+class _Recorder:
+    """
+    File like wrapper that keeps what was read until the first series item came,
+    so an answer without series (e.g. "data": null) can still be checked
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.chunks = []
+        self.recording = True
+
+    def record(self, data):
+        if self.recording:
+            self.chunks.append(data)
+        return data
+
+    def read(self, size=-1):
+        return self.record(self.raw.read(size))
+
+    def stop(self):
+        self.recording = False
+        self.chunks = []
+
+    def check(self):
+        # nothing came, the answer is read again to see why
+        if self.recording:
+            dataResult = json.loads(b"".join(self.chunks))
+            if dataResult.get("data") is None:
+                raise ValueError(f"There is no data Response, maybe check the response {dataResult}")
+
+
+class _AsyncRecorder(_Recorder):
+
+    async def read(self, size=-1):
+        return self.record(await self.raw.read(size))
+
+
+def _series_prefix(dataSource):
+    return f"data.viewer.{'zones' if dataSource == 'traffic' else 'accounts'}.item.series.item"
+
+
+def stream_series(response, dataSource):
+    """
+    Yield the series items of a GraphQL answer while the body is read, the
+    response has to be sent with stream=True. Without ijson the body is
+    decoded in one go like before
+    """
+
+    if ijson is None:
+        yield from _series(response, dataSource)
+        return
+
+    response.raw.decode_content = True
+    recorder = _Recorder(response.raw)
+
+    for item in ijson.items(recorder, _series_prefix(dataSource), use_float=True):
+        if recorder.recording:
+            recorder.stop()
+        yield item
+
+    recorder.check()
+
+
+async def stream_series_async(response, dataSource):
+    """
+    stream_series for an aio.AsyncResponse sent with stream=True, an async generator
+    """
+
+    if ijson is None:
+        for item in _series(json.loads(await response.raw.content.read()), dataSource):
+            yield item
+        return
+
+    recorder = _AsyncRecorder(response.raw.content)
+
+    async for item in ijson.items_async(recorder, _series_prefix(dataSource), use_float=True):
+        if recorder.recording:
+            recorder.stop()
+        yield item
+
+    recorder.check()
+
+
+def overview(dataResult):
+    """
+    Format the httpRequestsXGroups answer of query.query_zone_overview
+    """
+
+    dataCompiled = {
+        "totalUniqueUsers": {},
+        "by_date": {
+            "dates": [],
+            "date_lists": []
+        }
+    }
+
+    try:
+        dataMetric = _payload(dataResult)["data"]["viewer"]["zones"][0]
+        dataCompiled["totalUniqueUsers"] = dataMetric["totals"][0]["uniq"]["uniques"]
+        seen = set()
+        for item in dataMetric["zones"]:
+            ts = item["dimensions"]["timeslot"]
+            if ts not in seen:
+                seen.add(ts)
+                dataCompiled["by_date"]["dates"].append({
+                    "date": ts,
+                    "metrics": {
+                        "browserMap": item["sum"]["browserMap"],
+                        "bytes": item["sum"]["bytes"],
+                        "cachedBytes": item["sum"]["cachedBytes"],
+                        "cachedRequests": item["sum"]["cachedRequests"],
+                        "contentTypeMap": item["sum"]["contentTypeMap"],
+                        "countryMap": item["sum"]["countryMap"],
+                        "pageViews": item["sum"]["pageViews"],
+                        "requests": item["sum"]["requests"],
+                        "responseStatusMap": item["sum"]["responseStatusMap"],
+                        "threatPathingMap": item["sum"]["threatPathingMap"],
+                        "threats": item["sum"]["threats"]
+                    }
+                })
+                dataCompiled["by_date"]["date_lists"].append(ts)
+    except (KeyError, IndexError, TypeError):
+        return "Data is Missing or Invalid"
+
     return dataCompiled
 
 
+# the [{key, ...}] lists of an overview bucket
+OVERVIEW_MAPS = ("browserMap", "contentTypeMap", "countryMap", "responseStatusMap", "threatPathingMap")
+
+EPOCH = datetime(1970, 1, 1)
+# the epoch was a Thursday, whole weeks are counted from the Monday before it
+WEEK_EPOCH = datetime(1969, 12, 29)
+
+
+def merge_maps(maps):
+    """
+    Add the [{key, requests, bytes...}] lists of several buckets together by key
+    """
+
+    merged = {}
+    for entries in maps:
+        for entry in entries or []:
+            current = merged.get(entry["key"])
+            if current is None:
+                merged[entry["key"]] = dict(entry)
+                continue
+            for name, value in entry.items():
+                if name != "key":
+                    current[name] = current.get(name, 0) + value
+
+    return list(merged.values())
+
+
+def bucket_of(ts: str, seconds: int):
+    """
+    The start of the bucket of seconds (counted from the epoch, UTC) a timeslot is in,
+    buckets of whole weeks start on a Monday
+    """
+
+    anchor = WEEK_EPOCH if seconds % (7 * 86400) == 0 else EPOCH
+    moment = datetime.strptime(ts, DATETIME_FORMAT if "T" in ts else DATE_FORMAT)
+    offset = int((moment - anchor).total_seconds())
+    start = anchor + timedelta(seconds=offset - offset % seconds)
+    return start.strftime(DATE_FORMAT if seconds % 86400 == 0 else DATETIME_FORMAT)
+
+
+def rollup_overview(dataCompiled, resolution: str):
+    """
+    Roll the buckets of an overview up into coarser ones, e.g. the 1h overview
+    into 6h or 1d buckets. The numbers are added and the maps merged by key,
+    totalUniqueUsers covers the whole window so it stays as is
+    the buckets are counted from 1970-01-01 UTC, so a day starts at midnight UTC
+    and 6h at 00, 06, 12 and 18, whole weeks (7d, 14d...) start on a Monday
+    """
+
+    seconds = parse_resolution(resolution)
+    buckets = {}
+    for item in dataCompiled["by_date"]["dates"]:
+        buckets.setdefault(bucket_of(item["date"], seconds), []).append(item["metrics"])
+
+    dates = []
+    for ts in sorted(buckets):
+        metricsList = buckets[ts]
+        metrics = {}
+        for name in metricsList[0]:
+            values = [itemMetrics.get(name) for itemMetrics in metricsList]
+            metrics[name] = merge_maps(values) if name in OVERVIEW_MAPS else sum(value or 0 for value in values)
+        dates.append({"date": ts, "metrics": metrics})
+
+    return {
+        "totalUniqueUsers": dataCompiled["totalUniqueUsers"],
+        "by_date": {
+            "dates": dates,
+            "date_lists": [item["date"] for item in dates]
+        }
+    }
+
+
+def overviews(dataResult, zone_ids):
+    """
+    Split the answer of query.query_zones_overview into {zone_id: overview}
+    every overview is the same as the one of the single zone query
+    """
+
+    viewer = _payload(dataResult)["data"]["viewer"]
+    dataCompiled = {}
+    for i, zone_id in enumerate(zone_ids):
+        dataCompiled[zone_id] = overview({"data": {"viewer": {"zones": viewer.get(f"zone{i}") or []}}})
+
+    return dataCompiled
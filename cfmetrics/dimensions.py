@@ -0,0 +1,220 @@
+"""
+Mergeable aggregates of the overview maps (countryMap, browserMap, ...)
+
+The keys of every map are interned once per process, so a DimensionMap is one
+array of counters per field indexed by the key id. Adding or subtracting two
+maps adds the arrays and never looks at a key name, it is O(keys) whatever the
+number of days or zones that went into them.
+
+    maps = overview_maps(zone.get_overview("2025-01-01", "2025-04-01"))
+    maps["countryMap"].top(10)
+
+    # every zone of the account
+    countries = sum(overview_maps(overview)["countryMap"] for overview in account.get_overviews(zone_ids).values())
+"""
+import heapq
+import threading
+from array import array
+
+# the counters of every overview map, see query.OVERVIEW_FIELDS
+MAP_FIELDS = {
+    "browserMap": ("pageViews",),
+    "contentTypeMap": ("bytes",),
+    "countryMap": ("requests", "bytes", "threats"),
+    "responseStatusMap": ("requests",),
+    "threatPathingMap": ("requests",),
+}
+
+_COUNTER_BYTES = array("q").itemsize
+
+
+class Keys:
+    """
+    The id of every key of a map, ids are given in order and never change
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.lock = threading.Lock()
+
+    def id(self, key):
+        found = self.ids.get(key)
+        if found is not None:
+            return found
+
+        with self.lock:
+            found = self.ids.get(key)
+            if found is None:
+                found = self.ids[key] = len(self.names)
+                self.names.append(key)
+            return found
+
+    def __len__(self):
+        return len(self.names)
+
+
+_keys = {}
+_keysLock = threading.Lock()
+
+
+def keys_of(name: str):
+    with _keysLock:
+        keys = _keys.get(name)
+        if keys is None:
+            keys = _keys[name] = Keys()
+        return keys
+
+
+class DimensionMap:
+    """
+    The counters of one map (e.g. countryMap) added up over any number of
+    buckets, days or zones. Maps of the same name share their key ids, so they
+    can be merged and subtracted with + and -
+    """
+
+    __slots__ = ("name", "fields", "keys", "counters")
+
+    def __init__(self, name: str, fields: tuple = None):
+        if fields is None and name not in MAP_FIELDS:
+            raise ValueError(f"Unknown map {name}, give its fields or use one of {', '.join(MAP_FIELDS)}")
+
+        self.name = name
+        self.fields = tuple(fields or MAP_FIELDS[name])
+        self.keys = keys_of(name)
+        self.counters = {field: array("q") for field in self.fields}
+
+    @classmethod
+    def from_entries(cls, name: str, entries, fields: tuple = None):
+        """
+        From the [{key, requests, bytes...}] list of an overview bucket
+        """
+        return cls(name, fields).add(entries)
+
+    def _size(self):
+        return len(self.counters[self.fields[0]]) if self.fields else 0
+
+    def _grow(self, size: int):
+        missing = size - self._size()
+        if missing > 0:
+            for column in self.counters.values():
+                column.frombytes(bytes(_COUNTER_BYTES * missing))
+
+    def add(self, entries):
+        for entry in entries or []:
+            i = self.keys.id(entry["key"])
+            if i >= self._size():
+                self._grow(len(self.keys))
+            for field in self.fields:
+                self.counters[field][i] += int(entry.get(field) or 0)
+        return self
+
+    def _check(self, other):
+        if not isinstance(other, DimensionMap) or other.name != self.name or other.fields != self.fields:
+            raise ValueError(f"Can't combine {self!r} with {other!r}")
+
+    def _combine(self, other, sign: int):
+        self._check(other)
+        self._grow(other._size())
+        for field in self.fields:
+            mine = self.counters[field]
+            for i, value in enumerate(other.counters[field]):
+                if value:
+                    mine[i] += sign * value
+        return self
+
+    def merge(self, other):
+        """
+        Add other to this map in place
+        """
+        return self._combine(other, 1)
+
+    def subtract(self, other):
+        """
+        Take other out of this map in place, e.g. the day that left a rolling window
+        """
+        return self._combine(other, -1)
+
+    def copy(self):
+        copied = DimensionMap(self.name, self.fields)
+        copied.counters = {field: array("q", column) for field, column in self.counters.items()}
+        return copied
+
+    def __add__(self, other):
+        return self.copy().merge(other)
+
+    def __radd__(self, other):
+        # so sum() of maps works
+        if other == 0:
+            return self.copy()
+        return self.copy().merge(other)
+
+    def __sub__(self, other):
+        return self.copy().subtract(other)
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __isub__(self, other):
+        return self.subtract(other)
+
+    def _values(self, i: int):
+        return {field: self.counters[field][i] for field in self.fields}
+
+    def _present(self):
+        return (i for i in range(self._size()) if any(self.counters[field][i] for field in self.fields))
+
+    def get(self, key, default=None):
+        i = self.keys.ids.get(key)
+        if i is None or i >= self._size():
+            return default
+        return self._values(i)
+
+    def top(self, n: int = 10, field: str = None):
+        """
+        [(key, {field: value})] of the n keys with the most of field (the first field by default)
+        """
+
+        column = self.counters[field or self.fields[0]]
+        ids = heapq.nlargest(n, (i for i, value in enumerate(column) if value), key=column.__getitem__)
+        return [(self.keys.names[i], self._values(i)) for i in ids]
+
+    def totals(self):
+        return {field: sum(column) for field, column in self.counters.items()}
+
+    def to_entries(self):
+        """
+        Back to the [{key, ...}] list of the overview
+        """
+        return [{"key": self.keys.names[i], **self._values(i)} for i in self._present()]
+
+    def __len__(self):
+        return sum(1 for _ in self._present())
+
+    def __eq__(self, other):
+        if not isinstance(other, DimensionMap):
+            return NotImplemented
+        return self.name == other.name and self.fields == other.fields and self.to_entries() == other.to_entries()
+
+    def __reduce__(self):
+        # key ids only mean something inside one process, so it travels as entries
+        return (DimensionMap.from_entries, (self.name, self.to_entries(), self.fields))
+
+    def __repr__(self):
+        return f"DimensionMap({self.name!r}, {len(self)} keys)"
+
+
+def overview_maps(dataCompiled, start: str = None, end: str = None, names=tuple(MAP_FIELDS)):
+    """
+    {map name: DimensionMap} of the buckets of a get_overview result between
+    start (included) and end (excluded), the whole result by default
+    """
+
+    maps = {name: DimensionMap(name) for name in names}
+    for item in dataCompiled["by_date"]["dates"]:
+        if (start is not None and item["date"] < start) or (end is not None and item["date"] >= end):
+            continue
+        for name, dimensionMap in maps.items():
+            dimensionMap.add(item["metrics"].get(name))
+
+    return maps
@@ -0,0 +1,102 @@
+"""
+Paging of the /zones/{zone_id}/dns_records listing
+
+The first page is asked without a type filter and with the biggest page size,
+small zones are done in that one call. For bigger zones the first page tells
+how many pages are left and which share of them are the wanted types, the
+rest is then listed either unfiltered or one type after the other, whichever
+needs fewer calls
+"""
+import math
+
+# the biggest per_page the dns_records listing accepts
+PAGE_SIZE = 5000
+
+RECORD_TYPES = ("A", "CNAME")
+
+
+def listing_params(page: int = 1, record_type: str = None):
+    params = {"page": page, "per_page": PAGE_SIZE}
+    if record_type is not None:
+        params["type"] = record_type
+    return params
+
+
+def total_pages(info):
+    if not info:
+        return 1
+    if info.get("total_pages"):
+        return int(info["total_pages"])
+    if info.get("total_count") is not None:
+        return max(1, math.ceil(int(info["total_count"]) / int(info.get("per_page") or PAGE_SIZE)))
+    return 1
+
+
+def next_pages(info, record_type: str = None):
+    # the params of the pages after the first one
+    return [listing_params(page, record_type) for page in range(2, total_pages(info) + 1)]
+
+
+def keep(records, types):
+    return [record for record in records if record.get("type") in types]
+
+
+def choose_listing(records, info, types):
+    """
+    "done" when the first unfiltered page had everything, otherwise "all" to keep
+    listing every record or "typed" to list each type by itself
+    """
+
+    pages = total_pages(info)
+    if pages <= 1:
+        return "done"
+
+    # guess how many pages every type needs from the share it has in the first page
+    total = int(info.get("total_count") or pages * PAGE_SIZE)
+    typedPages = 0
+    for record_type in types:
+        share = sum(1 for record in records if record.get("type") == record_type) / max(1, len(records))
+        typedPages += max(1, math.ceil(share * total / PAGE_SIZE))
+
+    return "typed" if typedPages < pages - 1 else "all"
+
+
+def zone_index(zones):
+    """
+    {zone name: zone id} of an Account.zones() listing
+    """
+
+    return {zone["name"].lower().rstrip("."): zone["id"] for zone in zones}
+
+
+def zone_of(host: str, index: dict):
+    """
+    The id of the zone a host belongs to, the longest zone name the host ends with
+    """
+
+    labels = host.lower().rstrip(".").split(".")
+    for i in range(len(labels)):
+        zone_id = index.get(".".join(labels[i:]))
+        if zone_id is not None:
+            return zone_id
+    return None
+
+
+def partition(items, index: dict, zone_ids: list = None, hosts: dict = None):
+    """
+    {zone_id: [series items]} of an account wide series, items of a host that is
+    in none of the zones, or not in hosts[zone_id] when hosts is given, are dropped
+    """
+
+    partitioned = {zone_id: [] for zone_id in (zone_ids if zone_ids is not None else index.values())}
+    zoneOf = {}
+    for item in items:
+        host = item["dimensions"]["host"]
+        if host not in zoneOf:
+            zoneOf[host] = zone_of(host, index)
+        zone_id = zoneOf[host]
+        if zone_id is None or zone_id not in partitioned or (hosts is not None and host.lower() not in hosts[zone_id]):
+            continue
+        partitioned[zone_id].append(item)
+
+    return partitioned
@@ -0,0 +1,160 @@
+"""
+Prometheus exporter
+
+The Exporter is a sink of the daemon (see cfmetrics.daemon), so the zones are
+collected in the background at the intervals of the config and a scrape of
+/metrics only sends the text that was rendered when the last result came in.
+Every gauge is the value of the most recent date of its dataset.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# name, help and the dataset of every metric, in the order they are rendered
+METRICS = [
+    ("cloudflare_zone_requests", "Requests of the zone", "overview"),
+    ("cloudflare_zone_bytes", "Bytes served by the zone", "overview"),
+    ("cloudflare_zone_cached_bytes", "Bytes served from the cache", "overview"),
+    ("cloudflare_zone_cached_requests", "Requests served from the cache", "overview"),
+    ("cloudflare_zone_page_views", "Page views of the zone", "overview"),
+    ("cloudflare_zone_threats", "Threats of the zone", "overview"),
+    ("cloudflare_zone_country_requests", "Requests of the zone by country", "overview"),
+    ("cloudflare_zone_country_bytes", "Bytes served by the zone by country", "overview"),
+    ("cloudflare_zone_country_threats", "Threats of the zone by country", "overview"),
+    ("cloudflare_zone_status_requests", "Requests of the zone by response status", "overview"),
+    ("cloudflare_traffic_page_views", "html pages answered with 200 by host", "traffics"),
+    ("cloudflare_traffic_requests", "Visits by host", "traffics"),
+    ("cloudflare_traffic_bytes", "Bytes of the html pages by host", "traffics"),
+    ("cloudflare_traffic_errors", "html pages answered with 4xx or 5xx by host", "traffics"),
+    ("cloudflare_rum_page_views", "Browser page loads by host", "web_analytics"),
+    ("cloudflare_rum_visits", "Browser visits by host", "web_analytics"),
+    ("cloudflare_exporter_last_update_timestamp_seconds", "When the dataset of the zone was last collected", None),
+]
+
+OVERVIEW_TOTALS = {
+    "requests": "cloudflare_zone_requests",
+    "bytes": "cloudflare_zone_bytes",
+    "cachedBytes": "cloudflare_zone_cached_bytes",
+    "cachedRequests": "cloudflare_zone_cached_requests",
+    "pageViews": "cloudflare_zone_page_views",
+    "threats": "cloudflare_zone_threats",
+}
+
+SERIES_METRICS = {
+    "traffics": {"page_views": "cloudflare_traffic_page_views", "requests": "cloudflare_traffic_requests", "data_transfer_bytes": "cloudflare_traffic_bytes", "error_counts": "cloudflare_traffic_errors"},
+    "web_analytics": {"page_views": "cloudflare_rum_page_views", "visits": "cloudflare_rum_visits"},
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name, labels, value):
+    labelText = ",".join(f'{key}="{_escape(item)}"' for key, item in labels.items())
+    return f"{name}{{{labelText}}} {value}"
+
+
+def samples(zone_id: str, dataset: str, dataCompiled):
+    """
+    {metric: [sample lines]} of the most recent date of a result
+    """
+
+    lines = {}
+    dates = dataCompiled["by_date"]["dates"]
+    if not dates:
+        return lines
+    latest = max(dates, key=lambda dateData: dateData["date"])
+
+    if dataset == "overview":
+        metrics = latest["metrics"]
+        for key, name in OVERVIEW_TOTALS.items():
+            if metrics.get(key) is not None:
+                lines.setdefault(name, []).append(_sample(name, {"zone_id": zone_id}, metrics[key]))
+        for country in metrics.get("countryMap") or []:
+            for key in ("requests", "bytes", "threats"):
+                name = f"cloudflare_zone_country_{key}"
+                lines.setdefault(name, []).append(_sample(name, {"zone_id": zone_id, "country": country["key"]}, country[key]))
+        for status in metrics.get("responseStatusMap") or []:
+            name = "cloudflare_zone_status_requests"
+            lines.setdefault(name, []).append(_sample(name, {"zone_id": zone_id, "status": status["key"]}, status["requests"]))
+        return lines
+
+    for domain in latest["domains"]:
+        for key, name in SERIES_METRICS[dataset].items():
+            if domain["metrics"].get(key) is not None:
+                lines.setdefault(name, []).append(_sample(name, {"zone_id": zone_id, "host": domain["name"]}, domain["metrics"][key]))
+
+    return lines
+
+
+class Exporter:
+    """
+    Keeps the samples of the last result of every zone and dataset and the
+    rendered /metrics body, write() is the sink interface of the daemon
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.updated = {}
+        self.body = b""
+        self.server = None
+
+    def write(self, zone_id: str, dataset: str, dataCompiled, now: float = None):
+        zoneSamples = samples(zone_id, dataset, dataCompiled)
+        with self.lock:
+            self.samples[(zone_id, dataset)] = zoneSamples
+            self.updated[(zone_id, dataset)] = now if now is not None else time.time()
+            self.body = self.render()
+
+    def render(self):
+        text = []
+        for name, help, dataset in METRICS:
+            if dataset is None:
+                lines = [_sample(name, {"zone_id": zone_id, "dataset": zoneDataset}, f"{updated:.3f}") for (zone_id, zoneDataset), updated in sorted(self.updated.items())]
+            else:
+                lines = [line for key in sorted(self.samples) for line in self.samples[key].get(name, [])]
+            if not lines:
+                continue
+            text.append(f"# HELP {name} {help}")
+            text.append(f"# TYPE {name} gauge")
+            text.extend(lines)
+
+        return ("\n".join(text) + "\n").encode() if text else b""
+
+    def serve(self, host: str = "0.0.0.0", port: int = 9101):
+        """
+        Serve /metrics on a background thread, returns the (host, port) it listens on
+        """
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.body
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.5}, daemon=True).start()
+        return self.server.server_address
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
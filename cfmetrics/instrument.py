@@ -0,0 +1,156 @@
+"""
+Timing of what a call spends its time on
+
+Every HTTP request of the transport and every formatting stage of Zone is a
+span, the spans are added up in Stats and given to the hooks. With a tracer
+(e.g. opentelemetry.trace.get_tracer("cfmetrics")) every span is also an
+OpenTelemetry span, opentelemetry itself is not needed otherwise.
+
+    def slow(span):
+        if span.duration > 1:
+            print(span.name, span.label, span.attributes)
+
+    cf = Auth(CF_APIKEY, CF_EMAIL, instrumentation=Instrumentation(hooks=[slow]))
+    ...
+    print(cf.instrumentation.stats.snapshot())
+"""
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from cfmetrics import data_format
+
+
+class Span:
+    __slots__ = ("name", "label", "attributes", "start", "duration", "error")
+
+    def __init__(self, name: str, label: str = None, attributes: dict = None):
+        self.name = name
+        self.label = label
+        self.attributes = attributes or {}
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+
+class Stats:
+    """
+    count, errors, seconds, max_seconds, bytes and rows of every "name:label"
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+
+    def record(self, span: Span):
+        key = span.name if span.label is None else f"{span.name}:{span.label}"
+        with self.lock:
+            total = self.totals.get(key)
+            if total is None:
+                total = self.totals[key] = {"count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0, "rows": 0}
+            total["count"] += 1
+            total["errors"] += span.error is not None
+            total["seconds"] += span.duration
+            total["max_seconds"] = max(total["max_seconds"], span.duration)
+            total["bytes"] += span.attributes.get("bytes") or 0
+            total["rows"] += span.attributes.get("rows") or 0
+
+    def snapshot(self, reset: bool = False):
+        with self.lock:
+            snapshot = {key: dict(total) for key, total in self.totals.items()}
+            if reset:
+                self.totals = {}
+        return snapshot
+
+    def reset(self):
+        self.snapshot(reset=True)
+
+
+class Instrumentation:
+
+    def __init__(self, hooks: list = None, tracer=None):
+        self.hooks = list(hooks or [])
+        self.tracer = tracer
+        self.stats = Stats()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    @contextmanager
+    def span(self, name: str, label: str = None, **attributes):
+        span = Span(name, label, attributes)
+        otel = self.tracer.start_as_current_span(f"cfmetrics.{name}") if self.tracer is not None else None
+        otelSpan = otel.__enter__() if otel is not None else None
+        started = time.perf_counter()
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            if otelSpan is not None:
+                if label is not None:
+                    otelSpan.set_attribute("cfmetrics.label", label)
+                for key, value in span.attributes.items():
+                    if value is not None:
+                        otelSpan.set_attribute(f"cfmetrics.{key}", value)
+                otel.__exit__(type(error) if error else None, error, error.__traceback__ if error else None)
+
+            self.stats.record(span)
+            for hook in self.hooks:
+                hook(span)
+
+    def formatter(self, formatter, label: str):
+        """
+        formatter(items) in a "format" span that counts the rows it was given
+        """
+
+        def format(items):
+            with self.span("format", label) as span:
+                if isinstance(items, list):
+                    span.set("rows", len(items))
+                    return formatter(items)
+                items = data_format.Counted(items)
+                dataCompiled = formatter(items)
+                span.set("rows", items.count)
+                return dataCompiled
+
+        return format
+
+
+def url_class(url: str, graphql_url: str = None):
+    """
+    What kind of API call an url is, without the ids: graphql, zone, zones, dns_records, ...
+    """
+
+    if url == graphql_url:
+        return "graphql"
+
+    parts = [part for part in urlparse(url).path.split("/") if part]
+    if parts and parts[-1] == "graphql":
+        return "graphql"
+    if "zones" in parts:
+        rest = parts[parts.index("zones") + 1:]
+        if not rest:
+            return "zones"
+        return "zone" if len(rest) == 1 else rest[-1]
+    return parts[-1] if parts else "rest"
+
+
+def response_bytes(response):
+    """
+    The size of the body, without reading a streamed body
+    """
+
+    length = response.headers.get("Content-Length") if response.headers else None
+    if length is not None:
+        return int(length)
+    # requests.Response keeps the body in _content once it was read, AsyncResponse in content
+    content = vars(response).get("_content", vars(response).get("content"))
+    return len(content) if isinstance(content, bytes) else None
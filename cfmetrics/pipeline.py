@@ -0,0 +1,293 @@
+"""
+Export pipeline: rows from the fetchers, through the stages, into batching sinks
+
+A fetcher is an iterable of flat rows (dicts), traffic_rows, web_analytics_rows
+and overview_rows are the ones of the Zone methods and they only call the API
+when they are iterated. The traffic and web analytics rows are made while the
+GraphQL answer is parsed (stream=True), not after the whole window is in
+memory. The fetchers run on a few threads and put their rows in a bounded
+queue, the rows are taken out on the thread of run(), passed to every stage
+and given to every sink. A sink keeps batch_size rows before it
+writes them, when a sink is slow the queue fills up and the fetchers wait, so
+the memory doesn't depend on how many zones or days are exported.
+
+    fetchers = (traffic_rows(account.Zone(zone_id), start, end) for zone_id in zone_ids)
+    with NdjsonSink("traffics.ndjson") as ndjson, HttpBulkSink("http://localhost:8080/rows") as bulk:
+        Pipeline([ndjson, bulk], stages=[lambda row: row if row["page_views"] else None]).run(fetchers)
+
+A stage is a function row -> row, returning None drops the row.
+"""
+import csv
+import json
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+_DONE = object()
+
+
+def traffic_rows(zone, start_datetime: str, end_datetime: str, status: bool = False):
+    for row in zone.get_traffics(start_datetime, end_datetime, format="rows", stream=True, status=status):
+        yield {"zone_id": zone.zone_id, "dataset": "traffics", **row}
+
+
+def web_analytics_rows(zone, start_date: str, end_date: str):
+    for row in zone.get_web_analytics(start_date, end_date, format="rows", stream=True):
+        yield {"zone_id": zone.zone_id, "dataset": "web_analytics", **row}
+
+
+def overview_rows(zone, start_date: str, end_date: str, resolution: str = "1d"):
+    """
+    One row per bucket, the maps (countryMap, ...) stay lists
+    """
+
+    dataCompiled = zone.get_overview(start_date, end_date, resolution=resolution)
+    if not isinstance(dataCompiled, dict):
+        raise ValueError(f"Overview of zone {zone.zone_id} failed: {dataCompiled}")
+
+    for item in dataCompiled["by_date"]["dates"]:
+        yield {"zone_id": zone.zone_id, "dataset": "overview", "date": item["date"], **item["metrics"]}
+
+
+class BatchSink:
+    """
+    Keeps the rows given to write() and hands them to write_batch() batch_size
+    at a time, close() writes what is left
+    """
+
+    def __init__(self, batch_size: int = 500):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        self.batch_size = batch_size
+        self.batch = []
+        self.rows = 0
+
+    def write(self, row: dict):
+        self.batch.append(row)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            batch, self.batch = self.batch, []
+            self.write_batch(batch)
+            self.rows += len(batch)
+
+    def write_batch(self, rows: list):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open(path: str, newline=None):
+    return sys.stdout if path == "-" else open(path, "w", newline=newline)
+
+
+class NdjsonSink(BatchSink):
+    """
+    One JSON line per row, path "-" writes to stdout
+    """
+
+    def __init__(self, path: str = "-", batch_size: int = 500):
+        super().__init__(batch_size)
+        self.file = _open(path)
+
+    def write_batch(self, rows: list):
+        self.file.write("".join(json.dumps(row) + "\n" for row in rows))
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class CsvSink(BatchSink):
+    """
+    The columns are fields, or the keys of the first row. Lists and dicts
+    (the overview maps) are written as JSON
+    """
+
+    def __init__(self, path: str, fields: list = None, batch_size: int = 500):
+        super().__init__(batch_size)
+        self.file = _open(path, newline="")
+        self.fields = list(fields) if fields else None
+        self.writer = None
+
+    def write_batch(self, rows: list):
+        if self.writer is None:
+            self.fields = self.fields or list(rows[0])
+            self.writer = csv.DictWriter(self.file, self.fields, extrasaction="ignore")
+            self.writer.writeheader()
+
+        self.writer.writerows(
+            {name: json.dumps(value) if isinstance(value, (list, dict)) else value for name, value in row.items()}
+            for row in rows
+        )
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class HttpBulkSink(BatchSink):
+    """
+    POST every batch to url, as NDJSON (format="ndjson") or one JSON array
+    (format="json"). At most concurrency batches are sent at the same time,
+    write() waits when they are all in flight. A batch answered with something
+    else than 2xx raises ConnectionError on the next write() or on close()
+    """
+
+    def __init__(self, url: str, batch_size: int = 500, concurrency: int = 2, headers: dict = None, timeout: float = 30, format: str = "ndjson", session: requests.Session = None):
+        super().__init__(batch_size)
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if format not in ("ndjson", "json"):
+            raise ValueError(f"Unknown format {format}, expected ndjson or json")
+
+        self.url = url
+        self.timeout = timeout
+        self.format = format
+        self.headers = {"Content-Type": "application/x-ndjson" if format == "ndjson" else "application/json", **(headers or {})}
+        self.session = session or requests.Session()
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.errors = []
+        self.batches = 0
+        self.lock = threading.Lock()
+
+    def _post(self, body: bytes):
+        try:
+            response = self.session.post(self.url, data=body, headers=self.headers, timeout=self.timeout)
+            if not 200 <= response.status_code < 300:
+                raise ConnectionError(f"Request to {self.url} got response {response.status_code} == {response.text}")
+            with self.lock:
+                self.batches += 1
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            self.slots.release()
+
+    def _raise(self):
+        if self.errors:
+            raise self.errors[0]
+
+    def write_batch(self, rows: list):
+        self._raise()
+        if self.format == "ndjson":
+            body = "".join(json.dumps(row) + "\n" for row in rows).encode()
+        else:
+            body = json.dumps(rows).encode()
+
+        self.slots.acquire()
+        self.executor.submit(self._post, body)
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.executor.shutdown(wait=True)
+            self.session.close()
+        self._raise()
+
+
+class Pipeline:
+
+    def __init__(self, sinks: list, stages: list = None, workers: int = 4, queue_size: int = 1000):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+
+        self.sinks = list(sinks)
+        self.stages = list(stages or [])
+        self.workers = workers
+        self.queue_size = queue_size
+
+    @staticmethod
+    def _put(rows, item, stopping):
+        # a full queue blocks the fetcher until run() takes rows out or stops
+        while not stopping.is_set():
+            try:
+                rows.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce(self, fetchers, lock, rows, stopping, errors):
+        while not stopping.is_set():
+            with lock:
+                found = next(fetchers, None)
+            if found is None:
+                break
+
+            index, fetcher = found
+            try:
+                for row in fetcher:
+                    if not self._put(rows, row, stopping):
+                        break
+            except Exception as e:
+                errors.append((index, e))
+
+        self._put(rows, _DONE, stopping)
+
+    def run(self, fetchers):
+        """
+        Run every fetcher and write the rows to the sinks, the fetchers can be
+        any iterable (e.g. a generator) and are only taken when a worker is
+        free. The sinks are flushed but not closed (an HttpBulkSink has sent
+        its last batches once it is closed). Returns the number of rows
+        written and the (index, exception) of the fetchers that failed, the
+        other fetchers still go on when one fails
+        """
+
+        rows = queue.Queue(maxsize=self.queue_size)
+        stopping = threading.Event()
+        lock = threading.Lock()
+        errors = []
+        fetchers = enumerate(fetchers)
+        threads = [threading.Thread(target=self._produce, args=(fetchers, lock, rows, stopping, errors), daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        written = 0
+        running = len(threads)
+        try:
+            while running:
+                row = rows.get()
+                if row is _DONE:
+                    running -= 1
+                    continue
+
+                for stage in self.stages:
+                    row = stage(row)
+                    if row is None:
+                        break
+                if row is None:
+                    continue
+
+                for sink in self.sinks:
+                    sink.write(row)
+                written += 1
+
+            for sink in self.sinks:
+                sink.flush()
+        finally:
+            stopping.set()
+            for thread in threads:
+                thread.join()
+
+        return {"rows": written, "errors": sorted(errors, key=lambda error: error[0])}
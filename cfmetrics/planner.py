@@ -0,0 +1,113 @@
+"""
+What a zone (or an account) can query, so no request is sent that Cloudflare would refuse
+
+The settings node of the GraphQL API tells for every dataset if the plan of the
+zone can query it (enabled), how far back (notOlderThan seconds) and how long
+one window can be (maxDuration seconds). Zone.capabilities() asks for them once
+and keeps them in the metadata cache, Account.zone_capabilities() does it for
+many zones in one request. The Zone methods check the window against them
+before anything is sent, pick the datasets the zone can serve and cut the
+windows that are too long.
+"""
+from datetime import datetime, timedelta
+from cfmetrics import query
+
+# the settings only change with the plan, they are kept longer than the other metadata
+CAPABILITIES_TTL = 24 * 3600
+
+# how much older than the retention a start can be and still be moved up to it,
+# the moved start is EDGE_MARGIN seconds inside so it is still kept when the query arrives
+RETENTION_SLACK = 3600
+EDGE_MARGIN = 60
+
+
+# the dataset of the capabilities behind every Zone method that can be collected (state.DATASETS)
+COLLECTED = {"overview": "httpRequests1dGroups", "web_analytics": "rumPageloadEventsAdaptiveGroups", "traffics": "httpRequestsAdaptiveGroups"}
+
+# what a settings probe that can't be read raises, the capabilities are guessed then
+SETTINGS_ERRORS = (ConnectionError, ValueError, LookupError, TypeError)
+
+
+class DatasetUnavailable(ConnectionError):
+    """
+    The plan of the zone (or account) can't query the dataset
+    """
+
+
+def capabilities(settings: dict):
+    """
+    {dataset: {"enabled", "max_duration", "not_older_than"}} of the settings of a zone or account
+    """
+
+    return {
+        dataset: {"enabled": bool(values.get("enabled")), "max_duration": values.get("maxDuration") or None, "not_older_than": values.get("notOlderThan") or None}
+        for dataset, values in (settings or {}).items() if isinstance(values, dict)
+    }
+
+
+def plan_capabilities(plan_name: str):
+    """
+    The capabilities guessed from the plan name, when the settings can't be read:
+    the adaptive groups are not there with the Free plan, the rest is left to Cloudflare
+    """
+
+    found = {dataset: {"enabled": True, "max_duration": None, "not_older_than": retention}
+             for dataset, _, _, retention in query.OVERVIEW_DATASETS.values()}
+    found["httpRequestsAdaptiveGroups"] = {"enabled": "Free Website" not in plan_name, "max_duration": None, "not_older_than": None}
+    return found
+
+
+def retention(found: dict, dataset: str):
+    """
+    How far back a window of dataset can start when the caller gave no start,
+    EDGE_MARGIN seconds inside what it keeps. None when the settings don't say
+    """
+
+    notOlderThan = (found.get(dataset) or {}).get("not_older_than")
+    return notOlderThan - EDGE_MARGIN if notOlderThan else None
+
+
+def check_window(found: dict, dataset: str, start: str, owner: str, format: str = query.DATETIME_FORMAT, now: datetime = None):
+    """
+    Raise when dataset can't be queried from start on, returns its capability
+    (None when it wasn't in the settings, then Cloudflare decides) and start.
+    A start at most RETENTION_SLACK older than what is kept is moved up to the
+    oldest moment kept instead, like a default window made a bit earlier
+    """
+
+    capability = found.get(dataset)
+    if capability is None:
+        return None, start
+
+    if not capability["enabled"]:
+        raise DatasetUnavailable(f"{owner} can't query {dataset} with its plan, Move to Business to use this feature")
+
+    notOlderThan = capability["not_older_than"]
+    if notOlderThan:
+        edge = (now or datetime.utcnow()) - timedelta(seconds=notOlderThan)
+        startAt = datetime.strptime(start, format)
+        if startAt < edge - timedelta(seconds=RETENTION_SLACK):
+            raise ValueError(f"{owner} keeps {dataset} for {notOlderThan} seconds ({notOlderThan / 86400:g} days), {start} is older")
+        if startAt < edge:
+            start = (edge + timedelta(seconds=EDGE_MARGIN)).strftime(format)
+
+    return capability, start
+
+
+def max_duration(capability: dict):
+    return capability["max_duration"] if capability else None
+
+
+def check_duration(capability: dict, dataset: str, start: str, end: str, format: str, owner: str):
+    """
+    Raise when the window is longer than what one query of dataset can cover,
+    for the queries whose answers can't be cut in smaller windows (the overview totals)
+    """
+
+    maxDuration = max_duration(capability)
+    if not maxDuration:
+        return
+
+    seconds = (datetime.strptime(end, format) - datetime.strptime(start, format)).total_seconds()
+    if seconds > maxDuration:
+        raise ValueError(f"{owner} can query {dataset} for {maxDuration} seconds ({maxDuration / 86400:g} days) at once, {start} to {end} is longer")
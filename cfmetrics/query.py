@@ -1,79 +1,347 @@
 
+import json
+import re
 from datetime import datetime, timedelta
 
+# every GraphQL series below asks for this many rows, an answer this long is truncated
+ROW_LIMIT = 10000
+DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+DATE_FORMAT = "%Y-%m-%d"
 
-def query_zone_overview(zone_id: str, start_date=(datetime.now()-timedelta(seconds=2764800)).strftime("%Y-%m-%d"), end_date=datetime.now().strftime("%Y-%m-%d")):
 
+def check_datetime(value: str, format=DATETIME_FORMAT, expected="YYYY-MM-DDTHH:MM:SSZ"):
     try:
-        start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
+        return datetime.strptime(value, format)
     except ValueError:
-        raise ValueError("Invalid date format. Expected format: YYYY-MM-DD")
+        raise ValueError(f"Invalid date format. Expected format: {expected}")
 
+
+def default_window(start: str, end: str, seconds: int, format=DATETIME_FORMAT, retention: float = None, now: datetime = None):
+    """
+    start and end, the ones not given are the last seconds up to now (UTC)
+    made at call time, a default argument would be the time of the import
+    with retention (planner.retention) the start is never older than that
+    the start is rounded up to the hour (the day for a date) and the end down to
+    the minute, so the same default window asked again gives the same queries
+    and the response cache can answer them
+    """
+
+    now = now or datetime.utcnow()
+    if start is None:
+        startAt = now - timedelta(seconds=min(seconds, retention) if retention else seconds)
+        step = timedelta(days=1) if format == DATE_FORMAT else timedelta(hours=1)
+        rounded = datetime.min + (startAt - datetime.min) // step * step
+        start = (rounded if rounded == startAt else rounded + step).strftime(format)
+    return start, end or now.replace(second=0, microsecond=0).strftime(format)
+
+
+def check_traffic_window(start_datetime: str):
+    """
+    httpRequestsAdaptiveGroups only keep 32 days (2,764,800 seconds) of data
+    """
+
+    check_start_datetime = check_datetime(start_datetime)
     threshold_date = datetime.utcnow() - timedelta(seconds=2764800)
 
-    queryBody = {
-        "query": """
-            query GetZoneAnalytics($zoneTag: string){
-                viewer{
-                    zones(filter: {zoneTag: $zoneTag}){
+    if (threshold_date - check_start_datetime).total_seconds() > 2764800:
+        raise ValueError(f"start_datetime cannot be more than 2,764,800 seconds (32 days) ago. Given: {start_datetime}")
+
+    return check_start_datetime
+
+
+# the httpRequestsXGroups datasets of the overview by the size of their buckets:
+# (dataset, time dimension, bucket seconds, retention seconds), the retention is
+# the one Cloudflare documents for the paid plans, the one of 1d depends on the
+# plan so it is left to Cloudflare
+OVERVIEW_DATASETS = {
+    "1d": ("httpRequests1dGroups", "date", 86400, None),
+    "1h": ("httpRequests1hGroups", "datetime", 3600, 90 * 86400),
+    "1m": ("httpRequests1mGroups", "datetimeMinute", 60, 7 * 86400),
+}
+
+RESOLUTION_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+def overview_fields(dataset: str = "1d"):
+    """
+    The selection of one zone in the overview queries, dataset is a key of
+    OVERVIEW_DATASETS. 1d windows are dates (date_lt), the others are datetimes
+    (datetime_leq) like the series queries
+    """
+
+    name, dimension, _, _ = OVERVIEW_DATASETS[dataset]
+    window = "date_geq: $start_date, date_lt: $end_date" if dataset == "1d" else "datetime_geq: $start_date, datetime_leq: $end_date"
+    return """
                         # Total Unique Visitors
-                        totals: httpRequests1dGroups(limit: 10000, filter: {date_geq: $start_date, date_lt: $end_date}){
-                            uniq{
+                        totals: {dataset}(limit: 10000, filter: {{{window}}}){{
+                            uniq{{
                                 uniques
-                            }
-                        }
+                            }}
+                        }}
 
                         # Zone Analytics by Timeslot
-                        zones: httpRequests1dGroups(orderBy:[date_ASC], limit: 10000, filter: {date_geq: $start_date, date_lt: $end_date}){
-                            dimensions{
-                                timeslot: date
-                            }
-                            uniq{
+                        zones: {dataset}(orderBy:[{dimension}_ASC], limit: 10000, filter: {{{window}}}){{
+                            dimensions{{
+                                timeslot: {dimension}
+                            }}
+                            uniq{{
                                 uniques
-                            }
-                            sum{
+                            }}
+                            sum{{
 
                                 # Browser Statistics
-                                browserMap{
+                                browserMap{{
                                     pageViews
                                     key: uaBrowserFamily
-                                }
+                                }}
                                 
                                 # Data Transfer Statistics
                                 bytes
                                 cachedBytes
                                 cachedRequests
 
-                                contentTypeMap {
+                                contentTypeMap {{
                                     bytes
                                     key: edgeResponseContentTypeName
-                                }
+                                }}
 
                                 # Traffic by Country
-                                countryMap {
+                                countryMap {{
                                     bytes
                                     requests 
                                     threats
                                     key: clientCountryName
-                                }
+                                }}
                                 
                                 pageViews
                                 requests
 
                                 #Response Status Breakdown
-                                responseStatusMap {
+                                responseStatusMap {{
                                     requests
                                     key: edgeResponseStatus
-                                }
+                                }}
 
                                 # Threat Metrics
                                 threats
-                                threatPathingMap {
+                                threatPathingMap {{
                                     requests
                                     key: threatPathingName
-                                }
-                            }
-                        }
+                                }}
+                            }}
+                        }}
+""".format(dataset=name, dimension=dimension, window=window)
+
+
+# the httpRequests1dGroups selection of one zone in the overview queries
+OVERVIEW_FIELDS = overview_fields("1d")
+
+
+def parse_resolution(resolution: str):
+    """
+    "15m", "1h", "6h", "1d", "7d"... in seconds
+    """
+
+    try:
+        seconds = int(resolution[:-1]) * RESOLUTION_UNITS[resolution[-1]]
+    except (ValueError, KeyError, IndexError, TypeError):
+        raise ValueError(f"Invalid resolution {resolution}, expected a number of minutes, hours or days like 15m, 1h or 7d")
+    if seconds <= 0:
+        raise ValueError(f"Invalid resolution {resolution}, it has to be more than 0")
+    return seconds
+
+
+def parse_moment(value: str):
+    # a date or a datetime of the overview windows
+    try:
+        return datetime.strptime(value, DATETIME_FORMAT)
+    except ValueError:
+        return check_datetime(value, DATE_FORMAT, "YYYY-MM-DD")
+
+
+def overview_dataset(resolution: str, start_date: str, now: datetime = None, capabilities: dict = None):
+    """
+    The coarsest OVERVIEW_DATASETS key whose buckets add up to resolution and
+    which still keeps start_date, buckets of it are rolled up to resolution
+    with the capabilities of the zone (planner.capabilities) the datasets its
+    plan can't query are skipped and their notOlderThan is the retention
+    """
+
+    seconds = parse_resolution(resolution)
+    startAt = parse_moment(start_date)
+    now = now or datetime.utcnow()
+
+    fitting = [key for key, (_, _, bucket, _) in OVERVIEW_DATASETS.items() if seconds % bucket == 0]
+    if not fitting:
+        raise ValueError(f"Invalid resolution {resolution}, it has to be whole minutes")
+    for key in fitting:
+        dataset, _, _, retention = OVERVIEW_DATASETS[key]
+        capability = (capabilities or {}).get(dataset)
+        if capability is not None:
+            if not capability["enabled"]:
+                continue
+            retention = capability["not_older_than"]
+        if retention is None or startAt >= now - timedelta(seconds=retention):
+            return key
+
+    raise ValueError(f"start_date {start_date} is older than what {OVERVIEW_DATASETS[fitting[0]][0]} keeps, use a coarser resolution or a later start_date")
+
+
+def overview_window(dataset: str, start_date: str, end_date: str):
+    """
+    The window of the dataset for the dates (end excluded) or datetimes (end
+    included) given to get_overview
+    """
+
+    startAt = parse_moment(start_date)
+    endAt = parse_moment(end_date)
+    endInclusive = "T" in end_date
+
+    if dataset == "1d":
+        # the days covering the window, end_date excluded
+        if endInclusive:
+            endAt = endAt.replace(hour=0, minute=0, second=0) + timedelta(days=1)
+        return startAt.strftime(DATE_FORMAT), endAt.strftime(DATE_FORMAT)
+
+    if not endInclusive:
+        endAt -= timedelta(seconds=1)
+    return startAt.strftime(DATETIME_FORMAT), endAt.strftime(DATETIME_FORMAT)
+
+
+# how many zones query_zones_overview puts in one request, each zone costs two
+# httpRequests1dGroups nodes of the query complexity budget
+OVERVIEW_BATCH_SIZE = 10
+
+
+def split_window(start: str, end: str, format=DATETIME_FORMAT):
+    """
+    Split a query window in two halves, or return None when it can't be split anymore
+    datetime windows are inclusive (datetime_geq/datetime_leq) and cut at the midnight
+    closest to the middle when there is one, so a date group stays in one half
+    date windows are end exclusive (date_geq/date_lt) and cut on a whole day
+    """
+
+    startAt = datetime.strptime(start, format)
+    endAt = datetime.strptime(end, format)
+
+    if format == DATE_FORMAT:
+        days = (endAt - startAt).days
+        if days < 2:
+            return None
+        middle = (startAt + timedelta(days=days // 2)).strftime(format)
+        return [(start, middle), (middle, end)]
+
+    if (endAt - startAt).total_seconds() < 2:
+        return None
+
+    middle = startAt + (endAt - startAt) / 2
+    midnight = middle.replace(hour=0, minute=0, second=0, microsecond=0)
+    candidates = [m for m in (midnight, midnight + timedelta(days=1)) if startAt < m <= endAt]
+    if candidates:
+        middle = min(candidates, key=lambda m: abs(m - middle))
+    else:
+        middle = middle.replace(microsecond=0)
+        if middle <= startAt:
+            middle = startAt + timedelta(seconds=1)
+
+    return [(start, (middle - timedelta(seconds=1)).strftime(format)), (middle.strftime(format), end)]
+
+
+# how long the analytics of a window can still change after it ended (late logs),
+# a window that ended before is sealed and its answer never changes anymore
+SEAL_DELAY = 3 * 3600
+
+
+def normalize_query(queryBody):
+    """
+    The query text without comments and extra whitespace plus the variables in
+    key order, two bodies asking for the same thing give the same text
+    """
+
+    text = re.sub(r"#[^\n]*", "", queryBody["query"])
+    text = " ".join(text.split())
+    variables = json.dumps(queryBody.get("variables") or {}, sort_keys=True, separators=(",", ":"))
+    return f"{text}\n{variables}"
+
+
+def _window_end(value):
+    # the datetime_leq / datetime_lt / date_lt of a filter, wherever it is nested
+    if isinstance(value, list):
+        ends = [end for end in map(_window_end, value) if end is not None]
+        return min(ends) if ends else None
+    if not isinstance(value, dict):
+        return None
+
+    if value.get("datetime_leq") is not None:
+        return check_datetime(value["datetime_leq"]) + timedelta(seconds=1)
+    for key in ("datetime_lt", "date_lt"):
+        if value.get(key) is not None:
+            return check_datetime(value[key], DATETIME_FORMAT if key == "datetime_lt" else DATE_FORMAT)
+    return _window_end(list(value.values()))
+
+
+def window_end(queryBody):
+    """
+    When the window of a query ends (exclusive), None when it has no window
+    """
+
+    variables = queryBody.get("variables") or {}
+    if variables.get("end_date") is not None:
+        end = parse_moment(variables["end_date"])
+        return end + timedelta(seconds=1) if "T" in variables["end_date"] else end
+    return _window_end(variables)
+
+
+def sealed_before(now: datetime = None):
+    """
+    The midnight (UTC) before which every day is sealed
+    """
+
+    settled = (now or datetime.utcnow()) - timedelta(seconds=SEAL_DELAY)
+    return settled.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def is_sealed(queryBody, now: datetime = None):
+    try:
+        end = window_end(queryBody)
+    except ValueError:
+        return False
+    return end is not None and end <= (now or datetime.utcnow()) - timedelta(seconds=SEAL_DELAY)
+
+
+def seal_split(start: str, end: str, format=DATETIME_FORMAT, now: datetime = None):
+    """
+    Cut a datetime window at sealed_before() when it crosses it, so the sealed
+    days and the still open tail are asked (and cached) apart, None otherwise
+    date windows are not cut, the overview totals can't be added across windows
+    """
+
+    if format != DATETIME_FORMAT:
+        return None
+
+    boundary = sealed_before(now)
+    if not datetime.strptime(start, format) < boundary <= datetime.strptime(end, format):
+        return None
+    return [(start, (boundary - timedelta(seconds=1)).strftime(format)), (boundary.strftime(format), end)]
+
+
+def query_zone_overview(zone_id: str, start_date=(datetime.now()-timedelta(seconds=2764800)).strftime("%Y-%m-%d"), end_date=datetime.now().strftime("%Y-%m-%d"), dataset: str = "1d"):
+    """
+    dataset is a key of OVERVIEW_DATASETS, 1d takes dates and the others datetimes
+    """
+
+    try:
+        start_datetime = datetime.strptime(start_date, "%Y-%m-%d" if dataset == "1d" else DATETIME_FORMAT)
+    except ValueError:
+        raise ValueError("Invalid date format. Expected format: YYYY-MM-DD" if dataset == "1d" else "Invalid date format. Expected format: YYYY-MM-DDTHH:MM:SSZ")
+
+    threshold_date = datetime.utcnow() - timedelta(seconds=2764800)
+
+    queryBody = {
+        "query": """
+            query GetZoneAnalytics($zoneTag: string){
+                viewer{
+                    zones(filter: {zoneTag: $zoneTag}){""" + overview_fields(dataset) + """
                     }
                 }
             }
@@ -87,6 +355,278 @@ def query_zone_overview(zone_id: str, start_date=(datetime.now()-timedelta(secon
 
     return queryBody
 
-    
-    
 
+# the most hosts put in one _in filter, a zone query with more than this goes
+# without host filter and longer lists of an account query are sharded
+HOST_FILTER_LIMIT = 1000
+
+
+def compact_hosts(names):
+    """
+    The DNS names as hosts for a filter, wildcard names never match a request
+    host and names are case insensitive so duplicates are dropped
+    """
+
+    hosts = []
+    seen = set()
+    for name in names:
+        host = name.lower().rstrip(".")
+        if host.startswith("*") or host in seen:
+            continue
+        seen.add(host)
+        hosts.append(host)
+
+    return hosts
+
+
+def host_shards(names, scope):
+    """
+    Split the hosts over the requests to send, returns (shards, keep)
+    a shard of None means no host filter, then the rows have to be kept
+    client side when their host is in keep
+    """
+
+    hosts = compact_hosts(names)
+
+    # a zone only has traffic for its own hosts, so a filter listing most of
+    # them costs more to evaluate than it takes away
+    if scope == "zones" and len(hosts) > HOST_FILTER_LIMIT:
+        return [None], set(hosts)
+
+    shards = [hosts[i:i + HOST_FILTER_LIMIT] for i in range(0, len(hosts), HOST_FILTER_LIMIT)]
+    return shards or [hosts], None
+
+
+def host_filter(field: str, hosts):
+    if hosts is None:
+        return []
+    return [{f"{field}_in": list(hosts)}]
+
+
+def status_filter(status: bool = False):
+    """
+    The html pages answered with 200, with status=True also the ones answered
+    with 4xx and 5xx so the errors come in the same series
+    """
+
+    if not status:
+        return {"AND": [{"edgeResponseStatus": 200, "edgeResponseContentTypeName": "html"}]}
+    return {"AND": [{"edgeResponseContentTypeName": "html"}, {"OR": [{"edgeResponseStatus": 200}, {"edgeResponseStatus_geq": 400}]}]}
+
+
+def query_zone_traffic(zone_id: str, hosts: list, start_datetime: str, end_datetime: str, status: bool = False):
+    """
+    httpRequestsAdaptiveGroups for html pages answered with 200, grouped by host and date
+    hosts=None asks for every host of the zone, status=True adds the 4xx and 5xx
+    pages grouped by edgeResponseStatus too (see data_format.fold_status)
+    """
+
+    queryBody = {
+        "query": """
+            query VisitsDaily($zoneTag: string, $filter: ZoneHttpRequestsAdaptiveGroupsFilter_InputObject){
+                viewer{
+                    zones(filter: {zoneTag: $zoneTag}) {
+                    series: httpRequestsAdaptiveGroups(limit: 10000, filter: $filter) {
+                        count # pageview
+                        avg {
+                            sampleInterval
+                            }
+                        sum {
+                            edgeResponseBytes # data transfer
+                            visits # according to documentation this is the number of requests by end-users that were initiated from a different website. so its requests I guess.
+                             }
+                        dimensions {
+                            host: clientRequestHTTPHost
+                            ts: date # datetimeFifteenMinutes""" + ("""
+                            status: edgeResponseStatus""" if status else "") + """
+                            }
+                        }
+                    }
+                }
+            }
+                """,
+        "variables":{
+            "zoneTag": zone_id,
+            "filter": {
+                "AND": [{
+                    "datetime_geq": start_datetime,
+                    "datetime_leq": end_datetime
+                }, {
+                    "requestSource": "eyeball"
+                }, status_filter(status), *host_filter("clientRequestHTTPHost", hosts)]
+            }
+        }
+    }
+
+    return queryBody
+
+
+def query_account_rum(account_id: str, hosts: list, start_date: str, end_date: str):
+    """
+    rumPageloadEventsAdaptiveGroups of the account, grouped by host and date
+    hosts=None asks for every host of the account
+    """
+
+    queryBody = {
+        "query": """
+            query RumDaily($accountTag: string, $filter: AccountRumPageloadEventsAdaptiveGroupsFilter_InputObject){
+                viewer{
+                    accounts(filter: {accountTag: $accountTag}) {
+                    series: rumPageloadEventsAdaptiveGroups(limit: 10000, filter: $filter) {
+                        count # number of page viewed by end users
+                        avg {
+                            sampleInterval
+                            }
+                        sum {
+                            visits # according to documentation this is the number of requests by end-users that were initiated from a different website. so its requests I guess.
+                             }
+                        dimensions {
+                            host: requestHost
+                            ts: date
+                            }
+                        }
+                    }
+                }
+            }
+                """,
+        "variables":{
+            "accountTag": account_id,
+            "filter": {
+                "AND": [{
+                    "datetime_geq": start_date,
+                    "datetime_leq": end_date
+                }, *host_filter("requestHost", hosts)]
+            }
+        }
+    }
+
+    return queryBody
+
+
+def zone_alias(index: int):
+    return f"zone{index}"
+
+
+def query_zones_overview(zone_ids: list, start_date: str, end_date: str):
+    """
+    The query_zone_overview of many zones in one request, every zone gets its own
+    alias (zone_alias) so the answer can be split per zone again
+    """
+
+    check_datetime(start_date, DATE_FORMAT, "YYYY-MM-DD")
+
+    if not zone_ids:
+        raise ValueError("At least one Zone ID is required")
+
+    declarations = "".join(f", ${zone_alias(i)}: string" for i in range(len(zone_ids)))
+    selections = "".join(
+        f"""
+                    {zone_alias(i)}: zones(filter: {{zoneTag: ${zone_alias(i)}}}){{""" + OVERVIEW_FIELDS + """
+                    }"""
+        for i in range(len(zone_ids))
+    )
+
+    queryBody = {
+        "query": """
+            query GetZonesAnalytics($start_date: Date, $end_date: Date""" + declarations + """){
+                viewer{""" + selections + """
+                }
+            }
+            """,
+        "variables": {
+            "start_date": start_date,
+            "end_date": end_date,
+            **{zone_alias(i): zone_id for i, zone_id in enumerate(zone_ids)}
+        }
+    }
+
+    return queryBody
+
+
+# the datasets the zone and account queries use, their settings say if the
+# plan can query them, how far back (notOlderThan) and how long a window can be
+ZONE_DATASETS = ("httpRequestsAdaptiveGroups", "httpRequests1dGroups", "httpRequests1hGroups", "httpRequests1mGroups")
+ACCOUNT_DATASETS = ("rumPageloadEventsAdaptiveGroups",)
+
+SETTINGS_FIELDS = """
+                            enabled
+                            maxDuration
+                            notOlderThan
+                            maxPageSize"""
+
+
+def _settings(datasets):
+    return "".join(f"""
+                        {dataset} {{{SETTINGS_FIELDS}
+                        }}""" for dataset in datasets)
+
+
+def query_zones_settings(zone_ids: list):
+    """
+    The settings of ZONE_DATASETS for many zones in one request, every zone
+    gets its own alias (zone_alias) like query_zones_overview
+    """
+
+    if not zone_ids:
+        raise ValueError("At least one Zone ID is required")
+
+    declarations = ", ".join(f"${zone_alias(i)}: string" for i in range(len(zone_ids)))
+    selections = "".join(
+        f"""
+                    {zone_alias(i)}: zones(filter: {{zoneTag: ${zone_alias(i)}}}){{
+                    settings {{""" + _settings(ZONE_DATASETS) + """
+                    }
+                    }"""
+        for i in range(len(zone_ids))
+    )
+
+    queryBody = {
+        "query": """
+            query GetZonesSettings(""" + declarations + """){
+                viewer{""" + selections + """
+                }
+            }
+            """,
+        "variables": {zone_alias(i): zone_id for i, zone_id in enumerate(zone_ids)}
+    }
+
+    return queryBody
+
+
+def query_account_settings(account_id: str):
+
+    queryBody = {
+        "query": """
+            query GetAccountSettings($accountTag: string){
+                viewer{
+                    accounts(filter: {accountTag: $accountTag}){
+                    settings {""" + _settings(ACCOUNT_DATASETS) + """
+                    }
+                    }
+                }
+            }
+            """,
+        "variables": {"accountTag": account_id}
+    }
+
+    return queryBody
+
+
+def duration_windows(start: str, end: str, max_duration: float, format=DATETIME_FORMAT):
+    """
+    Cut an inclusive datetime window in consecutive windows of at most max_duration
+    seconds, None when it is short enough already
+    """
+
+    startAt = datetime.strptime(start, format)
+    endAt = datetime.strptime(end, format)
+    if not max_duration or (endAt - startAt).total_seconds() < max_duration:
+        return None
+
+    windows = []
+    step = timedelta(seconds=max_duration)
+    while startAt <= endAt:
+        last = min(startAt + step - timedelta(seconds=1), endAt)
+        windows.append((startAt.strftime(format), last.strftime(format)))
+        startAt = last + timedelta(seconds=1)
+    return windows
@@ -0,0 +1,121 @@
+"""
+Rate limits and retries of the calls to the Cloudflare API
+
+Every request takes a token from the bucket of its API (REST or GraphQL) first,
+the default buckets follow the published limits: 1200 REST calls and 300
+GraphQL queries per 5 minutes. A 429 or 5xx answer is retried with a jittered
+exponential backoff, or after Retry-After when Cloudflare sends it, and a 429
+also pauses the whole bucket so the other workers slow down too
+"""
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate must be positive and capacity at least 1")
+
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, tokens: float = 1):
+        """
+        Take the tokens and return how many seconds to wait before using them,
+        the bucket can go below zero so the callers queue up in order
+        """
+
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        """
+        Nobody gets a token for the next seconds
+        """
+
+        with self.lock:
+            self._refill(time.monotonic())
+            # one token is left at the end of the pause for the next caller
+            self.tokens = min(self.tokens, 1) - seconds * self.rate
+
+
+class Scheduler:
+
+    def __init__(self, rest_rate: float = 1200 / 300, rest_burst: float = 1200, graphql_rate: float = 300 / 300, graphql_burst: float = 300,
+                 retries: int = 4, backoff: float = 0.5, max_backoff: float = 30):
+        if retries < 0:
+            raise ValueError("retries can't be negative")
+
+        self.buckets = {
+            "rest": TokenBucket(rest_rate, rest_burst),
+            "graphql": TokenBucket(graphql_rate, graphql_burst),
+        }
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def settings(self, parts: int = 1):
+        """
+        The arguments to build this scheduler again, with the rates and bursts
+        split over parts schedulers (e.g. one per worker process)
+        """
+
+        rest, graphql = self.buckets["rest"], self.buckets["graphql"]
+        return {
+            "rest_rate": rest.rate / parts, "rest_burst": max(1, rest.capacity / parts),
+            "graphql_rate": graphql.rate / parts, "graphql_burst": max(1, graphql.capacity / parts),
+            "retries": self.retries, "backoff": self.backoff, "max_backoff": self.max_backoff,
+        }
+
+    def reserve(self, api: str):
+        return self.buckets[api].reserve()
+
+    def pause(self, api: str, seconds: float):
+        self.buckets[api].pause(seconds)
+
+    def retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def retry_delay(self, attempt: int, response=None):
+        """
+        Seconds to wait before the next attempt, None when it shouldn't be retried,
+        without a response the attempt failed on the connection
+        """
+
+        if attempt >= self.retries:
+            return None
+        if response is not None:
+            if response.status_code not in RETRY_STATUS:
+                return None
+            retryAfter = self.retry_after(response)
+            if retryAfter is not None:
+                return retryAfter
+
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
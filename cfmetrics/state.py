@@ -0,0 +1,90 @@
+"""
+Local state of the incremental collection, for every zone and dataset it keeps
+the high watermark (the end of the last window fetched). The history itself
+goes to a MetricStore, so a row here stays the same size however long it runs
+"""
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from cfmetrics import query
+
+
+class StateStore:
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS collections (zone_id TEXT, dataset TEXT, watermark TEXT, PRIMARY KEY (zone_id, dataset))")
+
+    def get_watermark(self, zone_id: str, dataset: str):
+        """
+        None when the zone was never collected
+        """
+
+        with self.lock:
+            row = self.conn.execute("SELECT watermark FROM collections WHERE zone_id = ? AND dataset = ?", (zone_id, dataset)).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, zone_id: str, dataset: str, watermark: str):
+        # the columns are named, a state file of an older version still has a data column
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO collections (zone_id, dataset, watermark) VALUES (?, ?, ?)", (zone_id, dataset, watermark))
+
+    def delete(self, zone_id: str, dataset: str = None):
+        with self.lock, self.conn:
+            if dataset is None:
+                self.conn.execute("DELETE FROM collections WHERE zone_id = ?", (zone_id,))
+            else:
+                self.conn.execute("DELETE FROM collections WHERE zone_id = ? AND dataset = ?", (zone_id, dataset))
+
+    def close(self):
+        self.conn.close()
+
+
+# the Zone methods that can be collected incrementally, get_<dataset>
+DATASETS = ("overview", "web_analytics", "traffics")
+
+
+def _midnight(value: datetime):
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_window(dataset: str, watermark: str = None, overlap: timedelta = None, now: datetime = None, retention: float = None):
+    """
+    The (start, end) to fetch after the watermark, it goes back by overlap for the
+    late data and starts on a midnight so every date in the answer is complete
+    and can replace the one collected before
+    retention (planner.retention) is how far back the dataset can be asked,
+    the first window starts there when it is shorter than the 32 days
+    """
+
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset {dataset}, expected one of {', '.join(DATASETS)}")
+
+    now = now or datetime.utcnow()
+
+    if dataset == "overview":
+        # date_lt is exclusive, so the watermark is the first day that is not collected yet
+        overlap = timedelta(days=1) if overlap is None else overlap
+        end = now.strftime(query.DATE_FORMAT)
+        if watermark is None:
+            return query.default_window(None, end, 2764800, query.DATE_FORMAT, retention, now)
+        start = _midnight(datetime.strptime(watermark, query.DATE_FORMAT) - overlap)
+        if retention and start < now - timedelta(seconds=retention):
+            # the 1d groups keep what the plan allows, only a reported retention is a limit
+            start = _midnight(now - timedelta(seconds=retention)) + timedelta(days=1)
+        return start.strftime(query.DATE_FORMAT), end
+
+    # the adaptive groups only keep about 32 days
+    overlap = timedelta(hours=1) if overlap is None else overlap
+    end = now.strftime(query.DATETIME_FORMAT)
+    oldest = now - timedelta(seconds=min(2764000, retention) if retention else 2764000)
+    if watermark is None:
+        return oldest.strftime(query.DATETIME_FORMAT), end
+
+    start = _midnight(datetime.strptime(watermark, query.DATETIME_FORMAT) - overlap)
+    if start < oldest:
+        start = _midnight(oldest) + timedelta(days=1)
+    return start.strftime(query.DATETIME_FORMAT), end
@@ -0,0 +1,136 @@
+"""
+Long term storage of the collected metrics in sqlite
+
+Every table is WITHOUT ROWID with (zone_id, dataset, date, ...) as primary key,
+so the rows are kept on disk ordered by zone and date and a date range of a
+zone is one range scan. The numbers have their own columns and the maps of the
+overview are JSON columns.
+"""
+import json
+import sqlite3
+import threading
+from cfmetrics import data_format
+
+# metrics of data_format.model that get a column, the others go in extra
+SERIES_METRICS = ("page_views", "requests", "visits", "data_transfer_bytes", "error_counts")
+
+OVERVIEW_METRICS = ("bytes", "cachedBytes", "cachedRequests", "pageViews", "requests", "threats")
+OVERVIEW_MAPS = ("browserMap", "contentTypeMap", "countryMap", "responseStatusMap", "threatPathingMap")
+
+
+class MetricStore:
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+
+        seriesColumns = ", ".join(f"{name} INTEGER" for name in SERIES_METRICS)
+        overviewColumns = ", ".join([*(f"{name} INTEGER" for name in OVERVIEW_METRICS), *(f"{name} TEXT" for name in OVERVIEW_MAPS)])
+        with self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS series (zone_id TEXT, dataset TEXT, date TEXT, host TEXT, {seriesColumns}, extra TEXT, PRIMARY KEY (zone_id, dataset, date, host)) WITHOUT ROWID")
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS overview (zone_id TEXT, date TEXT, {overviewColumns}, PRIMARY KEY (zone_id, date)) WITHOUT ROWID")
+
+    def write(self, zone_id: str, dataset: str, dataCompiled):
+        """
+        Store the result of get_traffics/get_web_analytics (dataset "traffics" or
+        "web_analytics") or get_overview (dataset "overview"), rows that are already
+        stored for the same zone, date and host are replaced
+        """
+
+        if dataset == "overview":
+            self._write_overview(zone_id, dataCompiled)
+            return
+
+        values = []
+        for dateData in dataCompiled["by_date"]["dates"]:
+            for domain in dateData["domains"]:
+                metrics = domain["metrics"]
+                extra = {name: value for name, value in metrics.items() if name not in SERIES_METRICS}
+                values.append((
+                    zone_id, dataset, dateData["date"], domain["name"],
+                    *(metrics.get(name) for name in SERIES_METRICS),
+                    json.dumps(extra) if extra else None
+                ))
+
+        placeholders = ", ".join("?" * (len(SERIES_METRICS) + 5))
+        with self.lock, self.conn:
+            self.conn.executemany(f"INSERT OR REPLACE INTO series VALUES ({placeholders})", values)
+
+    def _write_overview(self, zone_id, dataCompiled):
+        values = []
+        for item in dataCompiled["by_date"]["dates"]:
+            metrics = item["metrics"]
+            values.append((
+                zone_id, item["date"],
+                *(metrics.get(name) for name in OVERVIEW_METRICS),
+                *(json.dumps(metrics.get(name)) for name in OVERVIEW_MAPS)
+            ))
+
+        placeholders = ", ".join("?" * (len(OVERVIEW_METRICS) + len(OVERVIEW_MAPS) + 2))
+        with self.lock, self.conn:
+            self.conn.executemany(f"INSERT OR REPLACE INTO overview VALUES ({placeholders})", values)
+
+    def scan(self, zone_id: str, dataset: str, start: str = None, end: str = None, hosts: list = None):
+        """
+        (date, host, metrics) rows of a zone between start and end (both included)
+        ordered by date, for the overview host is None
+        """
+
+        table = "overview" if dataset == "overview" else "series"
+        where = ["zone_id = ?"]
+        params = [zone_id]
+        if table == "series":
+            where.append("dataset = ?")
+            params.append(dataset)
+        if start is not None:
+            where.append("date >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("date <= ?")
+            params.append(end)
+        if hosts and table == "series":
+            where.append(f"host IN ({', '.join('?' * len(hosts))})")
+            params.extend(hosts)
+
+        with self.lock:
+            cursor = self.conn.execute(f"SELECT * FROM {table} WHERE {' AND '.join(where)} ORDER BY date", params)
+            dataRows = cursor.fetchall()
+
+        for row in dataRows:
+            if table == "overview":
+                metrics = dict(zip(OVERVIEW_METRICS, row[2:2 + len(OVERVIEW_METRICS)]))
+                metrics.update((name, json.loads(value)) for name, value in zip(OVERVIEW_MAPS, row[2 + len(OVERVIEW_METRICS):]))
+                yield row[1], None, metrics
+                continue
+
+            metrics = {name: value for name, value in zip(SERIES_METRICS, row[4:4 + len(SERIES_METRICS)]) if value is not None}
+            if row[-1]:
+                metrics.update(json.loads(row[-1]))
+            yield row[2], row[3], metrics
+
+    def read(self, zone_id: str, dataset: str, start: str = None, end: str = None, hosts: list = None):
+        """
+        Rebuild the dict of get_traffics/get_web_analytics/get_overview for a slice,
+        totalUniqueUsers of the overview is None because uniques can't be added up
+        """
+
+        dataRows = self.scan(zone_id, dataset, start, end, hosts)
+        if dataset != "overview":
+            return data_format._compile(dataRows)
+
+        dates = [{"date": date, "metrics": metrics} for date, _, metrics in dataRows]
+        return {
+            "totalUniqueUsers": None,
+            "by_date": {
+                "dates": dates,
+                "date_lists": [item["date"] for item in dates]
+            }
+        }
+
+    def zones(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT zone_id FROM series UNION SELECT zone_id FROM overview ORDER BY zone_id")]
+
+    def close(self):
+        self.conn.close()
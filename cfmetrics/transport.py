@@ -0,0 +1,145 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from cfmetrics.scheduler import Scheduler
+from cfmetrics.instrument import Instrumentation, url_class, response_bytes
+
+
+class Config:
+
+    def __init__(self, cf_api_url="https://api.cloudflare.com/client/v4", cf_graphql_url=None):
+        self.cf_api_url=cf_api_url.rstrip("/")
+        self.cf_graphql_url=cf_graphql_url or f"{self.cf_api_url}/graphql"
+
+    def get_url(self):
+        return self.cf_graphql_url, self.cf_api_url
+
+
+class RateLimitError(ConnectionError):
+    """
+    Cloudflare still answered 429 after every retry
+    """
+
+
+def check_status(response):
+    if response.status_code == 429:
+        raise RateLimitError(f"Request to {response.url} is rate limited == {response.text}")
+    if response.status_code != 200:
+        raise ConnectionError(f"Request to {response.url} got response {response.status_code} == {response.text}") 
+
+
+def check_response(response):
+    """
+    Raise when the API call failed, otherwise return the decoded GraphQL body
+    """
+
+    check_status(response)
+
+    dataResult = response.json()
+    if dataResult["data"] == None:
+        raise ValueError(f"There is no data Response, maybe check the response {dataResult}")
+
+    return dataResult
+
+
+def record_response(span, response):
+    span.set("status", response.status_code)
+    span.set("bytes", response_bytes(response))
+    if response.status_code >= 400:
+        span.error = str(response.status_code)
+
+
+class Transport:
+    """
+    One pooled requests.Session shared by Auth, Account and Zone so the
+    TCP+TLS connection to the Cloudflare API is reused between calls
+    """
+
+    def __init__(self, config: Config = None, pool_size: int = 10, keep_alive: bool = True, timeout: float = 60, max_inflight: int = 4, scheduler: Scheduler = None, instrumentation: Instrumentation = None, response_cache=None):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        if max_inflight < 1:
+            raise ValueError("max_inflight must be at least 1")
+
+        self.config = config or Config()
+        self.timeout = timeout
+        # how many requests are sent at the same time, over every call and thread
+        # using this transport, the pools of the nested calls wait on the same slots
+        self.max_inflight = max_inflight
+        self.inflight = threading.BoundedSemaphore(max_inflight)
+        self.scheduler = scheduler or Scheduler()
+        self.instrumentation = instrumentation or Instrumentation()
+        # the GraphQL answers (cache.ResponseCache), None sends every query
+        self.response_cache = response_cache
+        self.session = requests.Session()
+
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive" if keep_alive else "close"
+        })
+
+    def api(self, url: str):
+        return "graphql" if url == self.config.cf_graphql_url else "rest"
+
+    def request(self, method: str, url: str, **kwargs):
+        """
+        Send the request through the scheduler, GET and GraphQL queries are
+        idempotent so they are retried, the last answer is returned when the
+        retries are over and the caller decides what to do with it
+        """
+
+        kwargs.setdefault("timeout", self.timeout)
+        api = self.api(url)
+        idempotent = method == "GET" or api == "graphql"
+        attempt = 0
+
+        while True:
+            queued = self.scheduler.reserve(api)
+            time.sleep(queued)
+            with self.instrumentation.span("http", url_class(url, self.config.cf_graphql_url), method=method, attempt=attempt, queued=max(0, queued)) as span:
+                try:
+                    # a streamed answer gives the slot back once the headers are in
+                    with self.inflight:
+                        response = self.session.request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    response = None
+                    error = e
+                    span.error = type(e).__name__
+                else:
+                    record_response(span, response)
+
+            if response is None:
+                delay = self.scheduler.retry_delay(attempt) if idempotent else None
+                if delay is None:
+                    raise error
+            else:
+                delay = self.scheduler.retry_delay(attempt, response) if idempotent else None
+                if delay is None:
+                    return response
+                response.close()
+                if response.status_code == 429:
+                    # the next reserve waits for the pause
+                    self.scheduler.pause(api, delay)
+                    delay = 0
+
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -16,5 +16,13 @@ setup(
     install_requires=[
         "requests",
     ],
+    extras_require={
+        "async": ["aiohttp"],
+        "columnar": ["numpy"],
+        "stream": ["ijson"],
+    },
+    entry_points={
+        "console_scripts": ["cfmetrics=cfmetrics.daemon:main"],
+    },
     python_requires=">=3.7",
 )
@@ -0,0 +1,286 @@
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # the headers and the body are two writes, without this every answer waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, method):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else None
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            # e.g. the NDJSON batches of the export pipeline
+            body = raw.decode()
+
+        stub = self.server.stub
+        with stub.lock:
+            stub.requests.append({"method": method, "path": parsed.path, "params": parse_qs(parsed.query), "json": body, "headers": dict(self.headers)})
+            stub.client_ports.add(self.client_address[1])
+
+        route = None
+        for (routeMethod, pattern), handler in stub.routes.items():
+            if routeMethod == method and pattern.fullmatch(parsed.path):
+                route = handler
+                break
+
+        if stub.latency:
+            time.sleep(stub.latency)
+
+        if route is None:
+            status, payload = 404, {"success": False, "errors": [{"message": f"no stub for {method} {parsed.path}"}]}
+        elif stub.error_rate and stub.random.random() < stub.error_rate:
+            status, payload = 503, {"success": False, "errors": [{"message": "injected error"}]}
+        else:
+            status, payload = route(parsed, parse_qs(parsed.query), body)
+
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._reply("GET")
+
+    def do_POST(self):
+        self._reply("POST")
+
+
+class StubServer:
+    """
+    Local stand in for api.cloudflare.com, routes are keyed by (method, path regex)
+    and return (status, payload). Every answer can be delayed by latency seconds
+    and error_rate of them are a 503 instead, for the benchmarks
+    """
+
+    def __init__(self, latency: float = 0, error_rate: float = 0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.routes = {}
+        self.requests = []
+        self.client_ports = set()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/client/v4"
+
+    def route(self, method, path, handler):
+        self.routes[(method, re.compile(f"/client/v4{path}"))] = handler
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _find(value, key):
+    if isinstance(value, dict):
+        if key in value:
+            return value[key]
+        value = list(value.values())
+    if isinstance(value, list):
+        for item in value:
+            found = _find(item, key)
+            if found is not None:
+                return found
+    return None
+
+
+def series_rows(hosts, start, end, scale=1):
+    """
+    One fake event per host at the top of every hour inside [start, end],
+    grouped by host and date like the adaptive groups datasets
+    """
+
+    grouped = {}
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    if hour < start:
+        hour += timedelta(hours=1)
+
+    while hour <= end:
+        for i, host in enumerate(hosts):
+            key = (hour.strftime("%Y-%m-%d"), host)
+            row = grouped.setdefault(key, {
+                "count": 0,
+                "avg": {"sampleInterval": 1},
+                "sum": {"visits": 0, "edgeResponseBytes": 0},
+                "dimensions": {"host": host, "ts": key[0]}
+            })
+            row["count"] += (i + 1) * scale
+            row["sum"]["visits"] += (i + 2) * scale
+            row["sum"]["edgeResponseBytes"] += (hour.hour + 1) * 100 * scale
+        hour += timedelta(hours=1)
+
+    return list(grouped.values())
+
+
+def status_rows(rows):
+    """
+    The series rows of a traffic query grouped by edgeResponseStatus too, every
+    date and host gets one 404 and the first host two 502 on top of the 200 row
+    """
+
+    statusRows = []
+    for row in rows:
+        statusRows.append({**row, "dimensions": {**row["dimensions"], "status": 200}})
+        statusRows.append({"count": 1, "avg": {"sampleInterval": 1}, "sum": {"visits": 1, "edgeResponseBytes": 10},
+                           "dimensions": {**row["dimensions"], "status": 404}})
+        if row["dimensions"]["host"] == rows[0]["dimensions"]["host"]:
+            statusRows.append({"count": 2, "avg": {"sampleInterval": 1}, "sum": {"visits": 2, "edgeResponseBytes": 20},
+                               "dimensions": {**row["dimensions"], "status": 502}})
+    return statusRows
+
+
+def overview_rows(start, end, step=timedelta(days=1), format="%Y-%m-%d"):
+    rows = []
+    day = start
+    while day < end:
+        n = day.toordinal() % 7 + day.hour + day.minute
+        rows.append({
+            "dimensions": {"timeslot": day.strftime(format)},
+            "uniq": {"uniques": 10 + n},
+            "sum": {
+                "browserMap": [{"pageViews": 5 + n, "key": "Chrome"}],
+                "bytes": 1000 * (n + 1),
+                "cachedBytes": 500 * (n + 1),
+                "cachedRequests": 5 * (n + 1),
+                "contentTypeMap": [{"bytes": 700, "key": "html"}],
+                "countryMap": [{"bytes": 1000, "requests": 10, "threats": 0, "key": "ID"}],
+                "pageViews": 8 + n,
+                "requests": 10 * (n + 1),
+                "responseStatusMap": [{"requests": 10, "key": 200}],
+                "threatPathingMap": [],
+                "threats": n
+            }
+        })
+        day += step
+    return rows
+
+
+def graphql_queries(server):
+    """
+    The GraphQL requests the stub got, without the settings probes of the capabilities
+    """
+    return [r for r in server.requests if r["path"].endswith("/graphql") and "settings {" not in r["json"]["query"]]
+
+
+def _page(found, params, default_per_page):
+    page = int(params.get("page", ["1"])[0])
+    per_page = int(params.get("per_page", [str(default_per_page)])[0])
+    result = found[(page - 1) * per_page:page * per_page]
+    return 200, {
+        "success": True,
+        "result": result,
+        "result_info": {"page": page, "per_page": per_page, "count": len(result),
+                        "total_count": len(found), "total_pages": max(1, -(-len(found) // per_page))}
+    }
+
+
+def plan_settings(plan):
+    """
+    The dataset settings Cloudflare answers for a plan, the adaptive groups
+    are not there with the Free plan
+    """
+
+    adaptive = {"enabled": plan != "Free Website", "maxDuration": 2764800, "notOlderThan": 2764800, "maxPageSize": 10000}
+    return {
+        "httpRequestsAdaptiveGroups": adaptive,
+        "httpRequests1dGroups": {"enabled": True, "maxDuration": None, "notOlderThan": None, "maxPageSize": 10000},
+        "httpRequests1hGroups": {"enabled": True, "maxDuration": 7776000, "notOlderThan": 7776000, "maxPageSize": 10000},
+        "httpRequests1mGroups": {"enabled": True, "maxDuration": 604800, "notOlderThan": 604800, "maxPageSize": 10000},
+        "rumPageloadEventsAdaptiveGroups": {"enabled": True, "maxDuration": None, "notOlderThan": None, "maxPageSize": 10000},
+    }
+
+
+def add_cloudflare_routes(server, plan="Business Website", hosts=("a.example.com", "b.example.com"), row_limit=10000, extra_records=0, zone_ids=("zone-1", "zone-2"), settings=None):
+    """
+    Enough of the REST and GraphQL API for Zone to work against the stub server,
+    the GraphQL answers follow the window of the query and stop at row_limit rows,
+    the DNS listing pages like the real one and has extra_records TXT records on top
+    and the zone listing of every account has zone_ids
+    settings are the dataset settings of every zone and account (plan_settings by
+    default), "error" makes the settings queries fail
+    """
+
+    def zone(url, params, body):
+        return 200, {"success": True, "result": {"id": url.path.split("/")[-1], "plan": {"name": plan}}}
+
+    def zones(url, params, body):
+        found = [{"id": zone_id, "name": f"{zone_id}.example.com", "status": "active", "plan": {"name": plan}} for zone_id in zone_ids]
+        return _page(found, params, 20)
+
+    records = [{"name": name, "type": "A"} for name in hosts] + [{"name": f"cdn.{hosts[0]}", "type": "CNAME"}]
+    records += [{"name": f"txt{n}.{hosts[0]}", "type": "TXT"} for n in range(extra_records)]
+
+    def dns_records(url, params, body):
+        found = [record for record in records if "type" not in params or record["type"] == params["type"][0]]
+        return _page(found, params, 100)
+
+    def graphql(url, params, body):
+        text = body["query"]
+        variables = body.get("variables", {})
+
+        if "settings {" in text:
+            if settings == "error":
+                return 200, {"data": None, "errors": [{"message": "settings are not available"}]}
+            found = settings or plan_settings(plan)
+            aliases = [name for name in variables if name.startswith("zone")] or ["accounts"]
+            return 200, {"data": {"viewer": {alias: [{"settings": {name: found[name] for name in found if name in text}}] for alias in aliases}}, "errors": None}
+
+        if "httpRequests1dGroups" in text:
+            start = datetime.strptime(variables["start_date"], "%Y-%m-%d")
+            end = datetime.strptime(variables["end_date"], "%Y-%m-%d")
+            rows = overview_rows(start, end)
+        elif "httpRequests1hGroups" in text or "httpRequests1mGroups" in text:
+            # datetime windows, end included
+            start = datetime.strptime(variables["start_date"], "%Y-%m-%dT%H:%M:%SZ")
+            end = datetime.strptime(variables["end_date"], "%Y-%m-%dT%H:%M:%SZ") + timedelta(seconds=1)
+            step = timedelta(hours=1) if "httpRequests1hGroups" in text else timedelta(minutes=1)
+            rows = overview_rows(start, end, step, "%Y-%m-%dT%H:%M:%SZ")
+        if "totals:" in text:
+            totals = [{"uniq": {"uniques": sum(row["uniq"]["uniques"] for row in rows)}}]
+            aliases = [name for name in variables if name.startswith("zone") and name != "zoneTag"] or ["zones"]
+            return 200, {"data": {"viewer": {alias: [{"totals": totals, "zones": rows[:row_limit]}] for alias in aliases}}, "errors": None}
+
+        start = datetime.strptime(_find(variables, "datetime_geq"), "%Y-%m-%dT%H:%M:%SZ")
+        end = datetime.strptime(_find(variables, "datetime_leq"), "%Y-%m-%dT%H:%M:%SZ")
+        if "rumPageloadEventsAdaptiveGroups" in text:
+            wanted = _find(variables, "requestHost_in")
+            rows = [row for row in series_rows(hosts, start, end) if wanted is None or row["dimensions"]["host"] in wanted]
+            return 200, {"data": {"viewer": {"accounts": [{"series": rows[:row_limit]}]}}, "errors": None}
+        wanted = _find(variables, "clientRequestHTTPHost_in")
+        rows = [row for row in series_rows(hosts, start, end, 2) if wanted is None or row["dimensions"]["host"] in wanted]
+        if "status: edgeResponseStatus" in text:
+            rows = status_rows(rows)
+        return 200, {"data": {"viewer": {"zones": [{"series": rows[:row_limit]}]}}, "errors": None}
+
+    server.route("GET", r"/zones", zones)
+    server.route("GET", r"/zones/[^/]+", zone)
+    server.route("GET", r"/zones/[^/]+/dns_records", dns_records)
+    server.route("POST", r"/graphql", graphql)
+    return server
@@ -0,0 +1,125 @@
+import asyncio
+import unittest
+from cfmetrics import Auth, Config, MemoryCache, Scheduler, StateStore
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+try:
+    from cfmetrics.aio import AsyncAuth
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+ZONES = tuple(f"zone-{n}" for n in range(1, 61))
+
+
+class TestAccount(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer(), zone_ids=ZONES).start()
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url), scheduler=Scheduler(rest_rate=1000, graphql_rate=1000, backoff=0.01))
+        self.account = self.cf.Account("account-1")
+
+    def tearDown(self):
+        self.cf.close()
+        self.server.stop()
+
+    def requests_to(self, path):
+        return [r for r in self.server.requests if r["path"] == f"/client/v4{path}"]
+
+    def test_zones_are_paged(self):
+        zones = self.account.zones()
+
+        self.assertEqual([zone["id"] for zone in zones], list(ZONES))
+        self.assertEqual(sorted(r["params"]["page"][0] for r in self.requests_to("/zones")), ["1", "2"])
+        self.assertEqual(self.requests_to("/zones")[0]["params"]["account.id"], ["account-1"])
+
+        # the plan came with the listing
+        self.assertEqual(self.account.Zone("zone-7").get_domain_plan(), "Business Website")
+        self.assertEqual(self.requests_to("/zones/zone-7"), [])
+
+    def test_collect_threads(self):
+        results = list(self.account.collect(datasets=["overview", "web_analytics"], workers=8))
+
+        self.assertEqual(len(results), len(ZONES) * 2)
+        self.assertEqual({(zone_id, dataset) for zone_id, dataset, _ in results}, {(z, d) for z in ZONES for d in ("overview", "web_analytics")})
+        self.assertTrue(all(isinstance(result, dict) for _, _, result in results))
+
+    def test_collect_with_state_and_failures(self):
+        state = StateStore()
+        self.server.route("GET", "/zones/zone-2/dns_records", lambda url, params, body: (400, {"success": False}))
+        results = {(zone_id, dataset): result for zone_id, dataset, result in self.account.collect(datasets=["traffics"], zone_ids=["zone-1", "zone-3"], state=state)}
+
+        self.assertEqual(set(results), {("zone-1", "traffics"), ("zone-3", "traffics")})
+        self.assertIsNotNone(state.get_watermark("zone-1", "traffics"))
+
+        # a zone without DNS records fails at the query and comes back as the exception
+        self.server.route("POST", "/graphql", lambda url, params, body: (400, {"errors": [{"message": "bad filter"}]}))
+        _, _, result = next(self.account.collect(datasets=["web_analytics"], zone_ids=["zone-2"]))
+        self.assertIsInstance(result, Exception)
+
+    def test_collect_processes(self):
+        expected = {zone_id: result for zone_id, _, result in self.account.collect(datasets=["overview"], zone_ids=ZONES[:3])}
+        results = {zone_id: result for zone_id, _, result in self.account.collect(datasets=["overview"], zone_ids=ZONES[:3], workers=2, executor="process")}
+        self.assertEqual(results, expected)
+
+    def test_collect_validation(self):
+        with self.assertRaises(ValueError):
+            self.account.collect(executor="fiber")
+        with self.assertRaises(ValueError):
+            self.account.collect(datasets=["dns"])
+        with self.assertRaises(ValueError):
+            self.account.collect(executor="process", state=StateStore())
+        self.assertEqual(self.server.requests, [])
+
+        datasets = (dataset for dataset in ["overview"])
+        self.assertEqual(len(list(self.account.collect(datasets=datasets, zone_ids=ZONES[:2]))), 2)
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test_async_collect(self):
+        async def main():
+            async with AsyncAuth("key", "me@example.com", config=Config(self.server.url), cache=MemoryCache()) as cf:
+                account = cf.Account("account-1")
+                with self.assertRaises(ValueError):
+                    account.collect(datasets=["dns"])
+                zones = await account.zones()
+                return zones, [result async for result in account.collect(datasets=["overview"])]
+
+        zones, results = asyncio.run(main())
+        self.assertEqual(len(zones), len(ZONES))
+        self.assertEqual(sorted(zone_id for zone_id, _, _ in results), sorted(ZONES))
+        self.assertTrue(all(isinstance(result, dict) for _, _, result in results))
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test_async_collect_workers_and_processes(self):
+        expected = {zone_id: result for zone_id, _, result in self.account.collect(datasets=["overview"], zone_ids=ZONES[:3])}
+        running = []
+
+        async def main():
+            async with AsyncAuth("key", "me@example.com", config=Config(self.server.url), cache=MemoryCache()) as cf:
+                account = cf.Account("account-1")
+                collect_zone = account._collect_zone
+
+                async def tracked(*args):
+                    running.append(running[-1] + 1 if running else 1)
+                    try:
+                        return await collect_zone(*args)
+                    finally:
+                        running.append(running[-1] - 1)
+
+                account._collect_zone = tracked
+                with self.assertRaises(ValueError):
+                    account.collect(workers=0)
+                with self.assertRaises(ValueError):
+                    account.collect(executor="process", state=StateStore())
+                threads = {zone_id: result async for zone_id, _, result in account.collect(datasets=["overview"], zone_ids=ZONES[:3], workers=2)}
+                processes = {zone_id: result async for zone_id, _, result in account.collect(datasets=["overview"], zone_ids=ZONES[:3], workers=2, executor="process")}
+                return threads, processes
+
+        threads, processes = asyncio.run(main())
+        self.assertEqual(threads, expected)
+        self.assertEqual(processes, expected)
+        self.assertEqual(max(running), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from cfmetrics import Auth, Config, Scheduler, data_format, dns, query
+from tests.stub_server import StubServer, add_cloudflare_routes, series_rows, graphql_queries
+
+try:
+    from cfmetrics.aio import AsyncAuth
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+HOSTS = ("zone-1.example.com", "www.zone-1.example.com", "zone-2.example.com", "blog.other.org")
+
+
+class TestAccountRum(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer(), hosts=HOSTS, zone_ids=("zone-1", "zone-2", "zone-3")).start()
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url), scheduler=Scheduler(rest_rate=1000, graphql_rate=1000))
+        self.account = self.cf.Account("account-1")
+        self.start = (datetime.utcnow() - timedelta(days=3)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.end = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def tearDown(self):
+        self.cf.close()
+        self.server.stop()
+
+    def expected(self, hosts):
+        start = datetime.strptime(self.start, query.DATETIME_FORMAT)
+        end = datetime.strptime(self.end, query.DATETIME_FORMAT)
+        return data_format.model_items([row for row in series_rows(HOSTS, start, end) if row["dimensions"]["host"] in hosts], "rum")
+
+    def test_zone_of(self):
+        index = dns.zone_index([{"id": "z1", "name": "example.com"}, {"id": "z2", "name": "shop.example.com"}])
+        self.assertEqual(dns.zone_of("www.example.com", index), "z1")
+        self.assertEqual(dns.zone_of("a.shop.example.com", index), "z2")
+        self.assertEqual(dns.zone_of("Example.com.", index), "z1")
+        self.assertIsNone(dns.zone_of("example.org", index))
+
+    def test_one_query_partitioned_by_zone(self):
+        results = self.account.get_web_analytics(self.start, self.end)
+
+        self.assertEqual(list(results), ["zone-1", "zone-2", "zone-3"])
+        self.assertEqual(results["zone-1"], self.expected(HOSTS[:2]))
+        self.assertEqual(results["zone-2"], self.expected(HOSTS[2:3]))
+        self.assertEqual(results["zone-3"]["by_date"]["dates"], [])
+
+        graphql = graphql_queries(self.server)
+        self.assertEqual(len(graphql), 1)
+        self.assertIsNone(_find_host_filter(graphql[0]["json"]))
+        self.assertFalse(any(r["path"].endswith("/dns_records") for r in self.server.requests))
+
+    def test_repeat_call_is_one_graphql_request(self):
+        first = self.account.get_web_analytics(self.start, self.end)
+        sent = len(self.server.requests)
+
+        self.assertEqual(self.account.get_web_analytics(self.start, self.end), first)
+        self.assertEqual([r["path"] for r in self.server.requests[sent:]], ["/client/v4/graphql"])
+
+    def test_truncated_windows_and_zone_ids(self):
+        expected = self.account.get_web_analytics(self.start, self.end, zone_ids=["zone-2"])
+        self.assertEqual(list(expected), ["zone-2"])
+
+        truncated = add_cloudflare_routes(StubServer(), hosts=HOSTS, zone_ids=("zone-1", "zone-2"), row_limit=5).start()
+        cf = Auth("key", "me@example.com", config=Config(truncated.url))
+        try:
+            with mock.patch.object(query, "ROW_LIMIT", 5):
+                self.assertEqual(cf.Account("account-1").get_web_analytics(self.start, self.end, zone_ids=["zone-2"]), expected)
+        finally:
+            cf.close()
+            truncated.stop()
+
+    def test_dns_hosts(self):
+        server = StubServer()
+        server.route("GET", "/zones/zone-1/dns_records", lambda url, params, body: (200, {"result": [{"name": "www.zone-1.example.com", "type": "CNAME"}]}))
+        add_cloudflare_routes(server, hosts=HOSTS, zone_ids=("zone-1", "zone-2")).start()
+        cf = Auth("key", "me@example.com", config=Config(server.url))
+        try:
+            results = cf.Account("account-1").get_web_analytics(self.start, self.end, zone_ids=["zone-1"], dns_hosts=True)
+            self.assertEqual(results["zone-1"], self.expected(HOSTS[1:2]))
+        finally:
+            cf.close()
+            server.stop()
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test_async(self):
+        expected = self.account.get_web_analytics(self.start, self.end)
+
+        async def main():
+            async with AsyncAuth("key", "me@example.com", config=Config(self.server.url)) as cf:
+                return await cf.Account("account-1").get_web_analytics(self.start, self.end)
+
+        self.assertEqual(asyncio.run(main()), expected)
+
+
+def _find_host_filter(body):
+    return [part for part in body["variables"]["filter"]["AND"] if "requestHost_in" in part] or None
+
+
+if __name__ == "__main__":
+    unittest.main()
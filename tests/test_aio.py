@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from cfmetrics import Auth, Config, query
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+try:
+    from cfmetrics.aio import AsyncAuth
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer()).start()
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url))
+        self.zone = self.cf.Account("account-1").Zone("zone-1")
+
+    def tearDown(self):
+        self.cf.close()
+        self.server.stop()
+
+    def run_async(self, method, *args):
+        async def main():
+            async with AsyncAuth("key", "me@example.com", config=Config(self.server.url)) as cf:
+                return await getattr(cf.Account("account-1").Zone("zone-1"), method)(*args)
+        return asyncio.run(main())
+
+    def test_same_result_as_sync(self):
+        start, end = "2025-02-01T00:00:00Z", "2025-02-04T00:00:00Z"
+        self.assertEqual(self.run_async("get_dns_records"), self.zone.get_dns_records())
+        self.assertEqual(self.run_async("get_domain_plan"), self.zone.get_domain_plan())
+        self.assertEqual(self.run_async("get_overview", "2025-02-01", "2025-02-04"), self.zone.get_overview("2025-02-01", "2025-02-04"))
+        self.assertEqual(self.run_async("get_web_analytics", start, end), self.zone.get_web_analytics(start, end))
+
+        start = (datetime.utcnow() - timedelta(days=3)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        end = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.assertEqual(self.run_async("get_traffics", start, end), self.zone.get_traffics(start, end))
+
+    def test_wrong_datetime_format(self):
+        with self.assertRaises(ValueError):
+            self.run_async("get_web_analytics", "2025-1-07 17:05:52Z", "2025-03-07T17:05:52Z")
+
+    def test_stream_same_result(self):
+        start = (datetime.utcnow() - timedelta(days=6)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        end = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        key = lambda row: (row["date"], row["host"])
+
+        async def main(url, method, **options):
+            async with AsyncAuth("key", "me@example.com", config=Config(url)) as cf:
+                result = await getattr(cf.Account("account-1").Zone("zone-1"), method)(start, end, stream=True, **options)
+                if options.get("format") == "rows":
+                    return [row async for row in result]
+                return result
+
+        self.assertEqual(asyncio.run(main(self.server.url, "get_traffics")), self.zone.get_traffics(start, end))
+        self.assertEqual(asyncio.run(main(self.server.url, "get_web_analytics")), self.zone.get_web_analytics(start, end))
+        for status in (False, True):
+            rows = asyncio.run(main(self.server.url, "get_traffics", format="rows", status=status))
+            self.assertEqual(sorted(rows, key=key), sorted(self.zone.get_traffics(start, end, format="rows", status=status), key=key))
+
+        expected = self.zone.get_traffics(start, end)
+        truncated = add_cloudflare_routes(StubServer(), row_limit=5).start()
+        try:
+            with mock.patch.object(query, "ROW_LIMIT", 5):
+                self.assertEqual(asyncio.run(main(truncated.url, "get_traffics")), expected)
+                rows = asyncio.run(main(truncated.url, "get_traffics", format="rows"))
+        finally:
+            truncated.stop()
+        self.assertEqual(sorted(rows, key=key), sorted(self.zone.get_traffics(start, end, format="rows"), key=key))
+
+        self.server.route("POST", r"/graphql", lambda url, params, body: (200, {"data": None, "errors": [{"message": "zone not found"}]}))
+        with self.assertRaises(ValueError) as context:
+            asyncio.run(main(self.server.url, "get_web_analytics"))
+        self.assertIn("zone not found", str(context.exception))
+
+    def test_collect_zones(self):
+        async def main():
+            async with AsyncAuth("key", "me@example.com", config=Config(self.server.url), concurrency=4) as cf:
+                return await cf.Account("account-1").collect_zones([f"zone-{i}" for i in range(20)], "get_domain_plan")
+
+        results = asyncio.run(main())
+        self.assertEqual(len(results), 20)
+        self.assertEqual(set(results.values()), {"Business Website"})
+
+
+if __name__ == "__main__":
+    unittest.main()
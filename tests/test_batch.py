@@ -0,0 +1,50 @@
+import asyncio
+import unittest
+from cfmetrics import Auth, Config, query
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+try:
+    from cfmetrics.aio import AsyncAuth
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class TestBatchOverview(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer()).start()
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url))
+        self.account = self.cf.Account("account-1")
+        self.zone_ids = [f"zone-{i}" for i in range(23)]
+
+    def tearDown(self):
+        self.cf.close()
+        self.server.stop()
+
+    def test_query_zones_overview(self):
+        queryBody = query.query_zones_overview(["zone-a", "zone-b"], "2025-02-01", "2025-02-10")
+        self.assertIn("zone1: zones(filter: {zoneTag: $zone1})", queryBody["query"])
+        self.assertEqual(queryBody["variables"], {"start_date": "2025-02-01", "end_date": "2025-02-10", "zone0": "zone-a", "zone1": "zone-b"})
+
+        with self.assertRaises(ValueError):
+            query.query_zones_overview(["zone-a"], "2025/02/01", "2025-02-10")
+
+    def test_get_overviews_same_as_get_overview(self):
+        overviews = self.account.get_overviews(self.zone_ids, "2025-02-01", "2025-02-10", batch_size=10)
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(list(overviews), self.zone_ids)
+        self.assertEqual(overviews["zone-7"], self.account.Zone("zone-7").get_overview("2025-02-01", "2025-02-10"))
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test_async_get_overviews(self):
+        async def main():
+            async with AsyncAuth("key", "me@example.com", config=Config(self.server.url)) as cf:
+                return await cf.Account("account-1").get_overviews(self.zone_ids, "2025-02-01", "2025-02-10")
+
+        self.assertEqual(asyncio.run(main()), self.account.get_overviews(self.zone_ids, "2025-02-01", "2025-02-10"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from cfmetrics import Auth, Config, MemoryCache, SqliteCache
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+
+class TestCache(unittest.TestCase):
+
+    def check_backend(self, cache):
+        cache.set("zone-1:plan", "Business Website")
+        cache.set("zone-2:plan", "Free Website")
+        self.assertEqual(cache.get("zone-1:plan"), "Business Website")
+
+        # zone-1 was used last, so zone-2 is evicted first
+        cache.set("zone-3:plan", "Pro Website")
+        self.assertIsNone(cache.get("zone-2:plan"))
+        self.assertEqual(cache.get("zone-1:plan"), "Business Website")
+
+        cache.set("zone-4:dns_records", [{"name": "a.example.com"}], ttl=0.05)
+        self.assertEqual(cache.get("zone-4:dns_records"), [{"name": "a.example.com"}])
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("zone-4:dns_records"))
+
+    def test_memory_cache(self):
+        self.check_backend(MemoryCache(ttl=60, max_entries=2))
+
+    def test_sqlite_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SqliteCache(os.path.join(tmp, "cache.db"), ttl=60, max_entries=2)
+            self.check_backend(cache)
+            cache.close()
+
+            # still there after reopening the file
+            cache = SqliteCache(os.path.join(tmp, "cache.db"), ttl=60, max_entries=2)
+            self.assertEqual(cache.get("zone-1:plan"), "Business Website")
+            cache.close()
+
+    def test_get_traffics_only_sends_the_query_once_cached(self):
+        server = add_cloudflare_routes(StubServer()).start()
+        cf = Auth("key", "me@example.com", config=Config(server.url))
+        try:
+            start = (datetime.utcnow() - timedelta(days=3)).strftime("%Y-%m-%dT%H:%M:%SZ")
+            end = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+            first = cf.Account("account-1").Zone("zone-1").get_traffics(start, end)
+            self.assertEqual(len(server.requests), 3)
+
+            # a new Zone from the same Auth shares the cache
+            second = cf.Account("account-1").Zone("zone-1").get_traffics(start, end)
+            cf.Account("account-1").Zone("zone-1").get_web_analytics(start, end)
+            self.assertEqual(first, second)
+            # the account settings are probed once for the web analytics
+            self.assertEqual([r["path"] for r in server.requests[3:]], ["/client/v4/graphql"] * 3)
+            self.assertFalse(any(r["path"] == "/client/v4/zones/zone-1" for r in server.requests))
+        finally:
+            cf.close()
+            server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from cfmetrics import Auth, Config, query
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+try:
+    from cfmetrics.aio import AsyncAuth
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class TestChunking(unittest.TestCase):
+
+    def setUp(self):
+        hosts = ("a.example.com", "b.example.com", "c.example.com")
+        self.full = add_cloudflare_routes(StubServer(), hosts=hosts).start()
+        self.truncated = add_cloudflare_routes(StubServer(), hosts=hosts, row_limit=5).start()
+        self.start = (datetime.utcnow() - timedelta(days=6)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.end = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def tearDown(self):
+        self.full.stop()
+        self.truncated.stop()
+
+    def zone(self, server):
+        return Auth("key", "me@example.com", config=Config(server.url), max_inflight=3).Account("account-1").Zone("zone-1")
+
+    def test_split_window(self):
+        self.assertEqual(query.split_window("2025-02-01T10:00:00Z", "2025-02-05T03:00:00Z"), [
+            ("2025-02-01T10:00:00Z", "2025-02-02T23:59:59Z"), ("2025-02-03T00:00:00Z", "2025-02-05T03:00:00Z")
+        ])
+        self.assertEqual(query.split_window("2025-02-01", "2025-02-06", query.DATE_FORMAT), [("2025-02-01", "2025-02-03"), ("2025-02-03", "2025-02-06")])
+        self.assertIsNone(query.split_window("2025-02-01", "2025-02-02", query.DATE_FORMAT))
+        self.assertIsNone(query.split_window("2025-02-01T10:00:00Z", "2025-02-01T10:00:01Z"))
+
+    def test_truncated_windows_are_split_and_merged(self):
+        expected = {
+            "get_traffics": self.zone(self.full).get_traffics(self.start, self.end),
+            "get_web_analytics": self.zone(self.full).get_web_analytics(self.start, self.end),
+            "get_overview": self.zone(self.full).get_overview("2025-02-01", "2025-02-20"),
+        }
+        self.assertEqual(len(expected["get_traffics"]["by_date"]["date_lists"]), 7)
+
+        with mock.patch.object(query, "ROW_LIMIT", 5):
+            zone = self.zone(self.truncated)
+            self.assertEqual(zone.get_traffics(self.start, self.end), expected["get_traffics"])
+            self.assertEqual(zone.get_web_analytics(self.start, self.end), expected["get_web_analytics"])
+            self.assertEqual(zone.get_overview("2025-02-01", "2025-02-20"), expected["get_overview"])
+
+    def test_in_flight_cap_holds_across_nested_pools(self):
+        (key, graphql), = [(key, handler) for key, handler in self.truncated.routes.items() if key[0] == "POST"]
+        lock = threading.Lock()
+        active = {"now": 0, "most": 0}
+
+        def counted(url, params, body):
+            with lock:
+                active["now"] += 1
+                active["most"] = max(active["most"], active["now"])
+            time.sleep(0.01)
+            with lock:
+                active["now"] -= 1
+            return graphql(url, params, body)
+
+        self.truncated.routes[key] = counted
+        cf = Auth("key", "me@example.com", config=Config(self.truncated.url), max_inflight=2)
+        try:
+            # every worker of collect splits its windows on a pool of its own
+            with mock.patch.object(query, "ROW_LIMIT", 5):
+                results = list(cf.Account("account-1").collect(datasets=["traffics"], zone_ids=["zone-1", "zone-2"], workers=4))
+        finally:
+            cf.close()
+
+        self.assertFalse(any(isinstance(result, Exception) for _, _, result in results))
+        self.assertEqual(active["most"], 2)
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test_async_truncated_windows(self):
+        expected = self.zone(self.full).get_traffics(self.start, self.end)
+
+        async def main():
+            async with AsyncAuth("key", "me@example.com", config=Config(self.truncated.url), concurrency=3) as cf:
+                return await cf.Account("account-1").Zone("zone-1").get_traffics(self.start, self.end)
+
+        with mock.patch.object(query, "ROW_LIMIT", 5):
+            self.assertEqual(asyncio.run(main()), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
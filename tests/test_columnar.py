@@ -0,0 +1,54 @@
+import unittest
+from datetime import datetime, timedelta
+from cfmetrics import Auth, Config, data_format
+from benchmarks.bench_model import synthetic_series
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+try:
+    import numpy
+    from cfmetrics.columnar import Series
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestColumnar(unittest.TestCase):
+
+    def test_same_as_model(self):
+        response = synthetic_series(3400, 17)
+        series = Series.from_result(response, "traffic")
+        dataCompiled = data_format.model(response, "traffic")
+
+        self.assertEqual(len(series), 3400)
+        self.assertEqual(series.to_dict(), dataCompiled)
+
+        pageViews = sum(domain["metrics"]["page_views"] for date in dataCompiled["by_date"]["dates"] for domain in date["domains"])
+        self.assertEqual(series.totals()["page_views"], pageViews)
+
+        byDate = series.group_by_date()
+        self.assertEqual(list(byDate), dataCompiled["by_date"]["date_lists"])
+        first = dataCompiled["by_date"]["dates"][0]
+        self.assertEqual(byDate[first["date"]]["data_transfer_bytes"], sum(domain["metrics"]["data_transfer_bytes"] for domain in first["domains"]))
+
+        byHost = series.group_by_host()
+        domain = dataCompiled["by_domain"]["domains"][3]
+        self.assertEqual(byHost[domain["name"]]["requests"], sum(date["metrics"]["requests"] for date in domain["dates"]))
+        self.assertEqual(str(series.ts.dtype), "datetime64[D]")
+        self.assertEqual(series.host[5], "host5.example.com")
+
+    def test_zone_format(self):
+        server = add_cloudflare_routes(StubServer()).start()
+        zone = Auth("key", "me@example.com", config=Config(server.url)).Account("account-1").Zone("zone-1")
+        try:
+            start = (datetime.utcnow() - timedelta(days=3)).strftime("%Y-%m-%dT%H:%M:%SZ")
+            end = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+            self.assertEqual(zone.get_traffics(start, end, format="columnar").to_dict(), zone.get_traffics(start, end))
+            self.assertEqual(zone.get_web_analytics(start, end, format="columnar").to_dict(), zone.get_web_analytics(start, end))
+            with self.assertRaises(ValueError):
+                zone.get_web_analytics(start, end, format="arrow")
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from cfmetrics import MetricStore
+from cfmetrics.daemon import Daemon, JsonLinesSink, load_sink, main
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+
+class ListSink:
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, zone_id, dataset, dataCompiled):
+        self.written.append((zone_id, dataset))
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer()).start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config = {
+            "api_key": "key",
+            "api_key_email": "me@example.com",
+            "api_url": self.server.url,
+            "workers": 2,
+            "accounts": [{"account_id": "account-1", "zones": ["zone-1", "zone-2"], "datasets": ["overview", "traffics"]}]
+        }
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def test_run_once_collects_every_zone(self):
+        sink = ListSink()
+        daemon = Daemon(self.config, sink=sink)
+        try:
+            daemon.run(once=True)
+            self.assertEqual(sorted(sink.written), [("zone-1", "overview"), ("zone-1", "traffics"), ("zone-2", "overview"), ("zone-2", "traffics")])
+
+            # nothing is due yet, and the plan and DNS records came from the shared cache once
+            sent = len(self.server.requests)
+            daemon.run(once=True)
+            self.assertEqual(len(self.server.requests), sent)
+            self.assertEqual(len([r for r in self.server.requests if r["path"].endswith("/dns_records")]), 2)
+        finally:
+            daemon.close()
+
+    def test_intervals_and_stop(self):
+        self.config["intervals"] = {"overview": 0.2, "traffics": 3600}
+        sink = ListSink()
+        daemon = Daemon(self.config, sink=sink)
+        thread = threading.Thread(target=daemon.run)
+        thread.start()
+        time.sleep(1)
+        daemon.stop()
+        thread.join(5)
+        daemon.close()
+
+        self.assertFalse(thread.is_alive())
+        self.assertGreater(sink.written.count(("zone-1", "overview")), 1)
+        self.assertEqual(sink.written.count(("zone-1", "traffics")), 1)
+
+    def test_failures_are_counted_and_rescheduled(self):
+        self.config["accounts"][0]["zones"] = ["zone-1"]
+        self.server.route("POST", "/graphql", lambda url, params, body: (400, {"errors": [{"message": "nope"}]}))
+        daemon = Daemon(self.config, sink=ListSink())
+        try:
+            with self.assertLogs("cfmetrics.daemon", "ERROR") as logs:
+                daemon.run(once=True)
+            self.assertEqual([(job.runs, job.failures) for job in daemon.jobs], [(1, 1), (1, 1)])
+            self.assertEqual(len(logs.records), 2)
+            self.assertTrue(all(record.exc_info for record in logs.records))
+            self.assertTrue(all(job.due > time.monotonic() for job in daemon.jobs))
+        finally:
+            daemon.close()
+
+    def test_main_with_a_config_file(self):
+        path = os.path.join(self.tmp.name, "cfmetrics.json")
+        self.config["sink"] = {"type": "sqlite", "path": os.path.join(self.tmp.name, "metrics.db")}
+        self.config["state"] = os.path.join(self.tmp.name, "state.db")
+        with open(path, "w") as f:
+            json.dump(self.config, f)
+
+        self.assertEqual(main([path, "--once"]), 0)
+
+        store = MetricStore(self.config["sink"]["path"])
+        self.assertEqual(sorted(store.zones()), ["zone-1", "zone-2"])
+        store.close()
+
+    def test_sinks(self):
+        path = os.path.join(self.tmp.name, "out.jsonl")
+        sink = load_sink({"type": "jsonl", "path": path})
+        self.assertIsInstance(sink, JsonLinesSink)
+        sink.write("zone-1", "overview", {"by_date": {}})
+        sink.close()
+        with open(path) as f:
+            self.assertEqual(json.loads(f.readline())["zone_id"], "zone-1")
+
+        self.assertIsInstance(load_sink({"type": "tests.test_daemon:ListSink"}), ListSink)
+        with self.assertRaises(ValueError):
+            load_sink({"type": "parquet"})
+
+    def test_config_validation(self):
+        with self.assertRaises(ValueError):
+            Daemon({**self.config, "accounts": [{"account_id": "account-1", "datasets": ["dns"]}]})
+        with self.assertRaises(ValueError):
+            Daemon({**self.config, "accounts": []})
+
+
+if __name__ == "__main__":
+    unittest.main()
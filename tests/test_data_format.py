@@ -0,0 +1,37 @@
+import unittest
+from cfmetrics import data_format
+from benchmarks.bench_model import FakeResponse, legacy_model, synthetic_series
+
+
+def rum_response(series):
+    return FakeResponse({"data": {"viewer": {"accounts": [{"series": series}]}}})
+
+
+class TestDataFormat(unittest.TestCase):
+
+    def test_model_same_as_legacy(self):
+        response = synthetic_series(2000, 37)
+        self.assertEqual(data_format.model(response, "traffic"), legacy_model(response, "traffic"))
+
+    def test_model_keeps_first_row_of_duplicate(self):
+        series = [
+            {"count": 1, "sum": {"visits": 2}, "dimensions": {"host": "a.example.com", "ts": "2025-02-01"}},
+            {"count": 9, "sum": {"visits": 9}, "dimensions": {"host": "a.example.com", "ts": "2025-02-01"}},
+            {"count": 3, "sum": {"visits": 4}, "dimensions": {"host": "b.example.com", "ts": "2025-02-01"}},
+            {"count": 5, "sum": {"visits": 6}, "dimensions": {"host": "a.example.com", "ts": "2025-02-02"}},
+        ]
+        dataCompiled = data_format.model(rum_response(series), "rum")
+
+        self.assertEqual(dataCompiled["by_date"]["date_lists"], ["2025-02-01", "2025-02-02"])
+        self.assertEqual(dataCompiled["by_date"]["dates"][0]["domain_lists"], ["a.example.com", "b.example.com"])
+        self.assertEqual(dataCompiled["by_date"]["dates"][0]["domains"][0]["metrics"], {"page_views": 1, "visits": 2})
+        self.assertEqual(dataCompiled["by_domain"]["domain_lists"], ["a.example.com", "b.example.com"])
+        self.assertEqual(dataCompiled["by_domain"]["domains"][0]["date_lists"], ["2025-02-01", "2025-02-02"])
+
+    def test_model_requires_json(self):
+        with self.assertRaises(ValueError):
+            data_format.model([], "traffic")
+
+
+if __name__ == "__main__":
+    unittest.main()
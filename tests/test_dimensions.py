@@ -0,0 +1,69 @@
+import pickle
+import unittest
+from cfmetrics import DimensionMap, overview_maps
+
+
+def overview(*days):
+    return {"totalUniqueUsers": 0, "by_date": {
+        "dates": [{"date": date, "metrics": {"countryMap": countries}} for date, countries in days],
+        "date_lists": [date for date, _ in days]
+    }}
+
+
+DAYS = overview(
+    ("2025-02-01", [{"key": "ID", "requests": 10, "bytes": 100, "threats": 1}, {"key": "SG", "requests": 4, "bytes": 40, "threats": 0}]),
+    ("2025-02-02", [{"key": "ID", "requests": 5, "bytes": 50, "threats": 0}, {"key": "US", "requests": 20, "bytes": 10, "threats": 2}]),
+    ("2025-02-03", [{"key": "SG", "requests": 1, "bytes": 10, "threats": 0}]),
+)
+
+
+class TestDimensionMap(unittest.TestCase):
+
+    def test_overview_maps(self):
+        countries = overview_maps(DAYS)["countryMap"]
+        self.assertEqual(countries.get("ID"), {"requests": 15, "bytes": 150, "threats": 1})
+        self.assertEqual(countries.totals(), {"requests": 40, "bytes": 210, "threats": 3})
+        self.assertEqual(len(countries), 3)
+        self.assertEqual(len(overview_maps(DAYS)["browserMap"]), 0)
+
+        self.assertEqual(overview_maps(DAYS, "2025-02-02", "2025-02-03")["countryMap"].to_entries(),
+                         [{"key": "ID", "requests": 5, "bytes": 50, "threats": 0}, {"key": "US", "requests": 20, "bytes": 10, "threats": 2}])
+
+    def test_top(self):
+        countries = overview_maps(DAYS)["countryMap"]
+        self.assertEqual([key for key, _ in countries.top(2)], ["US", "ID"])
+        self.assertEqual([key for key, _ in countries.top(1, "bytes")], ["ID"])
+        self.assertEqual(countries.top(10, "threats"), [("US", {"requests": 20, "bytes": 10, "threats": 2}), ("ID", {"requests": 15, "bytes": 150, "threats": 1})])
+
+    def test_merge_and_subtract(self):
+        first = overview_maps(DAYS, end="2025-02-02")["countryMap"]
+        rest = overview_maps(DAYS, start="2025-02-02")["countryMap"]
+        total = overview_maps(DAYS)["countryMap"]
+
+        self.assertEqual(first + rest, total)
+        self.assertEqual(sum([first, rest]), total)
+        self.assertEqual(total - first, rest)
+        # + and - don't change the maps, += and -= do
+        self.assertEqual(first.get("US"), None)
+        rolling = total.copy()
+        rolling -= first
+        self.assertEqual(rolling, rest)
+        self.assertEqual(rolling.get("SG"), {"requests": 1, "bytes": 10, "threats": 0})
+
+        with self.assertRaises(ValueError):
+            total + DimensionMap("browserMap")
+
+    def test_pickle(self):
+        total = overview_maps(DAYS)["countryMap"]
+        self.assertEqual(pickle.loads(pickle.dumps(total)), total)
+
+    def test_custom_fields(self):
+        ipClasses = DimensionMap.from_entries("ipClassMap", [{"key": "clean", "requests": 3}], fields=("requests",))
+        ipClasses += DimensionMap.from_entries("ipClassMap", [{"key": "clean", "requests": 2}, {"key": "tor", "requests": 1}], fields=("requests",))
+        self.assertEqual(ipClasses.to_entries(), [{"key": "clean", "requests": 5}, {"key": "tor", "requests": 1}])
+        with self.assertRaises(ValueError):
+            DimensionMap("ipClassMap")
+
+
+if __name__ == "__main__":
+    unittest.main()
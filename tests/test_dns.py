@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+from unittest import mock
+from cfmetrics import Auth, Config, MemoryCache, dns
+from cfmetrics.aio import AsyncAuth
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+
+class TestDns(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def zone(self):
+        self.server.start()
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url), cache=MemoryCache(ttl=0))
+        self.addCleanup(self.cf.close)
+        return self.cf.Account("account-1").Zone("zone-1")
+
+    def dns_requests(self):
+        return [r["params"] for r in self.server.requests if r["path"].endswith("/dns_records")]
+
+    def test_small_zone_is_one_listing(self):
+        add_cloudflare_routes(self.server, extra_records=5)
+        records = self.zone().get_dns_records()
+
+        self.assertEqual([r["name"] for r in records], ["a.example.com", "b.example.com", "cdn.a.example.com"])
+        self.assertEqual(self.dns_requests(), [{"page": ["1"], "per_page": [str(dns.PAGE_SIZE)]}])
+
+    def test_pages_of_the_unfiltered_listing(self):
+        add_cloudflare_routes(self.server, extra_records=5)
+        with mock.patch.object(dns, "PAGE_SIZE", 3):
+            records = self.zone().get_dns_records()
+
+        self.assertEqual([r["name"] for r in records], ["a.example.com", "b.example.com", "cdn.a.example.com"])
+        self.assertEqual(sorted(p["page"][0] for p in self.dns_requests()), ["1", "2", "3"])
+        self.assertFalse(any("type" in p for p in self.dns_requests()))
+
+    def test_listing_per_type_when_it_is_cheaper(self):
+        # lots of TXT records and only a few A and CNAME ones
+        records = [{"name": f"txt{n}.example.com", "type": "TXT"} for n in range(40)]
+        records += [{"name": "a.example.com", "type": "A"}, {"name": "www.example.com", "type": "CNAME"}]
+
+        def listing(url, params, body):
+            found = [r for r in records if "type" not in params or r["type"] == params["type"][0]]
+            page, per_page = int(params["page"][0]), int(params["per_page"][0])
+            return 200, {"result": found[(page - 1) * per_page:page * per_page],
+                         "result_info": {"total_count": len(found), "total_pages": max(1, -(-len(found) // per_page))}}
+
+        self.server.route("GET", "/zones/zone-1/dns_records", listing)
+        with mock.patch.object(dns, "PAGE_SIZE", 5):
+            zone = self.zone()
+            self.assertEqual([r["name"] for r in zone.get_dns_records()], ["a.example.com", "www.example.com"])
+            self.assertEqual(len(self.dns_requests()), 3)
+            self.assertEqual([r["name"] for r in zone.iter_dns_records(["TXT"])][:2], ["txt0.example.com", "txt1.example.com"])
+
+    def test_failed_page_raises_and_is_not_cached(self):
+        calls = []
+
+        def listing(url, params, body):
+            calls.append(params)
+            if params["page"] == ["2"] and len(calls) < 4:
+                return 400, {"success": False}
+            return 200, {"result": [{"name": f"h{params['page'][0]}.example.com", "type": "A"}],
+                         "result_info": {"total_count": 2, "total_pages": 2}}
+
+        self.server.route("GET", "/zones/zone-1/dns_records", listing)
+        zone = self.zone()
+        zone.cache = MemoryCache(ttl=60)
+        with self.assertRaises(ConnectionError):
+            zone.get_dns_records()
+        self.assertIsNone(zone.cache.get("zone-1:dns_records"))
+        self.assertEqual([r["name"] for r in zone.get_dns_records()], ["h1.example.com", "h2.example.com"])
+        self.assertIsNotNone(zone.cache.get("zone-1:dns_records"))
+
+        async def main():
+            async with AsyncAuth("key", "me@example.com", config=Config(self.server.url)) as cf:
+                return await cf.Account("account-1").Zone("zone-1").get_dns_records()
+
+        calls.clear()
+        with self.assertRaises(ConnectionError):
+            asyncio.run(main())
+
+    def test_async_zone_pages_the_same_way(self):
+        add_cloudflare_routes(self.server, extra_records=5)
+        with mock.patch.object(dns, "PAGE_SIZE", 3):
+            records = self.zone().get_dns_records()
+
+            async def run():
+                async with AsyncAuth("key", "me@example.com", config=Config(self.server.url), cache=MemoryCache(ttl=0)) as cf:
+                    return await cf.Account("account-1").Zone("zone-1").get_dns_records()
+
+            self.assertEqual(asyncio.run(run()), records)
+
+
+if __name__ == "__main__":
+    unittest.main()
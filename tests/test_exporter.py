@@ -0,0 +1,71 @@
+import unittest
+import requests
+from cfmetrics.daemon import Daemon
+from cfmetrics.exporter import Exporter, samples
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+
+def series(dates):
+    return {"by_date": {"date_lists": dates, "dates": [
+        {"date": date, "domain_lists": ["a.example.com"], "domains": [{"name": "a.example.com", "metrics": {"page_views": n, "visits": n * 2}}]}
+        for n, date in enumerate(dates)
+    ]}}
+
+
+class TestExporter(unittest.TestCase):
+
+    def test_samples_are_the_latest_date(self):
+        lines = samples("zone-1", "web_analytics", series(["2025-02-02", "2025-02-03", "2025-02-01"]))
+        self.assertEqual(lines["cloudflare_rum_page_views"], ['cloudflare_rum_page_views{zone_id="zone-1",host="a.example.com"} 1'])
+        self.assertEqual(lines["cloudflare_rum_visits"], ['cloudflare_rum_visits{zone_id="zone-1",host="a.example.com"} 2'])
+        self.assertEqual(samples("zone-1", "web_analytics", series([])), {})
+
+    def test_render(self):
+        exporter = Exporter()
+        body = exporter.body
+        exporter.write("zone-2", "web_analytics", series(["2025-02-01"]), now=10)
+        exporter.write("zone-1", "web_analytics", series(["2025-02-01"]), now=20)
+        self.assertNotEqual(exporter.body, body)
+
+        text = exporter.body.decode()
+        self.assertIn("# TYPE cloudflare_rum_page_views gauge", text)
+        self.assertLess(text.index('zone_id="zone-1",host'), text.index('zone_id="zone-2",host'))
+        self.assertIn('cloudflare_exporter_last_update_timestamp_seconds{zone_id="zone-1",dataset="web_analytics"} 20.000', text)
+
+        # a newer result of the same zone replaces its samples
+        exporter.write("zone-1", "web_analytics", series(["2025-02-01", "2025-02-02"]), now=30)
+        self.assertEqual(exporter.body.decode().count('cloudflare_rum_page_views{zone_id="zone-1"'), 1)
+
+    def test_daemon_serves_metrics(self):
+        server = add_cloudflare_routes(StubServer()).start()
+        daemon = Daemon({
+            "api_key": "key",
+            "api_key_email": "me@example.com",
+            "api_url": server.url,
+            "exporter": {"host": "127.0.0.1", "port": 0},
+            "accounts": [{"account_id": "account-1", "zones": ["zone-1"], "status": True}]
+        })
+        try:
+            self.assertIs(daemon.sink, daemon.exporter)
+            daemon.run(once=True)
+            host, port = daemon.exporter.server.server_address
+            sent = len(server.requests)
+
+            response = requests.get(f"http://{host}:{port}/metrics")
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('cloudflare_zone_requests{zone_id="zone-1"}', response.text)
+            self.assertIn('cloudflare_zone_status_requests{zone_id="zone-1",status="200"}', response.text)
+            self.assertIn('cloudflare_traffic_page_views{zone_id="zone-1",host="a.example.com"}', response.text)
+            self.assertIn('cloudflare_traffic_errors{zone_id="zone-1",host="a.example.com"}', response.text)
+            self.assertIn('cloudflare_rum_visits{zone_id="zone-1",host="b.example.com"}', response.text)
+            self.assertEqual(requests.get(f"http://{host}:{port}/other").status_code, 404)
+
+            # a scrape never goes to Cloudflare
+            self.assertEqual(len(server.requests), sent)
+        finally:
+            daemon.close()
+            server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
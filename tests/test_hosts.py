@@ -0,0 +1,94 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from cfmetrics import Auth, Config, query
+from tests.stub_server import StubServer, add_cloudflare_routes, _find, graphql_queries
+
+try:
+    from cfmetrics.aio import AsyncAuth
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class TestHosts(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer()
+        # the zone has a wildcard and a name twice, c.example.com has traffic but no record
+        self.server.route("GET", "/zones/zone-1/dns_records", lambda url, params, body: (200, {"result": [
+            {"name": "a.example.com", "type": "A"}, {"name": "*.example.com", "type": "A"},
+            {"name": "B.example.com", "type": "CNAME"}, {"name": "a.example.com", "type": "CNAME"}
+        ]}))
+        add_cloudflare_routes(self.server, hosts=("a.example.com", "b.example.com", "c.example.com")).start()
+        self.start = (datetime.utcnow() - timedelta(days=3)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.end = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def tearDown(self):
+        self.server.stop()
+
+    def zone(self):
+        cf = Auth("key", "me@example.com", config=Config(self.server.url))
+        self.addCleanup(cf.close)
+        return cf.Account("account-1").Zone("zone-1")
+
+    def graphql_filters(self):
+        return [r["json"]["variables"]["filter"] for r in graphql_queries(self.server)]
+
+    def test_compact_hosts(self):
+        self.assertEqual(query.compact_hosts(["a.example.com", "*.example.com", "A.example.com.", "b.example.com"]), ["a.example.com", "b.example.com"])
+
+    def test_host_shards(self):
+        hosts = [f"h{n}.example.com" for n in range(5)]
+        with mock.patch.object(query, "HOST_FILTER_LIMIT", 2):
+            self.assertEqual(query.host_shards(hosts, "accounts"), ([hosts[0:2], hosts[2:4], hosts[4:]], None))
+            self.assertEqual(query.host_shards(hosts, "zones"), ([None], set(hosts)))
+            self.assertEqual(query.host_shards(hosts[:2], "zones"), ([hosts[:2]], None))
+
+    def test_filter_is_an_in_list(self):
+        dataCompiled = self.zone().get_traffics(self.start, self.end)
+
+        self.assertEqual(dataCompiled["by_domain"]["domain_lists"], ["a.example.com", "b.example.com"])
+        self.assertEqual(_find(self.graphql_filters()[0], "clientRequestHTTPHost_in"), ["a.example.com", "b.example.com"])
+        self.assertNotIn('"OR"', str(self.graphql_filters()[0]).replace("'", '"'))
+
+    def test_whole_zone_is_filtered_client_side(self):
+        expected = self.zone().get_traffics(self.start, self.end)
+        self.server.requests.clear()
+
+        with mock.patch.object(query, "HOST_FILTER_LIMIT", 1):
+            zone = self.zone()
+            self.assertEqual(zone.get_traffics(self.start, self.end), expected)
+            self.assertEqual(zone.get_traffics(self.start, self.end, stream=True), expected)
+
+        self.assertIsNone(_find(self.graphql_filters()[0], "clientRequestHTTPHost_in"))
+
+    def test_long_host_lists_are_sharded(self):
+        expected = self.zone().get_web_analytics(self.start, self.end)
+        self.server.requests.clear()
+
+        with mock.patch.object(query, "HOST_FILTER_LIMIT", 1):
+            zone = self.zone()
+            self.assertEqual(zone.get_web_analytics(self.start, self.end), expected)
+            self.assertEqual(sorted(_find(f, "requestHost_in")[0] for f in self.graphql_filters()), ["a.example.com", "b.example.com"])
+            self.assertEqual(zone.get_web_analytics(self.start, self.end, stream=True), expected)
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test_async_sharding(self):
+        expected = self.zone().get_web_analytics(self.start, self.end)
+
+        async def main():
+            async with AsyncAuth("key", "me@example.com", config=Config(self.server.url)) as cf:
+                zone = cf.Account("account-1").Zone("zone-1")
+                return await zone.get_web_analytics(self.start, self.end), await zone.get_traffics(self.start, self.end)
+
+        with mock.patch.object(query, "HOST_FILTER_LIMIT", 1):
+            rum, traffic = asyncio.run(main())
+
+        self.assertEqual(rum, expected)
+        self.assertEqual(traffic["by_domain"]["domain_lists"], ["a.example.com", "b.example.com"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from cfmetrics import Auth, Config, Instrumentation, Scheduler
+from cfmetrics.instrument import url_class
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+
+class FakeSpan:
+
+    def __init__(self, name):
+        self.name = name
+        self.attributes = {}
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+
+class FakeTracer:
+    """
+    The part of an OpenTelemetry tracer that Instrumentation uses
+    """
+
+    def __init__(self):
+        self.spans = []
+
+    @contextmanager
+    def start_as_current_span(self, name):
+        self.spans.append(FakeSpan(name))
+        yield self.spans[-1]
+
+
+class TestInstrument(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer()).start()
+        self.spans = []
+        self.tracer = FakeTracer()
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url), scheduler=Scheduler(backoff=0.01),
+                       instrumentation=Instrumentation(hooks=[self.spans.append], tracer=self.tracer))
+        self.zone = self.cf.Account("account-1").Zone("zone-1")
+        self.start = (datetime.utcnow() - timedelta(days=2)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.end = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def tearDown(self):
+        self.cf.close()
+        self.server.stop()
+
+    def test_url_class(self):
+        base = "https://api.cloudflare.com/client/v4"
+        self.assertEqual(url_class(f"{base}/graphql"), "graphql")
+        self.assertEqual(url_class(f"{base}/zones/abc"), "zone")
+        self.assertEqual(url_class(f"{base}/zones/abc/dns_records"), "dns_records")
+        self.assertEqual(url_class(f"{base}/zones"), "zones")
+
+    def test_get_traffics_spans(self):
+        dataCompiled = self.zone.get_traffics(self.start, self.end)
+        stats = self.cf.instrumentation.stats.snapshot()
+
+        self.assertEqual(sorted(stats), ["decode:graphql", "format:traffic", "http:dns_records", "http:graphql"])
+        # the settings probe and the traffic query
+        self.assertEqual(stats["http:graphql"]["count"], 2)
+        self.assertGreater(stats["http:graphql"]["bytes"], 0)
+        rows = sum(len(dateData["domains"]) for dateData in dataCompiled["by_date"]["dates"])
+        self.assertEqual(stats["format:traffic"]["rows"], rows)
+
+        http = [span for span in self.spans if span.name == "http"]
+        self.assertEqual([span.attributes["status"] for span in http], [200, 200, 200])
+        self.assertTrue(all(span.duration >= 0 and span.error is None for span in self.spans))
+
+        self.assertEqual(len(self.tracer.spans), len(self.spans))
+        self.assertEqual(self.tracer.spans[-1].name, "cfmetrics.format")
+        self.assertEqual(self.tracer.spans[-1].attributes["cfmetrics.rows"], rows)
+
+    def test_errors_and_reset(self):
+        self.server.error_rate = 1
+        with self.assertRaises(ConnectionError):
+            self.zone.get_overview("2025-02-01", "2025-02-03")
+
+        stats = self.cf.instrumentation.stats.snapshot(reset=True)
+        self.assertEqual(stats["http:graphql"]["errors"], stats["http:graphql"]["count"])
+        self.assertGreater(stats["http:graphql"]["count"], 1)
+        self.assertEqual(self.cf.instrumentation.stats.snapshot(), {})
+
+        self.server.error_rate = 0
+        self.zone.get_overview("2025-02-01", "2025-02-03")
+        self.assertEqual(self.cf.instrumentation.stats.snapshot()["format:overview"]["rows"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from cfmetrics import Auth, Config, query
+from cfmetrics.pipeline import Pipeline, BatchSink, NdjsonSink, CsvSink, HttpBulkSink, traffic_rows, overview_rows
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+
+class ListSink(BatchSink):
+
+    def __init__(self, batch_size=10, delay=0, on_batch=None):
+        super().__init__(batch_size)
+        self.batches = []
+        self.delay = delay
+        self.on_batch = on_batch
+
+    def write_batch(self, rows):
+        if self.on_batch:
+            self.on_batch(rows)
+        time.sleep(self.delay)
+        self.batches.append(rows)
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer()).start()
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url))
+        self.account = self.cf.Account("account-1")
+        self.start = (datetime.utcnow() - timedelta(days=3)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.end = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def tearDown(self):
+        self.cf.close()
+        self.server.stop()
+
+    def key(self, row):
+        return row["date"], row["host"]
+
+    def test_streamed_rows(self):
+        zone = self.account.Zone("zone-1")
+        for status in (False, True):
+            expected = zone.get_traffics(self.start, self.end, format="rows", status=status)
+            streamed = zone.get_traffics(self.start, self.end, format="rows", stream=True, status=status)
+            self.assertFalse(isinstance(streamed, list))
+            self.assertEqual(sorted(streamed, key=self.key), sorted(expected, key=self.key))
+
+        expected = zone.get_web_analytics(self.start, self.end, format="rows")
+        self.assertEqual(sorted(zone.get_web_analytics(self.start, self.end, format="rows", stream=True), key=self.key), sorted(expected, key=self.key))
+
+    def test_streamed_rows_of_a_truncated_answer(self):
+        expected = self.account.Zone("zone-1").get_traffics(self.start, self.end, format="rows")
+        truncated = add_cloudflare_routes(StubServer(), row_limit=3).start()
+        cf = Auth("key", "me@example.com", config=Config(truncated.url))
+        try:
+            with mock.patch.object(query, "ROW_LIMIT", 3):
+                streamed = list(cf.Account("account-1").Zone("zone-1").get_traffics(self.start, self.end, format="rows", stream=True))
+        finally:
+            cf.close()
+            truncated.stop()
+
+        self.assertEqual(sorted(streamed, key=self.key), sorted(expected, key=self.key))
+
+    def fetchers(self):
+        for zone_id in ("zone-1", "zone-2"):
+            zone = self.account.Zone(zone_id)
+            yield traffic_rows(zone, self.start, self.end)
+            yield overview_rows(zone, self.start[:10], self.end[:10])
+
+    def test_rows_to_files(self):
+        expected = self.account.Zone("zone-1").get_traffics(self.start, self.end, format="rows")
+        self.assertEqual(expected[0].keys(), {"date", "host", "page_views", "requests", "data_transfer_bytes"})
+
+        with tempfile.TemporaryDirectory() as tmp:
+            ndjsonPath, csvPath = os.path.join(tmp, "rows.ndjson"), os.path.join(tmp, "traffics.csv")
+            with NdjsonSink(ndjsonPath, batch_size=4) as ndjson, CsvSink(csvPath, batch_size=4) as table:
+                result = Pipeline([ndjson, table], workers=2).run(self.fetchers())
+
+            with open(ndjsonPath) as f:
+                lines = [json.loads(line) for line in f]
+            with open(csvPath) as f:
+                table = list(csv.DictReader(f))
+
+        self.assertEqual(result, {"rows": len(lines), "errors": []})
+        traffics = [line for line in lines if line["dataset"] == "traffics"]
+        overviews = [line for line in lines if line["dataset"] == "overview"]
+        self.assertEqual(len(traffics), 2 * len(expected))
+        self.assertEqual(sorted((row["date"], row["host"]) for row in traffics if row["zone_id"] == "zone-1"), sorted((row["date"], row["host"]) for row in expected))
+        self.assertEqual(len(overviews), 2 * 3)
+        self.assertEqual(len(table), len(lines))
+        # the columns are the ones of the first row, maps are JSON
+        countryMaps = [row["countryMap"] for row in table if row.get("countryMap")]
+        self.assertTrue(all(isinstance(json.loads(value), list) for value in countryMaps))
+
+    def test_stages_and_errors(self):
+        def failing():
+            yield {"zone_id": "zone-x", "page_views": 1}
+            raise ConnectionError("boom")
+
+        sink = ListSink(batch_size=100)
+        stages = [lambda row: row if row.get("dataset") == "traffics" else None, lambda row: {"zone_id": row["zone_id"], "views": row["page_views"]}]
+        result = Pipeline([sink], stages=stages).run([failing(), *self.fetchers()])
+
+        rows = [row for batch in sink.batches for row in batch]
+        self.assertEqual(result["rows"], len(rows))
+        self.assertEqual({row["zone_id"] for row in rows}, {"zone-1", "zone-2"})
+        self.assertEqual(set(rows[0]), {"zone_id", "views"})
+        self.assertEqual([(index, str(e)) for index, e in result["errors"]], [(0, "boom")])
+
+    def test_backpressure(self):
+        produced = [0]
+
+        def fetcher():
+            for n in range(2000):
+                produced[0] += 1
+                yield {"n": n}
+
+        waiting = []
+        sink = ListSink(batch_size=10, delay=0.001, on_batch=lambda rows: waiting.append(produced[0] - rows[-1]["n"]))
+        result = Pipeline([sink], workers=1, queue_size=20).run([fetcher()])
+
+        self.assertEqual(result["rows"], 2000)
+        # never more than the queue and one row in the hands of the fetcher ahead of the sink
+        self.assertLessEqual(max(waiting), 20 + 2)
+
+
+class TestHttpBulkSink(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer()
+        self.inflight = 0
+        self.most = 0
+        self.lock = threading.Lock()
+        self.status = 200
+
+        def bulk(url, params, body):
+            with self.lock:
+                self.inflight += 1
+                self.most = max(self.most, self.inflight)
+            time.sleep(0.02)
+            with self.lock:
+                self.inflight -= 1
+            return self.status, {"ok": self.status == 200}
+
+        self.server.route("POST", "/bulk", bulk)
+        self.server.start()
+        self.url = f"{self.server.url}/bulk"
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_batches_and_concurrency(self):
+        rows = [{"n": n} for n in range(25)]
+        with HttpBulkSink(self.url, batch_size=3, concurrency=2) as sink:
+            Pipeline([sink]).run([iter(rows)])
+
+        bodies = [r["json"] for r in self.server.requests]
+        self.assertEqual(len(bodies), 9)
+        self.assertEqual(sink.batches, 9)
+        received = [json.loads(line) for body in bodies for line in (body.splitlines() if isinstance(body, str) else [json.dumps(body)])]
+        self.assertEqual(sorted(row["n"] for row in received), list(range(25)))
+        self.assertLessEqual(self.most, 2)
+        self.assertEqual(self.server.requests[0]["headers"]["Content-Type"], "application/x-ndjson")
+
+    def test_json_batches(self):
+        with HttpBulkSink(self.url, batch_size=10, format="json", headers={"Authorization": "Bearer token"}) as sink:
+            for n in range(15):
+                sink.write({"n": n})
+
+        # the two batches are posted concurrently, they can come in either order
+        self.assertEqual(sorted(len(r["json"]) for r in self.server.requests), [5, 10])
+        self.assertEqual(self.server.requests[0]["headers"]["Authorization"], "Bearer token")
+
+    def test_failed_batch_raises(self):
+        self.status = 500
+        sink = HttpBulkSink(self.url, batch_size=2)
+        sink.write({"n": 1})
+        sink.write({"n": 2})
+        with self.assertRaises(ConnectionError):
+            sink.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
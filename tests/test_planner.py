@@ -0,0 +1,209 @@
+import asyncio
+import os
+import time
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+from cfmetrics import Auth, Config, DatasetUnavailable, StateStore, planner, query
+from tests.stub_server import StubServer, _find, add_cloudflare_routes, graphql_queries, plan_settings
+
+try:
+    from cfmetrics.aio import AsyncAuth
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+NOW = datetime(2024, 5, 10, 12, 0, 0)
+
+
+def settings_requests(server):
+    return [r for r in server.requests if r["path"].endswith("/graphql") and "settings {" in r["json"]["query"]]
+
+
+class TestPlanner(unittest.TestCase):
+
+    def test_capabilities(self):
+        found = planner.capabilities(plan_settings("Free Website"))
+        self.assertEqual(found["httpRequestsAdaptiveGroups"], {"enabled": False, "max_duration": 2764800, "not_older_than": 2764800})
+        self.assertEqual(found["httpRequests1dGroups"], {"enabled": True, "max_duration": None, "not_older_than": None})
+
+        self.assertFalse(planner.plan_capabilities("Free Website")["httpRequestsAdaptiveGroups"]["enabled"])
+        self.assertTrue(planner.plan_capabilities("Business Website")["httpRequestsAdaptiveGroups"]["enabled"])
+        self.assertTrue(planner.plan_capabilities("Unknown")["httpRequestsAdaptiveGroups"]["enabled"])
+
+    def test_check_window(self):
+        found = planner.capabilities(plan_settings("Business Website"))
+        start = (NOW - timedelta(days=3)).strftime(query.DATETIME_FORMAT)
+        capability, checked = planner.check_window(found, "httpRequestsAdaptiveGroups", start, "Zone ID zone-1", now=NOW)
+        self.assertEqual((planner.max_duration(capability), checked), (2764800, start))
+        self.assertEqual(planner.check_window(found, "unknownGroups", start, "Zone ID zone-1", now=NOW), (None, start))
+
+        with self.assertRaises(ValueError):
+            planner.check_window(found, "httpRequests1mGroups", (NOW - timedelta(days=8)).strftime(query.DATETIME_FORMAT), "Zone ID zone-1", now=NOW)
+        with self.assertRaises(DatasetUnavailable):
+            planner.check_window(planner.capabilities(plan_settings("Free Website")), "httpRequestsAdaptiveGroups", start, "Zone ID zone-1", now=NOW)
+
+    def test_start_just_past_the_retention_is_moved_up(self):
+        found = planner.capabilities(plan_settings("Business Website"))
+        start = (NOW - timedelta(seconds=2764800 + 600)).strftime(query.DATETIME_FORMAT)
+        _, checked = planner.check_window(found, "httpRequestsAdaptiveGroups", start, "Zone ID zone-1", now=NOW)
+        self.assertEqual(checked, (NOW - timedelta(seconds=2764800 - planner.EDGE_MARGIN)).strftime(query.DATETIME_FORMAT))
+
+    def test_duration_windows(self):
+        self.assertEqual(
+            query.duration_windows("2024-05-01T00:00:00Z", "2024-05-03T12:00:00Z", 86400),
+            [("2024-05-01T00:00:00Z", "2024-05-01T23:59:59Z"), ("2024-05-02T00:00:00Z", "2024-05-02T23:59:59Z"), ("2024-05-03T00:00:00Z", "2024-05-03T12:00:00Z")]
+        )
+        self.assertIsNone(query.duration_windows("2024-05-01T00:00:00Z", "2024-05-01T12:00:00Z", 86400))
+        self.assertIsNone(query.duration_windows("2024-05-01T00:00:00Z", "2024-05-03T12:00:00Z", None))
+
+    def test_overview_dataset_skips_what_the_plan_cant_query(self):
+        found = planner.capabilities(plan_settings("Business Website"))
+        start = (NOW - timedelta(days=2)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.assertEqual(query.overview_dataset("1h", start, NOW, found), "1h")
+
+        found["httpRequests1hGroups"]["enabled"] = False
+        self.assertEqual(query.overview_dataset("1h", start, NOW, found), "1m")
+        found["httpRequests1mGroups"]["not_older_than"] = 86400
+        with self.assertRaises(ValueError):
+            query.overview_dataset("1h", start, NOW, found)
+
+
+class TestZonePlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.start = (datetime.utcnow() - timedelta(days=3)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.end = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def auth(self, **routes):
+        server = add_cloudflare_routes(StubServer(), **routes).start()
+        cf = Auth("key", "me@example.com", config=Config(server.url))
+        self.addCleanup(server.stop)
+        self.addCleanup(cf.close)
+        return server, cf.Account("account-1")
+
+    def test_default_window_west_of_utc(self):
+        server, account = self.auth()
+        self.addCleanup(time.tzset)
+        with mock.patch.dict(os.environ, {"TZ": "America/Los_Angeles"}):
+            time.tzset()
+            dataCompiled = account.Zone("zone-1").get_traffics()
+
+        self.assertTrue(dataCompiled["by_date"]["dates"])
+        start = graphql_queries(server)[0]["json"]["variables"]["filter"]["AND"][0]["datetime_geq"]
+        self.assertGreater(start, (datetime.utcnow() - timedelta(seconds=2764800)).strftime(query.DATETIME_FORMAT))
+
+    def test_default_and_first_windows_follow_a_short_retention(self):
+        settings = plan_settings("Business Website")
+        for name in ("httpRequestsAdaptiveGroups", "rumPageloadEventsAdaptiveGroups"):
+            settings[name] = {**settings[name], "notOlderThan": 8 * 86400}
+        server, account = self.auth(settings=settings)
+        zone = account.Zone("zone-1")
+        oldest = (datetime.utcnow() - timedelta(days=8)).strftime(query.DATETIME_FORMAT)
+
+        self.assertTrue(zone.get_traffics()["by_date"]["dates"])
+        self.assertTrue(zone.get_web_analytics()["by_date"]["dates"])
+        self.assertIn("zone-1", account.get_web_analytics())
+        state = StateStore()
+        for dataset in ("traffics", "web_analytics"):
+            self.assertTrue(zone.collect(dataset, state)["by_date"]["dates"])
+        results = list(account.collect(datasets=["traffics", "web_analytics"], zone_ids=["zone-2"]))
+        self.assertFalse(any(isinstance(result, Exception) for _, _, result in results))
+
+        starts = [_find(r["json"]["variables"], "datetime_geq") for r in graphql_queries(server)]
+        self.assertEqual(len(starts), 7)
+        self.assertTrue(all(start > oldest for start in starts))
+
+        # a start the caller gave is still checked
+        with self.assertRaises(ValueError):
+            zone.get_traffics((datetime.utcnow() - timedelta(days=10)).strftime(query.DATETIME_FORMAT))
+
+    def test_free_plan_sends_nothing_but_the_probe(self):
+        server, account = self.auth(plan="Free Website")
+        with self.assertRaises(DatasetUnavailable):
+            account.Zone("zone-1").get_traffics(self.start, self.end)
+        with self.assertRaises(ConnectionError):
+            account.Zone("zone-1").get_traffics(self.start, self.end)
+
+        self.assertEqual([r["path"] for r in server.requests], ["/client/v4/graphql"])
+        self.assertEqual(len(settings_requests(server)), 1)
+
+    def test_plan_is_the_fallback(self):
+        server, account = self.auth(plan="Free Website", settings="error")
+        zone = account.Zone("zone-1")
+        self.assertFalse(zone.capabilities()["httpRequestsAdaptiveGroups"]["enabled"])
+        with self.assertRaises(DatasetUnavailable):
+            zone.get_traffics(self.start, self.end)
+
+        self.assertEqual([r["path"] for r in server.requests], ["/client/v4/graphql", "/client/v4/zones/zone-1"])
+
+    def test_zones_are_probed_in_one_request(self):
+        server, account = self.auth()
+        found = account.zone_capabilities(["zone-1", "zone-2", "zone-1"])
+        self.assertEqual(list(found), ["zone-1", "zone-2"])
+        self.assertTrue(found["zone-2"]["httpRequestsAdaptiveGroups"]["enabled"])
+        self.assertEqual(len(settings_requests(server)), 1)
+
+        for zone_id in ("zone-1", "zone-2"):
+            account.Zone(zone_id).get_traffics(self.start, self.end)
+        account.zone_capabilities(["zone-1", "zone-2"])
+        self.assertEqual(len(settings_requests(server)), 1)
+
+    def test_collect_probes_once(self):
+        server, account = self.auth()
+        results = list(account.collect(datasets=["overview", "traffics"]))
+        self.assertEqual(len(results), 4)
+        self.assertFalse(any(isinstance(result, Exception) for _, _, result in results))
+        self.assertEqual(len(settings_requests(server)), 1)
+
+    def test_account_is_probed_once_for_many_workers(self):
+        server, account = self.auth(zone_ids=tuple(f"zone-{n}" for n in range(16)))
+        results = list(account.collect(datasets=["web_analytics"], workers=16))
+        self.assertEqual(len(results), 16)
+        self.assertFalse(any(isinstance(result, Exception) for _, _, result in results))
+        self.assertEqual(len(settings_requests(server)), 1)
+
+    def test_long_windows_are_cut_before_sending(self):
+        settings = plan_settings("Business Website")
+        settings["httpRequestsAdaptiveGroups"] = {**settings["httpRequestsAdaptiveGroups"], "maxDuration": 86400}
+        server, account = self.auth(settings=settings)
+        _, plain = self.auth()
+
+        self.assertEqual(account.Zone("zone-1").get_traffics(self.start, self.end), plain.Zone("zone-1").get_traffics(self.start, self.end))
+        self.assertEqual(account.Zone("zone-1").get_traffics(self.start, self.end, stream=True), plain.Zone("zone-1").get_traffics(self.start, self.end))
+        self.assertEqual(len(graphql_queries(server)), 8)
+
+    def test_overview_longer_than_max_duration_raises(self):
+        settings = plan_settings("Business Website")
+        settings["httpRequests1dGroups"] = {**settings["httpRequests1dGroups"], "maxDuration": 7 * 86400}
+        server, account = self.auth(settings=settings)
+
+        with self.assertRaises(ValueError):
+            account.Zone("zone-1").get_overview("2025-02-01", "2025-03-01")
+        self.assertEqual(graphql_queries(server), [])
+        self.assertEqual(len(account.Zone("zone-1").get_overview("2025-02-01", "2025-02-08")["by_date"]["dates"]), 7)
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncPlanner(unittest.TestCase):
+
+    def test_free_plan_and_probe_once(self):
+        server = add_cloudflare_routes(StubServer(), plan="Free Website").start()
+        self.addCleanup(server.stop)
+        start = (datetime.utcnow() - timedelta(days=3)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        async def main():
+            async with AsyncAuth("key", "me@example.com", config=Config(server.url)) as cf:
+                account = cf.Account("account-1")
+                found = await account.zone_capabilities(["zone-1", "zone-2"])
+                with self.assertRaises(DatasetUnavailable):
+                    await account.Zone("zone-2").get_traffics(start)
+                return found
+
+        found = asyncio.run(main())
+        self.assertFalse(found["zone-1"]["httpRequestsAdaptiveGroups"]["enabled"])
+        self.assertEqual([r["path"] for r in server.requests], ["/client/v4/graphql"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from datetime import datetime, timedelta
+from cfmetrics import Auth, Config, data_format, query
+from tests.stub_server import StubServer, add_cloudflare_routes, graphql_queries
+
+NOW = datetime(2024, 5, 10, 12, 0, 0)
+
+
+class TestResolution(unittest.TestCase):
+
+    def test_parse_resolution(self):
+        self.assertEqual([query.parse_resolution(value) for value in ("15m", "1h", "6h", "1d", "7d")], [900, 3600, 21600, 86400, 604800])
+        for value in ("", "1", "1s", "h", "0h", "-1d", None):
+            with self.assertRaises(ValueError):
+                query.parse_resolution(value)
+
+    def test_overview_dataset(self):
+        self.assertEqual(query.overview_dataset("1d", "2024-05-01", NOW), "1d")
+        self.assertEqual(query.overview_dataset("7d", "2020-01-01", NOW), "1d")
+        self.assertEqual(query.overview_dataset("6h", "2024-05-01", NOW), "1h")
+        self.assertEqual(query.overview_dataset("90m", "2024-05-08", NOW), "1m")
+        self.assertEqual(query.overview_dataset("15m", "2024-05-08T00:00:00Z", NOW), "1m")
+
+        # the hours are gone after 90 days and nothing coarser adds up to 6h
+        with self.assertRaises(ValueError):
+            query.overview_dataset("6h", "2024-01-01", NOW)
+
+    def test_overview_window(self):
+        self.assertEqual(query.overview_window("1d", "2024-05-01", "2024-05-03"), ("2024-05-01", "2024-05-03"))
+        self.assertEqual(query.overview_window("1d", "2024-05-01T06:00:00Z", "2024-05-03T06:00:00Z"), ("2024-05-01", "2024-05-04"))
+        self.assertEqual(query.overview_window("1h", "2024-05-01", "2024-05-03"), ("2024-05-01T00:00:00Z", "2024-05-02T23:59:59Z"))
+        self.assertEqual(query.overview_window("1m", "2024-05-01T06:00:00Z", "2024-05-01T07:00:00Z"), ("2024-05-01T06:00:00Z", "2024-05-01T07:00:00Z"))
+
+    def test_rollup_overview(self):
+        hourly = {
+            "totalUniqueUsers": 7,
+            "by_date": {"dates": [
+                {"date": "2024-05-01T22:00:00Z", "metrics": {"requests": 3, "countryMap": [{"key": "ID", "requests": 2, "bytes": 10}]}},
+                {"date": "2024-05-01T23:00:00Z", "metrics": {"requests": 4, "countryMap": [{"key": "ID", "requests": 1, "bytes": 5}, {"key": "SG", "requests": 3, "bytes": 1}]}},
+                {"date": "2024-05-02T00:00:00Z", "metrics": {"requests": 5, "countryMap": []}},
+            ], "date_lists": []}
+        }
+
+        self.assertEqual(data_format.rollup_overview(hourly, "1d"), {
+            "totalUniqueUsers": 7,
+            "by_date": {"dates": [
+                {"date": "2024-05-01", "metrics": {"requests": 7, "countryMap": [{"key": "ID", "requests": 3, "bytes": 15}, {"key": "SG", "requests": 3, "bytes": 1}]}},
+                {"date": "2024-05-02", "metrics": {"requests": 5, "countryMap": []}},
+            ], "date_lists": ["2024-05-01", "2024-05-02"]}
+        })
+        self.assertEqual(data_format.rollup_overview(hourly, "2h")["by_date"]["date_lists"], ["2024-05-01T22:00:00Z", "2024-05-02T00:00:00Z"])
+
+    def test_weeks_start_on_monday(self):
+        # 2024-05-06 is a Monday
+        self.assertEqual(data_format.bucket_of("2024-05-05", 7 * 86400), "2024-04-29")
+        self.assertEqual(data_format.bucket_of("2024-05-06", 7 * 86400), "2024-05-06")
+        self.assertEqual(data_format.bucket_of("2024-05-12T23:00:00Z", 7 * 86400), "2024-05-06")
+        self.assertEqual(data_format.bucket_of("2024-05-20", 14 * 86400), "2024-05-20")
+        self.assertEqual(data_format.bucket_of("2024-05-03", 2 * 86400), "2024-05-03")
+
+
+class TestZoneResolution(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer()).start()
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url))
+        self.zone = self.cf.Account("account-1").Zone("zone-1")
+        self.start = (datetime.utcnow() - timedelta(days=3)).strftime("%Y-%m-%d")
+        self.end = (datetime.utcnow() - timedelta(days=1)).strftime("%Y-%m-%d")
+
+    def tearDown(self):
+        self.cf.close()
+        self.server.stop()
+
+    def queries(self):
+        return [r["json"]["query"] for r in graphql_queries(self.server)]
+
+    def test_hourly(self):
+        hourly = self.zone.get_overview(self.start, self.end, resolution="1h")
+        self.assertEqual(len(hourly["by_date"]["dates"]), 48)
+        self.assertEqual(hourly["by_date"]["date_lists"][0], f"{self.start}T00:00:00Z")
+        self.assertIn("httpRequests1hGroups", self.queries()[-1])
+
+    def test_coarser_buckets_are_rolled_up(self):
+        hourly = self.zone.get_overview(self.start, self.end, resolution="1h")
+        sixHours = self.zone.get_overview(self.start, self.end, resolution="6h")
+        self.assertEqual(len(sixHours["by_date"]["dates"]), 8)
+        self.assertEqual(sixHours, data_format.rollup_overview(hourly, "6h"))
+        self.assertIn("httpRequests1hGroups", self.queries()[-1])
+
+        daily = self.zone.get_overview(self.start, self.end)
+        self.assertEqual(self.zone.get_overview(self.start, self.end, resolution="2d"), data_format.rollup_overview(daily, "2d"))
+        self.assertIn("httpRequests1dGroups", self.queries()[-1])
+
+    def test_minutes(self):
+        start = (datetime.utcnow() - timedelta(hours=3)).replace(minute=0, second=0, microsecond=0)
+        end = start + timedelta(hours=1)
+        overview = self.zone.get_overview(start.strftime(query.DATETIME_FORMAT), end.strftime(query.DATETIME_FORMAT), resolution="15m")
+        # the end is included, so the minute that starts the next hour is in its own bucket
+        self.assertEqual(len(overview["by_date"]["dates"]), 5)
+        self.assertIn("httpRequests1mGroups", self.queries()[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from cfmetrics import Auth, Config, ResponseCache, query
+from tests.stub_server import StubServer, add_cloudflare_routes, graphql_queries
+
+NOW = datetime(2024, 5, 10, 12, 0, 0)
+
+
+def graphql_requests(server):
+    return len(graphql_queries(server))
+
+
+class TestSealing(unittest.TestCase):
+
+    def test_same_query_same_key(self):
+        queryBody = query.query_zone_traffic("zone-1", ["a.example.com"], "2024-05-01T00:00:00Z", "2024-05-02T00:00:00Z")
+        other = {
+            "variables": dict(reversed(list(queryBody["variables"].items()))),
+            "query": "  # another comment\n" + queryBody["query"].replace("\n", "\n\n    ")
+        }
+        self.assertEqual(ResponseCache.key(queryBody), ResponseCache.key(other))
+
+        other = query.query_zone_traffic("zone-1", ["b.example.com"], "2024-05-01T00:00:00Z", "2024-05-02T00:00:00Z")
+        self.assertNotEqual(ResponseCache.key(queryBody), ResponseCache.key(other))
+
+    def test_is_sealed(self):
+        self.assertTrue(query.is_sealed(query.query_zone_overview("zone-1", "2024-05-01", "2024-05-10"), NOW))
+        self.assertFalse(query.is_sealed(query.query_zone_overview("zone-1", "2024-05-01", "2024-05-11"), NOW))
+        # the day just ended is not sealed before SEAL_DELAY is over
+        self.assertFalse(query.is_sealed(query.query_zone_overview("zone-1", "2024-05-01", "2024-05-10"), datetime(2024, 5, 10, 1)))
+
+        self.assertTrue(query.is_sealed(query.query_account_rum("account-1", None, "2024-05-01T00:00:00Z", "2024-05-09T23:59:59Z"), NOW))
+        self.assertFalse(query.is_sealed(query.query_zone_traffic("zone-1", None, "2024-05-01T00:00:00Z", "2024-05-10T11:00:00Z"), NOW))
+
+    def test_seal_split(self):
+        self.assertEqual(
+            query.seal_split("2024-05-01T06:00:00Z", "2024-05-10T11:00:00Z", now=NOW),
+            [("2024-05-01T06:00:00Z", "2024-05-09T23:59:59Z"), ("2024-05-10T00:00:00Z", "2024-05-10T11:00:00Z")]
+        )
+        self.assertIsNone(query.seal_split("2024-05-01T06:00:00Z", "2024-05-08T11:00:00Z", now=NOW))
+        self.assertIsNone(query.seal_split("2024-05-10T01:00:00Z", "2024-05-10T11:00:00Z", now=NOW))
+        self.assertIsNone(query.seal_split("2024-05-01", "2024-05-11", query.DATE_FORMAT, now=NOW))
+
+
+class TestResponseCache(unittest.TestCase):
+
+    sealed = query.query_zone_overview("zone-1", "2024-05-01", "2024-05-03")
+    open = query.query_zone_overview("zone-1", "2024-05-01", "2099-01-01")
+
+    def test_sealed_stay_and_open_expire(self):
+        cache = ResponseCache(open_ttl=0.05)
+        cache.set(self.sealed, {"data": {"day": 1}})
+        cache.set(self.open, {"data": {"day": 2}})
+        self.assertEqual(cache.get(self.open), {"data": {"day": 2}})
+        time.sleep(0.1)
+
+        self.assertEqual(cache.get(self.sealed), {"data": {"day": 1}})
+        self.assertIsNone(cache.get(self.open))
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+        # every get is a new copy
+        cache.get(self.sealed)["data"]["day"] = 5
+        self.assertEqual(cache.get(self.sealed), {"data": {"day": 1}})
+
+    def test_evicts_least_recently_used_by_size(self):
+        bodies = [query.query_zone_overview(f"zone-{n}", "2024-05-01", "2024-05-03") for n in range(4)]
+        cache = ResponseCache(max_bytes=1)
+        self.assertIsNone(cache.set(bodies[0], {"data": "x"}))
+        self.assertEqual(len(cache), 0)
+
+        value = {"data": [n * 7919 % 1000 for n in range(200)]}
+        cache.max_bytes = 10 ** 6
+        cache.set(bodies[0], value)
+        cache.max_bytes = cache.size * 2
+        cache.set(bodies[1], value)
+        cache.get(bodies[0])
+        cache.set(bodies[2], value)
+
+        self.assertLessEqual(cache.size, cache.max_bytes)
+        self.assertIsNotNone(cache.get(bodies[0]))
+        self.assertIsNone(cache.get(bodies[1]))
+        self.assertIsNotNone(cache.get(bodies[2]))
+
+    def test_eviction_reads_the_size_of_the_table(self):
+        bodies = [query.query_zone_overview(f"zone-{n}", "2024-05-01", "2024-05-03") for n in range(3)]
+        value = {"data": [n * 7919 % 1000 for n in range(200)]}
+        cache = ResponseCache()
+        cache.set(bodies[0], value)
+        cache.max_bytes = cache.size * 2
+
+        # the counter drifted, e.g. another process wrote the same file
+        cache.size = 10 ** 9
+        cache.set(bodies[1], value)
+        self.assertEqual(len(cache), 2)
+        cache.conn.execute("DELETE FROM responses")
+        cache.size = 10 ** 9
+        cache.set(bodies[2], value)
+        self.assertEqual((len(cache), cache.size), (1, cache.max_bytes // 2))
+
+    def test_on_disk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResponseCache(os.path.join(tmp, "responses.db"))
+            cache.set(self.sealed, {"data": {"day": 1}})
+            size = cache.size
+            cache.close()
+
+            cache = ResponseCache(os.path.join(tmp, "responses.db"))
+            self.assertEqual(cache.size, size)
+            self.assertEqual(cache.get(self.sealed), {"data": {"day": 1}})
+            cache.close()
+
+
+class TestZoneResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer()).start()
+        self.responseCache = ResponseCache(open_ttl=0)
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url), response_cache=self.responseCache)
+        self.zone = self.cf.Account("account-1").Zone("zone-1")
+
+    def tearDown(self):
+        self.cf.close()
+        self.server.stop()
+
+    def test_overview_of_sealed_days_is_sent_once(self):
+        start = (datetime.utcnow() - timedelta(days=10)).strftime("%Y-%m-%d")
+        end = (datetime.utcnow() - timedelta(days=3)).strftime("%Y-%m-%d")
+        first = self.zone.get_overview(start, end)
+        sent = graphql_requests(self.server)
+
+        self.assertEqual(self.zone.get_overview(start, end), first)
+        self.assertEqual(graphql_requests(self.server), sent)
+
+    def test_traffics_only_send_the_open_tail_again(self):
+        start = (datetime.utcnow() - timedelta(days=3)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        end = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        plain = Auth("key", "me@example.com", config=Config(self.server.url))
+        try:
+            expected = plain.Account("account-1").Zone("zone-1").get_traffics(start, end)
+        finally:
+            plain.close()
+        sent = graphql_requests(self.server)
+
+        self.assertEqual(self.zone.get_traffics(start, end), expected)
+        self.assertEqual(graphql_requests(self.server) - sent, 2)
+        self.assertEqual(self.zone.get_traffics(start, end), expected)
+        self.assertEqual(graphql_requests(self.server) - sent, 3)
+
+    def test_default_window_is_answered_again(self):
+        first = self.zone.get_traffics()
+        sent = graphql_requests(self.server)
+        self.assertEqual(sent, 2)
+
+        # only the open tail of today is sent again
+        self.assertEqual(self.zone.get_traffics(), first)
+        self.assertEqual(graphql_requests(self.server) - sent, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import time
+import unittest
+from cfmetrics import Auth, Config, MemoryCache, RateLimitError, Scheduler, TokenBucket
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer()).start()
+        self.answers = []
+
+        def flaky(url, params, body):
+            if self.answers:
+                return self.answers.pop(0)
+            return 200, {"success": True, "result": {"plan": {"name": "Business Website"}}}
+
+        self.server.route("GET", r"/zones/[^/]+", flaky)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def zone(self, scheduler):
+        return Auth("key", "me@example.com", config=Config(self.server.url), cache=MemoryCache(ttl=0), scheduler=scheduler).Account("account-1").Zone("zone-1")
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        waits = [bucket.reserve() for _ in range(4)]
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 0.1, delta=0.01)
+        self.assertAlmostEqual(waits[3], 0.2, delta=0.01)
+
+        bucket.pause(1)
+        self.assertGreater(bucket.reserve(), 1)
+
+    def test_retry_delay(self):
+        scheduler = Scheduler(retries=2, backoff=1, max_backoff=3)
+
+        class Answer:
+            def __init__(self, status_code, headers={}):
+                self.status_code = status_code
+                self.headers = headers
+
+        self.assertEqual(scheduler.retry_delay(0, Answer(429, {"Retry-After": "7"})), 7)
+        self.assertIsNone(scheduler.retry_delay(0, Answer(400)))
+        self.assertLessEqual(scheduler.retry_delay(1, Answer(503)), 2)
+        self.assertIsNone(scheduler.retry_delay(2, Answer(503)))
+        self.assertLessEqual(scheduler.retry_delay(0), 1)
+
+    def test_retries_429_and_5xx(self):
+        self.answers = [(429, {"success": False}), (503, {"success": False})]
+        zone = self.zone(Scheduler(backoff=0.01))
+        self.assertEqual(zone.get_domain_plan(), "Business Website")
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_gives_up_after_retries(self):
+        self.answers = [(429, {"success": False})] * 3
+        zone = self.zone(Scheduler(retries=2, backoff=0.01, rest_rate=100, graphql_rate=100))
+        with self.assertRaises(RateLimitError):
+            zone.get_domain_plan()
+        self.assertEqual(len(self.server.requests), 3)
+
+        self.server.route("POST", r"/graphql", lambda url, params, body: (429, {"errors": [{"message": "rate limited"}]}))
+        with self.assertRaises(RateLimitError):
+            zone.get_overview("2025-02-01", "2025-02-03")
+        with self.assertRaises(ConnectionError):
+            zone.get_overview("2025-02-01", "2025-02-03")
+
+    def test_rate_limit(self):
+        zone = self.zone(Scheduler(rest_rate=20, rest_burst=1))
+        start = time.monotonic()
+        for _ in range(5):
+            zone.get_domain_plan()
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from cfmetrics import Auth, Config, MetricStore, StateStore
+from cfmetrics import state as incremental
+from tests.stub_server import StubServer, add_cloudflare_routes, graphql_queries
+
+
+class TestIncremental(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer()).start()
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url))
+        self.zone = self.cf.Account("account-1").Zone("zone-1")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state = StateStore(os.path.join(self.tmp.name, "state.db"))
+
+    def tearDown(self):
+        self.state.close()
+        self.tmp.cleanup()
+        self.cf.close()
+        self.server.stop()
+
+    def graphql_variables(self):
+        return [r["json"]["variables"] for r in graphql_queries(self.server)]
+
+    def test_next_window(self):
+        now = datetime(2025, 3, 10, 15, 30, 0)
+        self.assertEqual(incremental.next_window("traffics", "2025-03-10T00:20:00Z", now=now), ("2025-03-09T00:00:00Z", "2025-03-10T15:30:00Z"))
+        self.assertEqual(incremental.next_window("web_analytics", "2025-03-10T12:00:00Z", now=now), ("2025-03-10T00:00:00Z", "2025-03-10T15:30:00Z"))
+        self.assertEqual(incremental.next_window("overview", "2025-03-08", now=now), ("2025-03-07", "2025-03-10"))
+        # older than the 32 days the adaptive groups keep
+        self.assertEqual(incremental.next_window("traffics", "2025-01-01T00:00:00Z", now=now)[0], "2025-02-07T00:00:00Z")
+        # a shorter retention reported by the settings
+        self.assertEqual(incremental.next_window("traffics", None, now=now, retention=8 * 86400), ("2025-03-02T15:30:00Z", "2025-03-10T15:30:00Z"))
+        self.assertEqual(incremental.next_window("overview", None, now=now, retention=8 * 86400), ("2025-03-03", "2025-03-10"))
+        self.assertEqual(incremental.next_window("traffics", "2025-03-01T00:00:00Z", now=now, retention=8 * 86400)[0], "2025-03-03T00:00:00Z")
+        with self.assertRaises(ValueError):
+            incremental.next_window("dns", None)
+
+    def test_collect_only_fetches_after_watermark(self):
+        store = MetricStore()
+        first = self.zone.collect("traffics", self.state, store=store)
+        firstStart = self.graphql_variables()[0]["filter"]["AND"][0]["datetime_geq"]
+
+        second = self.zone.collect("traffics", self.state, store=store)
+        variables = self.graphql_variables()[1]["filter"]["AND"][0]
+        watermark = self.state.get_watermark("zone-1", "traffics")
+
+        self.assertEqual(watermark, variables["datetime_leq"])
+        self.assertTrue(variables["datetime_geq"].endswith("T00:00:00Z"))
+        self.assertGreater(variables["datetime_geq"], firstStart)
+        self.assertEqual(second, self.zone.get_traffics(variables["datetime_geq"], watermark))
+
+        # the second window is merged into the history in the store
+        history = store.read("zone-1", "traffics")
+        self.assertEqual(history, self.zone.get_traffics(firstStart, watermark))
+        self.assertEqual(first["by_date"]["date_lists"], history["by_date"]["date_lists"])
+
+    def test_collect_overview(self):
+        store = MetricStore()
+        self.zone.collect("overview", self.state, store=store)
+        latest = self.zone.collect("overview", self.state, store=store)
+        variables = self.graphql_variables()
+
+        self.assertEqual(variables[1]["start_date"], (datetime.strptime(variables[0]["end_date"], "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d"))
+        self.assertEqual(latest["by_date"]["date_lists"], [variables[1]["start_date"]])
+        self.assertEqual(store.read("zone-1", "overview")["by_date"]["dates"], self.zone.get_overview(variables[0]["start_date"], variables[1]["end_date"])["by_date"]["dates"])
+        self.assertEqual(self.state.get_watermark("zone-1", "overview"), variables[1]["end_date"])
+
+    def test_failed_window_raises_and_keeps_the_watermark(self):
+        self.zone.collect("overview", self.state)
+        watermark = self.state.get_watermark("zone-1", "overview")
+
+        self.server.route("POST", "/graphql", lambda url, params, body: (200, {"data": {"viewer": {"zones": [{"totals": [], "zones": []}]}}, "errors": None}))
+        with self.assertRaises(ValueError):
+            self.zone.collect("overview", self.state)
+        self.assertEqual(self.state.get_watermark("zone-1", "overview"), watermark)
+
+    def test_account_collect_merges_into_the_store(self):
+        store = MetricStore()
+        account = self.cf.Account("account-1")
+        for _ in range(2):
+            results = list(account.collect(datasets=["traffics"], zone_ids=["zone-1"], state=self.state, store=store))
+            self.assertIsInstance(results[0][2], dict)
+
+        first = self.graphql_variables()[0]["filter"]["AND"][0]["datetime_geq"]
+        self.assertEqual(store.read("zone-1", "traffics"), self.zone.get_traffics(first, self.state.get_watermark("zone-1", "traffics")))
+
+
+if __name__ == "__main__":
+    unittest.main()
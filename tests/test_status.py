@@ -0,0 +1,77 @@
+import unittest
+from datetime import datetime, timedelta
+from cfmetrics import Auth, Config, data_format, query
+from tests.stub_server import StubServer, add_cloudflare_routes, graphql_queries
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def status_item(host, ts, status, count, visits=0):
+    return {"count": count, "sum": {"visits": visits, "edgeResponseBytes": visits * 10}, "dimensions": {"host": host, "ts": ts, "status": status}}
+
+
+class TestStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer()).start()
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url))
+        self.zone = self.cf.Account("account-1").Zone("zone-1")
+        self.start = (datetime.utcnow() - timedelta(days=3)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.end = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def tearDown(self):
+        self.cf.close()
+        self.server.stop()
+
+    def graphql_requests(self):
+        return graphql_queries(self.server)
+
+    def test_fold_status(self):
+        items = [
+            status_item("a.example.com", "2024-05-01", 200, 10, 4),
+            status_item("a.example.com", "2024-05-01", 404, 3),
+            status_item("a.example.com", "2024-05-01", 503, 1),
+            status_item("a.example.com", "2024-05-01", 500, 2),
+            status_item("b.example.com", "2024-05-01", 404, 5),
+        ]
+        dataCompiled = data_format.model_items(data_format.fold_status(items), "traffic")
+
+        metrics = {domain["name"]: domain["metrics"] for domain in dataCompiled["by_date"]["dates"][0]["domains"]}
+        self.assertEqual(metrics["a.example.com"], {"page_views": 10, "requests": 4, "data_transfer_bytes": 40, "error_counts": 6, "status_4xx": 3, "status_5xx": 3})
+        # a host with errors only still gets its row
+        self.assertEqual(metrics["b.example.com"], {"page_views": 0, "requests": 0, "data_transfer_bytes": 0, "error_counts": 5, "status_4xx": 5, "status_5xx": 0})
+
+    def test_status_query(self):
+        queryBody = query.query_zone_traffic("zone-1", None, self.start, self.end, status=True)
+        self.assertIn("status: edgeResponseStatus", queryBody["query"])
+        self.assertEqual(queryBody["variables"]["filter"]["AND"][2], query.status_filter(True))
+        self.assertNotIn("edgeResponseStatus", query.query_zone_traffic("zone-1", None, self.start, self.end)["query"])
+
+    def test_errors_come_in_the_same_request(self):
+        plain = self.zone.get_traffics(self.start, self.end)
+        sent = len(self.graphql_requests())
+
+        dataCompiled = self.zone.get_traffics(self.start, self.end, status=True)
+        self.assertEqual(len(self.graphql_requests()), sent * 2)
+
+        for dateData, plainDate in zip(dataCompiled["by_date"]["dates"], plain["by_date"]["dates"]):
+            for domain, plainDomain in zip(dateData["domains"], plainDate["domains"]):
+                metrics = dict(domain["metrics"])
+                first = domain["name"] == "a.example.com"
+                self.assertEqual((metrics.pop("status_4xx"), metrics.pop("status_5xx"), metrics.pop("error_counts")), (1, 2, 3) if first else (1, 0, 1))
+                self.assertEqual(metrics, plainDomain["metrics"])
+
+        self.assertEqual(self.zone.get_traffics(self.start, self.end, stream=True, status=True), dataCompiled)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_columnar(self):
+        series = self.zone.get_traffics(self.start, self.end, format="columnar", status=True)
+        self.assertEqual(series.to_dict(), self.zone.get_traffics(self.start, self.end, status=True))
+        self.assertEqual(series.totals()["error_counts"], series.totals()["status_4xx"] + series.totals()["status_5xx"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+from cfmetrics import Auth, Config, MetricStore, StateStore
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+
+class TestMetricStore(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer()).start()
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url))
+        self.zone = self.cf.Account("account-1").Zone("zone-1")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = MetricStore(os.path.join(self.tmp.name, "metrics.db"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+        self.cf.close()
+        self.server.stop()
+
+    def test_round_trip(self):
+        traffics = self.zone.get_traffics()
+        self.store.write("zone-1", "traffics", traffics)
+        self.assertEqual(self.store.read("zone-1", "traffics"), traffics)
+
+        overview = self.zone.get_overview("2025-02-01", "2025-02-10")
+        self.store.write("zone-1", "overview", overview)
+        self.assertEqual(self.store.read("zone-1", "overview")["by_date"], overview["by_date"])
+
+    def test_range_scan(self):
+        self.store.write("zone-1", "web_analytics", self.zone.get_web_analytics("2025-02-01T00:00:00Z", "2025-02-20T00:00:00Z"))
+        self.store.write("zone-2", "web_analytics", self.zone.get_web_analytics("2025-02-01T00:00:00Z", "2025-02-20T00:00:00Z"))
+
+        part = self.store.read("zone-1", "web_analytics", "2025-02-05", "2025-02-07", hosts=["a.example.com"])
+        self.assertEqual(part["by_date"]["date_lists"], ["2025-02-05", "2025-02-06", "2025-02-07"])
+        self.assertEqual(part["by_domain"]["domain_lists"], ["a.example.com"])
+        self.assertEqual(self.store.zones(), ["zone-1", "zone-2"])
+        self.assertEqual(self.store.read("zone-3", "web_analytics")["by_date"]["dates"], [])
+
+    def test_rewrite_replaces_rows(self):
+        self.store.write("zone-1", "traffics", {"by_date": {"dates": [{"date": "2025-02-01", "domains": [{"name": "a", "metrics": {"page_views": 1, "custom": 3}}]}]}})
+        self.store.write("zone-1", "traffics", {"by_date": {"dates": [{"date": "2025-02-01", "domains": [{"name": "a", "metrics": {"page_views": 2, "custom": 4}}]}]}})
+        self.assertEqual(list(self.store.scan("zone-1", "traffics")), [("2025-02-01", "a", {"page_views": 2, "custom": 4})])
+
+    def test_collect_writes_to_store(self):
+        state = StateStore()
+        collected = self.zone.collect("traffics", state, store=self.store)
+        self.assertEqual(self.store.read("zone-1", "traffics"), collected)
+
+
+if __name__ == "__main__":
+    unittest.main()
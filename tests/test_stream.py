@@ -0,0 +1,48 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from cfmetrics import Auth, Config, Scheduler, query
+from tests.stub_server import StubServer, add_cloudflare_routes
+
+
+class TestStream(unittest.TestCase):
+
+    def setUp(self):
+        self.server = add_cloudflare_routes(StubServer()).start()
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url), scheduler=Scheduler(backoff=0.01))
+        self.zone = self.cf.Account("account-1").Zone("zone-1")
+        self.start = (datetime.utcnow() - timedelta(days=6)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.end = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def tearDown(self):
+        self.cf.close()
+        self.server.stop()
+
+    def test_stream_same_result(self):
+        self.assertEqual(self.zone.get_traffics(self.start, self.end, stream=True), self.zone.get_traffics(self.start, self.end))
+        self.assertEqual(self.zone.get_web_analytics(self.start, self.end, stream=True), self.zone.get_web_analytics(self.start, self.end))
+
+    def test_stream_truncated_answer(self):
+        expected = self.zone.get_traffics(self.start, self.end)
+        truncated = add_cloudflare_routes(StubServer(), row_limit=5).start()
+        try:
+            zone = Auth("key", "me@example.com", config=Config(truncated.url)).Account("account-1").Zone("zone-1")
+            with mock.patch.object(query, "ROW_LIMIT", 5):
+                self.assertEqual(zone.get_traffics(self.start, self.end, stream=True), expected)
+        finally:
+            truncated.stop()
+
+    def test_stream_data_null(self):
+        self.server.route("POST", r"/graphql", lambda url, params, body: (200, {"data": None, "errors": [{"message": "zone not found"}]}))
+        with self.assertRaises(ValueError) as context:
+            self.zone.get_web_analytics(self.start, self.end, stream=True)
+        self.assertIn("zone not found", str(context.exception))
+
+    def test_stream_error_status(self):
+        self.server.route("POST", r"/graphql", lambda url, params, body: (500, {"errors": [{"message": "oops"}]}))
+        with self.assertRaises(ConnectionError):
+            self.zone.get_web_analytics(self.start, self.end, stream=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from cfmetrics import Auth, Config, MemoryCache
+from tests.stub_server import StubServer
+
+
+class TestTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.server.route("GET", "/zones/zone-1", lambda url, params, body: (200, {"result": {"plan": {"name": "Business Website"}}}))
+        self.server.route("GET", "/zones/zone-1/dns_records", lambda url, params, body: (200, {"result": [
+            {"name": "a.example.com", "type": "A"}, {"name": "cname.example.com", "type": "CNAME"}, {"name": "example.com", "type": "TXT"}
+        ]}))
+        self.cf = Auth("key", "me@example.com", config=Config(self.server.url), pool_size=2, cache=MemoryCache(ttl=0))
+        self.zone = self.cf.Account("account-1").Zone("zone-1")
+
+    def tearDown(self):
+        self.cf.close()
+        self.server.stop()
+
+    def test_transport_is_shared(self):
+        account = self.cf.Account("account-1")
+        self.assertIs(account.transport, self.cf.transport)
+        self.assertIs(account.Zone("zone-2").transport, self.cf.transport)
+
+    def test_connection_is_reused(self):
+        for _ in range(5):
+            self.assertEqual(self.zone.get_domain_plan(), "Business Website")
+            self.assertEqual([r["name"] for r in self.zone.get_dns_records()], ["a.example.com", "cname.example.com"])
+
+        self.assertEqual(len(self.server.requests), 10)
+        self.assertEqual(len(self.server.client_ports), 1)
+        self.assertIn("gzip", self.server.requests[0]["headers"]["Accept-Encoding"])
+        self.assertEqual(self.server.requests[0]["headers"]["Authorization"], "Bearer key")
+
+    def test_pool_size_validation(self):
+        with self.assertRaises(ValueError):
+            Auth("key", "me@example.com", pool_size=0)
+
+
+if __name__ == "__main__":
+    unittest.main()